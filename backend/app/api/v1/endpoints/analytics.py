@@ -1,24 +1,31 @@
+import time
+from types import SimpleNamespace
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, text
 from datetime import datetime, timedelta
 from typing import Optional
-from app.database.session import get_db
+from app.core.config import settings
+from app.database.session import get_read_db, get_read_session
 from app.models.sale import Sale, SaleItem
 from app.models.product import Product
 from app.models.customer import Customer
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.sales_rollup import summarize_sales, summarize_product_sales
+from app.core.result_cache import cached_result
 from app.models.user import User
 
 router = APIRouter()
 
 
 @router.get("/sales-trends")
+@cached_result("analytics.sales_trends")
 def get_sales_trends(
     start_date: str,
     end_date: str,
     interval: str = "daily",
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Get sales trends over time"""
@@ -28,26 +35,16 @@ def get_sales_trends(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format")
 
-    # Get sales data
-    sales = (
-        db.query(
-            func.date(Sale.sale_date).label("date"),
-            func.sum(Sale.total_amount).label("revenue"),
-            func.count(Sale.id).label("transactions"),
-        )
-        .filter(Sale.sale_date >= start, Sale.sale_date <= end)
-        .group_by(func.date(Sale.sale_date))
-        .order_by(func.date(Sale.sale_date))
-        .all()
-    )
+    # Get sales data (whole days come from daily_sales_rollup)
+    days = summarize_sales(db, start, end, group_by=("day",))
 
     data = [
         {
-            "date": str(item.date),
-            "revenue": float(item.revenue or 0),
-            "transactions": item.transactions,
+            "date": str(day["day"]),
+            "revenue": float(day["total_amount"]),
+            "transactions": day["sale_count"],
         }
-        for item in sales
+        for day in days
     ]
 
     # Calculate comparison with previous period
@@ -57,11 +54,9 @@ def get_sales_trends(
 
     current_total = sum(item["revenue"] for item in data)
     
-    prev_sales = (
-        db.query(func.sum(Sale.total_amount))
-        .filter(Sale.sale_date >= prev_start, Sale.sale_date < prev_end)
-        .scalar()
-    ) or 0
+    prev_sales = sum(
+        group["total_amount"] for group in summarize_sales(db, prev_start, prev_end, include_end=False)
+    )
 
     growth = 0
     if prev_sales > 0:
@@ -79,10 +74,11 @@ def get_sales_trends(
 
 
 @router.get("/profit-analysis")
+@cached_result("analytics.profit_analysis")
 def get_profit_analysis(
     start_date: str,
     end_date: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Get profit analysis"""
@@ -92,22 +88,19 @@ def get_profit_analysis(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format")
 
-    # Get sales with product details
-    sales_items = (
-        db.query(
-            SaleItem.product_id,
-            Product.name.label("product_name"),
-            Product.category,
-            func.sum(SaleItem.quantity).label("quantity"),
-            func.sum(SaleItem.line_total).label("revenue"),
-            func.sum(SaleItem.quantity * Product.cost_price).label("cost"),
-        )
-        .join(Sale, SaleItem.sale_id == Sale.id)
-        .join(Product, SaleItem.product_id == Product.id)
-        .filter(Sale.sale_date >= start, Sale.sale_date <= end)
-        .group_by(SaleItem.product_id, Product.name, Product.category)
-        .all()
-    )
+    # Cost comes from the unit_cost snapshot on each sale item, so this
+    # reads sale rows (and daily_product_sales for whole days) only
+    totals = summarize_product_sales(db, start, end)
+    products = {
+        row.id: row
+        for row in db.query(Product.id, Product.name, Product.category)
+        .filter(Product.id.in_([item["product_id"] for item in totals]))
+    }
+    sales_items = [
+        SimpleNamespace(product_name=products[item["product_id"]].name, category=products[item["product_id"]].category, **item)
+        for item in totals
+        if item["product_id"] in products
+    ]
 
     # Calculate totals
     total_revenue = sum(float(item.revenue or 0) for item in sales_items)
@@ -163,11 +156,12 @@ def get_profit_analysis(
 
 
 @router.get("/top-products")
+@cached_result("analytics.top_products")
 def get_top_products(
     start_date: str,
     end_date: str,
     limit: int = 10,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Get top selling products"""
@@ -208,10 +202,11 @@ def get_top_products(
 
 
 @router.get("/customer-insights")
+@cached_result("analytics.customer_insights")
 def get_customer_insights(
     start_date: str,
     end_date: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Get customer insights"""
@@ -279,10 +274,11 @@ def get_customer_insights(
 
 
 @router.get("/revenue-by-category")
+@cached_result("analytics.revenue_by_category")
 def get_revenue_by_category(
     start_date: str,
     end_date: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Get revenue breakdown by category"""
@@ -316,18 +312,95 @@ def get_revenue_by_category(
     ]
 
 
+# Dashboard sections, run concurrently on their own sessions
+DASHBOARD_SECTIONS = {
+    "sales_trends": lambda start_date, end_date, db, user: get_sales_trends(start_date, end_date, "daily", db, user),
+    "profit_analysis": lambda start_date, end_date, db, user: get_profit_analysis(start_date, end_date, db, user),
+    "top_products": lambda start_date, end_date, db, user: get_top_products(start_date, end_date, 10, db, user),
+    "customer_insights": lambda start_date, end_date, db, user: get_customer_insights(start_date, end_date, db, user),
+    "revenue_by_category": lambda start_date, end_date, db, user: get_revenue_by_category(start_date, end_date, db, user),
+}
+
+_dashboard_executor = ThreadPoolExecutor(
+    max_workers=settings.DASHBOARD_WORKERS, thread_name_prefix="dashboard"
+)
+
+
+def run_dashboard_section(name: str, start_date: str, end_date: str, current_user: User, clock: dict):
+    """
+    Run one dashboard section on its own read session (and pooled connection).
+    Records when it started and finished in clock[name] as [started, finished].
+    """
+    clock[name] = [time.perf_counter(), None]
+    db = get_read_session()
+    try:
+        if db.bind.dialect.name == "postgresql":
+            # Let the database abandon the query too, not just the dashboard
+            timeout_ms = int(settings.DASHBOARD_SECTION_TIMEOUT_SECONDS * 1000)
+            db.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+        return DASHBOARD_SECTIONS[name](start_date, end_date, db, current_user)
+    finally:
+        db.close()
+        clock[name][1] = time.perf_counter()
+
+
 @router.get("/dashboard")
 def get_analytics_dashboard(
     start_date: str,
     end_date: str,
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Get comprehensive analytics dashboard data"""
-    return {
-        "sales_trends": get_sales_trends(start_date, end_date, "daily", db, current_user),
-        "profit_analysis": get_profit_analysis(start_date, end_date, db, current_user),
-        "top_products": get_top_products(start_date, end_date, 10, db, current_user),
-        "customer_insights": get_customer_insights(start_date, end_date, db, current_user),
-        "revenue_by_category": get_revenue_by_category(start_date, end_date, db, current_user),
+    """
+    Get comprehensive analytics dashboard data.
+    Sections run in parallel; a section that fails or runs longer than
+    DASHBOARD_SECTION_TIMEOUT_SECONDS (counted from when it starts, not
+    while it waits for a worker) is returned as null with its error. A
+    section still waiting for a worker after twice that is not run.
+    """
+    try:
+        datetime.fromisoformat(start_date)
+        datetime.fromisoformat(end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+    timeout = settings.DASHBOARD_SECTION_TIMEOUT_SECONDS
+    requested = time.perf_counter()
+    clock = {}
+    futures = {
+        _dashboard_executor.submit(run_dashboard_section, name, start_date, end_date, current_user, clock): name
+        for name in DASHBOARD_SECTIONS
     }
+
+    dashboard = {name: None for name in DASHBOARD_SECTIONS}
+    errors = {}
+    timings = {}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = futures[future]
+            started, finished = clock[name]
+            timings[name] = (finished - started) * 1000
+            try:
+                dashboard[name] = future.result()
+            except HTTPException as e:
+                errors[name] = e.detail
+            except Exception as e:
+                errors[name] = str(e) or e.__class__.__name__
+
+        now = time.perf_counter()
+        for future in list(pending):
+            name = futures[future]
+            if name in clock and now - clock[name][0] >= timeout:
+                errors[name] = "Timed out"
+                timings[name] = (now - clock[name][0]) * 1000
+            elif name not in clock and now - requested >= 2 * timeout and future.cancel():
+                errors[name] = "Not started: dashboard workers busy"
+                timings[name] = 0.0
+            else:
+                continue
+            pending.discard(future)
+
+    dashboard["timings_ms"] = {name: round(timings[name], 1) for name in DASHBOARD_SECTIONS}
+    dashboard["errors"] = errors
+    return dashboard
@@ -1,51 +1,156 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from datetime import timedelta
-from app.database.session import get_db
-from app.core.security import verify_password, create_access_token, decode_access_token
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from app.database.session import get_async_db
+from app.core.security import (
+    verify_password_async,
+    create_access_token,
+    decode_access_token,
+    create_refresh_token,
+    hash_refresh_token,
+)
 from app.core.config import settings
-from app.models.user import User
-from app.schemas.user import Token, LoginRequest, User as UserSchema
+from app.core.principal_cache import get_cached_principal, cache_principal
+from app.core.throttle import FailureThrottle
+from app.models.user import User, UserRole
+from app.models.user_session import UserSession
+from app.schemas.user import Token, LoginRequest, RefreshRequest, User as UserSchema
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
+# Failed logins per username and per client IP; checked before any bcrypt work
+user_login_throttle = FailureThrottle(settings.LOGIN_MAX_FAILURES_PER_USER, settings.LOGIN_THROTTLE_WINDOW_SECONDS)
+ip_login_throttle = FailureThrottle(settings.LOGIN_MAX_FAILURES_PER_IP, settings.LOGIN_THROTTLE_WINDOW_SECONDS)
+
+
+def issue_tokens(user: User, refresh_token: str) -> dict:
+    """Build the token response for a user and their (new) refresh token."""
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.username, "uid": user.id, "role": user.role.value},
+        expires_delta=access_token_expires
+    )
+    
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": int(access_token_expires.total_seconds()),
+    }
+
 @router.post("/login", response_model=Token)
 async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Login endpoint - returns JWT access token
+    Login endpoint - returns JWT access token and a refresh token
     """
-    user = db.query(User).filter(User.username == form_data.username).first()
+    client_ip = request.client.host if request.client else "unknown"
+    
+    retry_after = user_login_throttle.retry_after(form_data.username) or ip_login_throttle.retry_after(client_ip)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+    
+    user = await db.scalar(select(User).where(User.username == form_data.username))
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
+        user_login_throttle.record_failure(form_data.username)
+        ip_login_throttle.record_failure(client_ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    user_login_throttle.reset(form_data.username)
+    
     if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User account is inactive"
         )
     
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username, "role": user.role.value},
-        expires_delta=access_token_expires
+    refresh_token = create_refresh_token()
+    db.add(UserSession(
+        user_id=user.id,
+        refresh_token_hash=hash_refresh_token(refresh_token),
+        ip_address=client_ip,
+        user_agent=(request.headers.get("user-agent") or "")[:255] or None,
+        expires_at=datetime.utcnow() + timedelta(hours=settings.REFRESH_TOKEN_EXPIRE_HOURS),
+    ))
+    await db.commit()
+    
+    return issue_tokens(user, refresh_token)
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(
+    refresh_data: RefreshRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Exchange a refresh token for a new access token (no password check).
+    The refresh token is rotated; the old one stops working.
+    """
+    session = await db.scalar(
+        select(UserSession)
+        .options(joinedload(UserSession.user))
+        .where(UserSession.refresh_token_hash == hash_refresh_token(refresh_data.refresh_token))
+        .with_for_update(of=UserSession)
+    )
+    
+    now = datetime.utcnow()
+    if (
+        session is None
+        or session.revoked_at is not None
+        or session.expires_at <= now
+        or not session.user.is_active
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    refresh_token = create_refresh_token()
+    session.refresh_token_hash = hash_refresh_token(refresh_token)
+    session.last_used_at = now
+    await db.commit()
+    
+    return issue_tokens(session.user, refresh_token)
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    refresh_data: RefreshRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Revoke a refresh token
+    """
+    session = await db.scalar(
+        select(UserSession).where(UserSession.refresh_token_hash == hash_refresh_token(refresh_data.refresh_token))
     )
+    if session is not None and session.revoked_at is None:
+        session.revoked_at = datetime.utcnow()
+        await db.commit()
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return None
 
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """
     Dependency to get the current authenticated user
@@ -64,16 +169,31 @@ async def get_current_user(
     if username is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    if settings.AUTH_TRUST_TOKEN_CLAIMS and "uid" in payload and "role" in payload:
+        return User(id=payload["uid"], username=username, role=UserRole(payload["role"]), is_active=True)
+    
+    user = get_cached_principal(username)
+    if user is not None:
+        return user
+    
+    user = await db.scalar(select(User).where(User.username == username))
     if user is None:
         raise credentials_exception
     
+    cache_principal(user)
     return user
 
 
 @router.get("/me", response_model=UserSchema)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Get current logged-in user information
     """
-    return current_user
+    # The principal may be built from token claims only, so read the full row
+    user = await db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user
@@ -1,11 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from typing import List, Optional
 from app.database.session import get_db
 from app.models.backup import Backup
 from app.models.user import User
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.pagination import paginate, keyset_page
 from pydantic import BaseModel
 from datetime import datetime
 import subprocess
@@ -112,8 +112,10 @@ async def create_database_backup(backup_id: int, description: str, user_id: int,
 
 @router.get("/", response_model=List[BackupResponse])
 def get_backups(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -121,7 +123,11 @@ def get_backups(
     if current_user.role.upper() != "ADMIN":
         raise HTTPException(status_code=403, detail="Only admins can view backups")
     
-    backups = db.query(Backup).order_by(desc(Backup.created_at)).offset(skip).limit(limit).all()
+    columns = (Backup.created_at, Backup.id)
+    rows = paginate(db.query(Backup), columns, cursor, skip, limit, descending=True).all()
+    backups, next_cursor = keyset_page(rows, columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return backups
 
 @router.post("/", response_model=BackupResponse)
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, date
-from app.database.session import get_db
+from app.database.session import get_async_db, get_async_read_db
 from app.models.customer import Customer
 from app.models.user import User
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.pagination import paginate, keyset_page
 
 router = APIRouter()
 
@@ -44,23 +47,31 @@ class CustomerSchema(CustomerBase):
 
 @router.get("/", response_model=List[CustomerSchema])
 async def get_customers(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all customers"""
-    customers = db.query(Customer).offset(skip).limit(limit).all()
+    """Get all customers (next page: X-Next-Cursor response header as `cursor`)"""
+    columns = (Customer.id,)
+    rows = (await db.scalars(
+        paginate(select(Customer).options(selectinload(Customer.sales)), columns, cursor, skip, limit)
+    )).all()
+    customers, next_cursor = keyset_page(rows, columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return customers
 
 @router.post("/", response_model=CustomerSchema, status_code=status.HTTP_201_CREATED)
 async def create_customer(
     customer_data: CustomerCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new customer"""
-    existing = db.query(Customer).filter(Customer.phone == customer_data.phone).first()
+    existing = await db.scalar(select(Customer).where(Customer.phone == customer_data.phone))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -69,20 +80,20 @@ async def create_customer(
     
     customer = Customer(**customer_data.dict())
     db.add(customer)
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer, ["sales"])
     return customer
 
 @router.get("/{customer_id}", response_model=CustomerSchema)
 async def get_customer(
     customer_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get customer by ID with sales history"""
-    customer = db.query(Customer).options(
-        joinedload(Customer.sales)
-    ).filter(Customer.id == customer_id).first()
+    customer = await db.scalar(
+        select(Customer).options(selectinload(Customer.sales)).where(Customer.id == customer_id)
+    )
     if not customer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -94,11 +105,13 @@ async def get_customer(
 async def update_customer(
     customer_id: int,
     customer_data: CustomerCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update customer information"""
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+    customer = await db.scalar(
+        select(Customer).options(selectinload(Customer.sales)).where(Customer.id == customer_id)
+    )
     if not customer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -107,10 +120,10 @@ async def update_customer(
     
     # Check if phone number is being changed to one that already exists
     if customer_data.phone != customer.phone:
-        existing = db.query(Customer).filter(
+        existing = await db.scalar(select(Customer).where(
             Customer.phone == customer_data.phone,
             Customer.id != customer_id
-        ).first()
+        ))
         if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -121,24 +134,24 @@ async def update_customer(
     for key, value in customer_data.dict().items():
         setattr(customer, key, value)
     
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer)
     return customer
 
 @router.delete("/{customer_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_customer(
     customer_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Delete a customer"""
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Customer not found"
         )
     
-    db.delete(customer)
-    db.commit()
+    await db.delete(customer)
+    await db.commit()
     return None
@@ -1,14 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, or_
+from fastapi import APIRouter, Depends, HTTPException, Query, Header
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from datetime import datetime, timedelta
 
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.product import Product
 from app.models.stock_adjustment import StockAdjustment
+from app.models.stock_take import StockTake
+from app.models.store import Store
 from app.models.user import User
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.idempotency import (
+    claim_key, complete_key, request_fingerprint, IdempotencyKeyReusedError, IdempotencyKeyInProgressError
+)
+from app.core.product_cache import invalidate_products
+from app.core.counters import get_counters, INVENTORY_SUMMARY
+from app.core.search import SearchMode, apply_product_search, search_sort_key
+from app.core.pagination import paginate, keyset_page, count_rows, TotalCount
+from app.core.stock import apply_stock_changes, allocated_stock, InsufficientStockError, StoreStockError
+from app.core.result_cache import mark_data_changed
+from app.core.stock_take import record_counts, close_stock_take, variance_summary
+from app.core.stock_ledger import record_movements, movements_for, stock_as_of, NoStockHistoryError, ADJUSTMENT, RETURN
+from app.schemas.stock_take import StockTakeCreate, StockTakeCounts, StockTakeClose
 
 router = APIRouter()
 
@@ -17,13 +33,20 @@ router = APIRouter()
 def get_inventory(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    count: TotalCount = TotalCount.EXACT,
     category: Optional[str] = None,
     search: Optional[str] = None,
+    search_mode: SearchMode = SearchMode.CONTAINS,
     low_stock_only: bool = False,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Get inventory list with stock levels"""
+    """
+    Get inventory list with stock levels
+    Pass next_cursor back as `cursor` for the next page; count=estimated
+    reports the planner's row estimate instead of counting every match.
+    """
     
     query = db.query(Product).filter(Product.is_active == 1)
     
@@ -32,20 +55,23 @@ def get_inventory(
         query = query.filter(Product.category == category)
     
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                Product.name.ilike(search_term),
-                Product.barcode.ilike(search_term),
-                Product.description.ilike(search_term),
-            )
+        query = apply_product_search(
+            query,
+            search,
+            search_mode,
+            db.bind.dialect.name,
+            fields=(Product.name, Product.barcode, Product.description),
         )
     
     if low_stock_only:
         query = query.filter(Product.current_stock <= Product.minimum_stock)
     
-    total = query.count()
-    products = query.offset(skip).limit(limit).all()
+    total = count_rows(db, query, count)
+    columns = search_sort_key(search, search_mode, db.bind.dialect.name)
+    if columns is None:
+        products, next_cursor = query.offset(skip).limit(limit).all(), None
+    else:
+        products, next_cursor = keyset_page(paginate(query, columns, cursor, skip, limit).all(), columns, limit)
     
     # Calculate stock status for each product
     inventory_items = []
@@ -71,13 +97,14 @@ def get_inventory(
     
     return {
         "total": total,
+        "next_cursor": next_cursor,
         "items": inventory_items,
     }
 
 
 @router.get("/low-stock-alerts")
 def get_low_stock_alerts(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Get products with low or zero stock"""
@@ -119,43 +146,19 @@ def get_inventory_summary(
     current_user: User = Depends(get_current_user),
 ):
     """Get overall inventory statistics"""
-    
-    total_products = db.query(Product).filter(Product.is_active == 1).count()
-    
-    low_stock_count = (
-        db.query(Product)
-        .filter(Product.is_active == 1)
-        .filter(Product.current_stock <= Product.minimum_stock)
-        .filter(Product.current_stock > 0)
-        .count()
-    )
-    
-    out_of_stock_count = (
-        db.query(Product)
-        .filter(Product.is_active == 1)
-        .filter(Product.current_stock == 0)
-        .count()
-    )
-    
-    # Calculate total inventory value
-    inventory_value = (
-        db.query(func.sum(Product.current_stock * Product.cost_price))
-        .filter(Product.is_active == 1)
-        .scalar()
-    ) or 0
-    
-    # Get total stock units
-    total_units = (
-        db.query(func.sum(Product.current_stock))
-        .filter(Product.is_active == 1)
-        .scalar()
-    ) or 0
-    
-    # Get categories with stock counts
+    return get_counters(INVENTORY_SUMMARY, lambda: inventory_summary(db))
+
+
+def inventory_summary(db: Session) -> dict:
+    """Inventory totals and per-category stock in one pass over active products"""
     categories = (
         db.query(
             Product.category,
-            func.count(Product.id).label("product_count"),
+            func.count().label("product_count"),
+            func.count().filter(Product.current_stock <= Product.minimum_stock, Product.current_stock > 0)
+            .label("low_stock_count"),
+            func.count().filter(Product.current_stock == 0).label("out_of_stock_count"),
+            func.sum(Product.current_stock * Product.cost_price).label("inventory_value"),
             func.sum(Product.current_stock).label("total_stock"),
         )
         .filter(Product.is_active == 1)
@@ -164,11 +167,11 @@ def get_inventory_summary(
     )
     
     return {
-        "total_products": total_products,
-        "low_stock_count": low_stock_count,
-        "out_of_stock_count": out_of_stock_count,
-        "total_inventory_value": round(inventory_value, 2),
-        "total_units": total_units,
+        "total_products": sum(cat.product_count for cat in categories),
+        "low_stock_count": sum(cat.low_stock_count for cat in categories),
+        "out_of_stock_count": sum(cat.out_of_stock_count for cat in categories),
+        "total_inventory_value": round(sum(cat.inventory_value or 0 for cat in categories), 2),
+        "total_units": sum(cat.total_stock or 0 for cat in categories),
         "categories": [
             {
                 "category": cat.category,
@@ -186,10 +189,34 @@ def adjust_stock(
     adjustment_type: str,
     quantity_change: int,
     reason: Optional[str] = None,
+    store_id: Optional[int] = None,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Manually adjust stock levels"""
+    """Manually adjust stock levels, optionally at one store"""
+    
+    # Replay the stored response if this request was already processed
+    idempotency_record = None
+    if idempotency_key:
+        try:
+            request_hash = request_fingerprint({
+                "product_id": product_id,
+                "adjustment_type": adjustment_type,
+                "quantity_change": quantity_change,
+                "reason": reason,
+                **({"store_id": store_id} if store_id is not None else {}),
+            })
+            idempotency_record = claim_key(db, idempotency_key, "adjust_stock", current_user.id, request_hash)
+        except IdempotencyKeyReusedError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except IdempotencyKeyInProgressError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if idempotency_record.response_status is not None:
+            return JSONResponse(
+                status_code=idempotency_record.response_status,
+                content=idempotency_record.response_body
+            )
     
     # Validate adjustment type
     valid_types = ["RESTOCK", "DAMAGE", "CORRECTION", "RETURN", "LOSS", "TRANSFER"]
@@ -203,16 +230,24 @@ def adjust_stock(
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    # Calculate new stock
-    previous_stock = product.current_stock
-    new_stock = previous_stock + quantity_change
-    
-    if new_stock < 0:
+    if store_id is not None and not db.get(Store, store_id):
+        raise HTTPException(status_code=404, detail="Store not found")
+    
+    # Apply the change atomically; the database rejects it if stock would go negative
+    try:
+        new_stock = apply_stock_changes(db, {product_id: quantity_change}, store_id)[product_id]
+    except InsufficientStockError:
+        db.rollback()
+        # Without a store, units held at stores are not available
+        held = allocated_stock(db, [product_id]).get(product_id, 0) if store_id is None else 0
         raise HTTPException(
             status_code=400,
-            detail=f"Insufficient stock. Current: {previous_stock}, Requested change: {quantity_change}",
+            detail=f"Insufficient stock{' at this store' if store_id is not None else ''}. "
+                   f"Current: {product.current_stock}{f' ({held} held at stores)' if held else ''}, "
+                   f"Requested change: {quantity_change}",
         )
+    previous_stock = new_stock - quantity_change
+    mark_data_changed(db)
     
     # Calculate cost impact
     cost_impact = quantity_change * product.cost_price
@@ -230,22 +265,29 @@ def adjust_stock(
         cost_impact=cost_impact,
     )
     
-    # Update product stock
-    product.current_stock = new_stock
-    
     db.add(adjustment)
-    db.commit()
-    db.refresh(product)
-    db.refresh(adjustment)
+    db.flush()
+    record_movements(db, movements_for(
+        {product_id: quantity_change}, RETURN if adjustment_type == "RETURN" else ADJUSTMENT,
+        reference_type="STOCK_ADJUSTMENT", reference_id=adjustment.id, user_id=current_user.id, store_id=store_id,
+    ))
     
-    return {
+    response = {
         "message": "Stock adjusted successfully",
         "product_id": product_id,
         "product_name": product.name,
         "previous_stock": previous_stock,
         "new_stock": new_stock,
+        "store_id": store_id,
         "adjustment_id": adjustment.id,
     }
+    
+    if idempotency_record:
+        complete_key(idempotency_record, 200, response)
+    
+    db.commit()
+    
+    return response
 
 
 @router.put("/reorder-point/{product_id}")
@@ -266,6 +308,8 @@ def update_reorder_point(
     
     old_minimum = product.minimum_stock
     product.minimum_stock = minimum_stock
+    invalidate_products(db, [product_id])
+    mark_data_changed(db)
     
     db.commit()
     db.refresh(product)
@@ -283,16 +327,23 @@ def update_reorder_point(
 def get_stock_adjustments(
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    count: TotalCount = TotalCount.EXACT,
     product_id: Optional[int] = None,
     adjustment_type: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Get stock adjustment history"""
+    """Get stock adjustment history, newest first (next page: next_cursor as `cursor`)"""
     
-    query = db.query(StockAdjustment).join(Product).join(User)
+    query = (
+        db.query(StockAdjustment)
+        .join(StockAdjustment.product)
+        .join(StockAdjustment.user)
+        .options(contains_eager(StockAdjustment.product), contains_eager(StockAdjustment.user))
+    )
     
     # Filters
     if product_id:
@@ -315,11 +366,15 @@ def get_stock_adjustments(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid end_date format")
     
-    total = query.count()
-    adjustments = query.order_by(desc(StockAdjustment.created_at)).offset(skip).limit(limit).all()
+    total = count_rows(db, query, count)
+    columns = (StockAdjustment.created_at, StockAdjustment.id)
+    adjustments, next_cursor = keyset_page(
+        paginate(query, columns, cursor, skip, limit, descending=True).all(), columns, limit
+    )
     
     return {
         "total": total,
+        "next_cursor": next_cursor,
         "adjustments": [
             {
                 "id": adj.id,
@@ -342,7 +397,7 @@ def get_stock_adjustments(
 
 @router.get("/categories")
 def get_categories(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Get all product categories"""
@@ -356,3 +411,181 @@ def get_categories(
     )
     
     return {"categories": [cat[0] for cat in categories]}
+
+
+@router.get("/stock-as-of")
+def get_stock_as_of(
+    date: str,
+    product_id: Optional[int] = None,
+    category: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Stock on hand at a point in time (UTC), from the nearest earlier stock
+    snapshot plus the ledger since. A plain date means the end of that day.
+    """
+    
+    try:
+        at = datetime.fromisoformat(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    if len(date) == 10:
+        at += timedelta(days=1)
+    
+    try:
+        return stock_as_of(db, at, product_id=product_id, category=category)
+    except NoStockHistoryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def stock_take_dict(stock_take: StockTake) -> dict:
+    return {
+        "id": stock_take.id,
+        "status": stock_take.status,
+        "notes": stock_take.notes,
+        "created_by": stock_take.created_by,
+        "created_at": stock_take.created_at,
+        "closed_by": stock_take.closed_by,
+        "closed_at": stock_take.closed_at,
+    }
+
+
+def get_open_stock_take(db: Session, stock_take_id: int) -> StockTake:
+    stock_take = db.get(StockTake, stock_take_id, with_for_update=True)
+    if not stock_take:
+        raise HTTPException(status_code=404, detail="Stock take not found")
+    if stock_take.status != "open":
+        raise HTTPException(status_code=409, detail=f"Stock take is {stock_take.status}")
+    return stock_take
+
+
+@router.post("/stock-takes", status_code=201)
+def create_stock_take(
+    stock_take_in: StockTakeCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Open a stock take session; scanners then post counts to it"""
+    
+    open_take = db.query(StockTake.id).filter(StockTake.status == "open").first()
+    if open_take:
+        raise HTTPException(status_code=409, detail=f"Stock take #{open_take.id} is still open")
+    
+    stock_take = StockTake(notes=stock_take_in.notes, created_by=current_user.id)
+    db.add(stock_take)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another stock take was opened since the check above
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Another stock take is already open")
+    db.refresh(stock_take)
+    
+    return stock_take_dict(stock_take)
+
+
+@router.get("/stock-takes/{stock_take_id}")
+def get_stock_take(
+    stock_take_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Get a stock take with its variance summary (live while open)"""
+    
+    stock_take = db.get(StockTake, stock_take_id)
+    if not stock_take:
+        raise HTTPException(status_code=404, detail="Stock take not found")
+    
+    return {
+        **stock_take_dict(stock_take),
+        **variance_summary(db, stock_take_id, applied=stock_take.status == "closed"),
+    }
+
+
+@router.post("/stock-takes/{stock_take_id}/counts")
+def add_stock_take_counts(
+    stock_take_id: int,
+    counts_in: StockTakeCounts,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Record a batch of counted quantities, by product id or barcode"""
+    
+    get_open_stock_take(db, stock_take_id)
+    
+    # Resolve all product ids and barcodes in one query
+    product_ids = {count.product_id for count in counts_in.counts if count.product_id is not None}
+    barcodes = {count.barcode for count in counts_in.counts if count.product_id is None and count.barcode}
+    known = db.query(Product.id, Product.barcode).filter(
+        or_(Product.id.in_(product_ids), Product.barcode.in_(barcodes))
+    ).all()
+    known_ids = {row.id for row in known}
+    ids_by_barcode = {row.barcode: row.id for row in known}
+    
+    quantities = {}
+    unknown = []
+    for count in counts_in.counts:
+        product_id = count.product_id if count.product_id is not None else ids_by_barcode.get(count.barcode)
+        if product_id not in known_ids:
+            unknown.append(count.product_id if count.product_id is not None else count.barcode)
+            continue
+        if counts_in.mode == "add":
+            quantities[product_id] = quantities.get(product_id, 0) + count.quantity
+        else:
+            quantities[product_id] = count.quantity
+    
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown product(s): {', '.join(map(str, unknown))}")
+    
+    record_counts(db, stock_take_id, quantities, counts_in.mode, current_user.id)
+    db.commit()
+    
+    return {"stock_take_id": stock_take_id, "recorded": len(quantities)}
+
+
+@router.post("/stock-takes/{stock_take_id}/close")
+def close_stock_take_session(
+    stock_take_id: int,
+    close_in: StockTakeClose,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Apply the counts: variances against current stock are written as
+    stock adjustments and stock is set to the counted quantities, all in
+    one transaction. Returns the variance summary.
+    """
+    
+    stock_take = get_open_stock_take(db, stock_take_id)
+    try:
+        close_stock_take(db, stock_take, current_user.id, zero_uncounted=close_in.zero_uncounted)
+    except StoreStockError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"{e}; adjust the stock at those stores instead")
+    mark_data_changed(db)
+    
+    summary = variance_summary(db, stock_take_id, applied=True)
+    stock_take.counted_products = summary["counted_products"]
+    stock_take.adjusted_products = summary["adjusted_products"]
+    stock_take.units_variance = summary["units_variance"]
+    stock_take.value_variance = summary["value_variance"]
+    db.commit()
+    
+    return {**stock_take_dict(stock_take), **summary}
+
+
+@router.post("/stock-takes/{stock_take_id}/cancel")
+def cancel_stock_take(
+    stock_take_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Cancel an open stock take without touching stock"""
+    
+    stock_take = get_open_stock_take(db, stock_take_id)
+    stock_take.status = "cancelled"
+    stock_take.closed_by = current_user.id
+    stock_take.closed_at = datetime.utcnow()
+    db.commit()
+    
+    return stock_take_dict(stock_take)
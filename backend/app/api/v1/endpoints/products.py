@@ -1,63 +1,82 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.database.session import get_db
+from app.database.session import get_async_db, get_async_read_db
 from app.models.product import Product
 from app.models.user import User
 from app.schemas.product import Product as ProductSchema, ProductCreate, ProductUpdate
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.product_cache import barcode_cache, get_cached_product, cache_product, cache_generation, invalidate_products
+from app.core.search import SearchMode, apply_product_search, search_sort_key
+from app.core.pagination import paginate, keyset_page
+from app.core.result_cache import mark_data_changed
+from app.core.stock import allocated_stock
+from app.core.stock_ledger import record_movements, movements_for, OPENING, ADJUSTMENT
 
 router = APIRouter()
 
 @router.get("/", response_model=List[ProductSchema])
 async def get_products(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
+    search_mode: SearchMode = SearchMode.CONTAINS,
     category: Optional[str] = None,
     active_only: bool = True,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get all products with optional filtering
+    Pass the X-Next-Cursor response header back as `cursor` for the next page
+    (fuzzy search results are ranked and paged with `skip` only).
     """
-    query = db.query(Product)
+    query = select(Product)
     
     if active_only:
-        query = query.filter(Product.is_active == 1)
+        query = query.where(Product.is_active == 1)
     
     if category:
-        query = query.filter(Product.category == category)
+        query = query.where(Product.category == category)
     
     if search:
-        query = query.filter(
-            or_(
-                Product.name.ilike(f"%{search}%"),
-                Product.barcode.ilike(f"%{search}%")
-            )
-        )
+        query = apply_product_search(query, search, search_mode, db.bind.dialect.name)
     
-    products = query.offset(skip).limit(limit).all()
+    columns = search_sort_key(search, search_mode, db.bind.dialect.name)
+    if columns is None:
+        return (await db.scalars(query.offset(skip).limit(limit))).all()
+    
+    rows = (await db.scalars(paginate(query, columns, cursor, skip, limit))).all()
+    products, next_cursor = keyset_page(rows, columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return products
 
 
 @router.get("/barcode/{barcode}", response_model=ProductSchema)
 async def get_product_by_barcode(
     barcode: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get product by barcode (for POS scanning)
+    Served from the in-process barcode cache when possible
     """
-    product = db.query(Product).filter(Product.barcode == barcode).first()
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Product with barcode {barcode} not found"
-        )
+    product = get_cached_product(barcode)
+    if product is None:
+        generation = cache_generation()
+        db_product = await db.scalar(select(Product).where(Product.barcode == barcode))
+        if not db_product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product with barcode {barcode} not found"
+            )
+        product = ProductSchema.model_validate(db_product)
+        cache_product(product, generation)
     
     if product.is_active == 0:
         raise HTTPException(
@@ -68,32 +87,44 @@ async def get_product_by_barcode(
     return product
 
 
+@router.get("/barcode-cache/stats")
+async def get_barcode_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get hit/miss counters for the barcode lookup cache
+    """
+    return barcode_cache.stats()
+
+
 @router.get("/low-stock", response_model=List[ProductSchema])
 async def get_low_stock_products(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get products with stock below minimum threshold
     """
-    products = db.query(Product).filter(
-        Product.current_stock <= Product.minimum_stock,
-        Product.is_active == 1
-    ).all()
+    products = (await db.scalars(
+        select(Product).where(
+            Product.current_stock <= Product.minimum_stock,
+            Product.is_active == 1
+        )
+    )).all()
     return products
 
 
 @router.post("/", response_model=ProductSchema, status_code=status.HTTP_201_CREATED)
 async def create_product(
     product_data: ProductCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Create a new product
     """
     # Check if barcode already exists
-    existing = db.query(Product).filter(Product.barcode == product_data.barcode).first()
+    existing = await db.scalar(select(Product).where(Product.barcode == product_data.barcode))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -102,21 +133,27 @@ async def create_product(
     
     product = Product(**product_data.dict())
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    await db.flush()
+    await db.run_sync(record_movements, movements_for(
+        {product.id: product.current_stock}, OPENING, reference_type="PRODUCT", reference_id=product.id, user_id=current_user.id
+    ))
+    invalidate_products(db.sync_session, [product.id])
+    mark_data_changed(db.sync_session)
+    await db.commit()
+    await db.refresh(product)
     return product
 
 
 @router.get("/{product_id}", response_model=ProductSchema)
 async def get_product(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get product by ID
     """
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -129,13 +166,13 @@ async def get_product(
 async def update_product(
     product_id: int,
     product_data: ProductUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Update product
     """
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -143,24 +180,40 @@ async def update_product(
         )
     
     update_data = product_data.dict(exclude_unset=True)
+    if update_data.get("current_stock") is not None:
+        # Lock the row so the ledger records the exact change
+        await db.refresh(product, with_for_update=True)
+        # The edit sets the total; it cannot drop below what the stores hold
+        held = (await db.run_sync(allocated_stock, [product.id])).get(product.id, 0)
+        if update_data["current_stock"] < held:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Stores hold {held} units of this product; adjust the stock at those stores instead"
+            )
+        await db.run_sync(record_movements, movements_for(
+            {product.id: update_data["current_stock"] - product.current_stock},
+            ADJUSTMENT, reference_type="PRODUCT", reference_id=product.id, user_id=current_user.id
+        ))
     for field, value in update_data.items():
         setattr(product, field, value)
     
-    db.commit()
-    db.refresh(product)
+    invalidate_products(db.sync_session, [product.id])
+    mark_data_changed(db.sync_session, closed=True)
+    await db.commit()
+    await db.refresh(product)
     return product
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_product(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Soft delete product (mark as inactive)
     """
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -168,5 +221,7 @@ async def delete_product(
         )
     
     product.is_active = 0
-    db.commit()
+    invalidate_products(db.sync_session, [product.id])
+    mark_data_changed(db.sync_session, closed=True)
+    await db.commit()
     return None
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-from app.database.session import get_db
+from app.database.session import get_async_db, get_async_read_db
 from app.models.purchase import Purchase, PurchaseItem
 from app.models.product import Product
 from app.models.supplier import Supplier
+from app.models.store import Store
 from app.models.user import User
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.idempotency import (
+    claim_key, complete_key, request_fingerprint, IdempotencyKeyReusedError, IdempotencyKeyInProgressError
+)
+from app.core.numbering import next_number, PURCHASE_ORDER_PREFIX
+from app.core.stock import increment_stock
+from app.core.stock_ledger import record_movements, movements_for, PURCHASE
+from app.core.result_cache import mark_data_changed
+from app.core.pagination import paginate, keyset_page
 
 router = APIRouter()
 
@@ -23,6 +35,7 @@ class PurchaseCreate(BaseModel):
     items: List[PurchaseItemCreate]
     payment_status: str = "pending"
     notes: Optional[str] = None
+    store_id: Optional[int] = None  # Store receiving the goods
 
 class PurchaseItemSchema(BaseModel):
     id: int
@@ -45,6 +58,7 @@ class PurchaseSchema(BaseModel):
     id: int
     purchase_order_number: str
     supplier_id: int
+    store_id: Optional[int] = None
     total_amount: float
     payment_status: str
     purchase_date: datetime
@@ -57,36 +71,62 @@ class PurchaseSchema(BaseModel):
 
 def generate_po_number(db: Session) -> str:
     """Generate unique purchase order number"""
-    today = datetime.now().strftime("%Y%m%d")
-    count = db.query(Purchase).filter(
-        Purchase.purchase_order_number.like(f"PO-{today}%")
-    ).count()
-    return f"PO-{today}-{str(count + 1).zfill(4)}"
+    return next_number(db, PURCHASE_ORDER_PREFIX)
+
+def purchase_details_query():
+    """Select purchases with supplier and items eagerly loaded"""
+    return select(Purchase).options(joinedload(Purchase.supplier), selectinload(Purchase.items))
 
 @router.get("/", response_model=List[PurchaseSchema])
 async def get_purchases(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all purchases"""
-    purchases = db.query(Purchase).options(
-        joinedload(Purchase.supplier),
-        joinedload(Purchase.items)
-    ).order_by(Purchase.purchase_date.desc()).offset(skip).limit(limit).all()
+    """Get all purchases, newest first (next page: X-Next-Cursor response header as `cursor`)"""
+    columns = (Purchase.purchase_date, Purchase.id)
+    rows = (await db.scalars(
+        paginate(purchase_details_query(), columns, cursor, skip, limit, descending=True)
+    )).all()
+    purchases, next_cursor = keyset_page(rows, columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return purchases
 
 @router.post("/", response_model=PurchaseSchema, status_code=status.HTTP_201_CREATED)
 async def create_purchase(
     purchase_data: PurchaseCreate,
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new purchase and update product stock"""
+    # Replay the stored response if this request was already processed
+    idempotency_record = None
+    if idempotency_key:
+        try:
+            idempotency_record = await db.run_sync(
+                claim_key, idempotency_key, "create_purchase", current_user.id, request_fingerprint(purchase_data)
+            )
+        except IdempotencyKeyReusedError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except IdempotencyKeyInProgressError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        if idempotency_record.response_status is not None:
+            return JSONResponse(
+                status_code=idempotency_record.response_status,
+                content=idempotency_record.response_body
+            )
+    
     try:
+        if purchase_data.store_id is not None and not await db.get(Store, purchase_data.store_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Store not found")
+        
         # Generate PO number
-        po_number = generate_po_number(db)
+        po_number = await db.run_sync(generate_po_number)
         
         # Calculate total
         total_amount = 0.0
@@ -94,7 +134,7 @@ async def create_purchase(
         
         for item_data in purchase_data.items:
             # Get product
-            product = db.query(Product).filter(Product.id == item_data.product_id).first()
+            product = await db.get(Product, item_data.product_id)
             if not product:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -115,15 +155,17 @@ async def create_purchase(
         purchase = Purchase(
             purchase_order_number=po_number,
             supplier_id=purchase_data.supplier_id,
+            store_id=purchase_data.store_id,
             total_amount=total_amount,
             payment_status=purchase_data.payment_status,
             notes=purchase_data.notes
         )
         
         db.add(purchase)
-        db.flush()
+        await db.flush()
         
         # Create purchase items and update stock
+        received = {}
         for item_data in purchase_items_data:
             purchase_item = PurchaseItem(
                 purchase_id=purchase.id,
@@ -134,26 +176,32 @@ async def create_purchase(
             )
             db.add(purchase_item)
             
-            # Update product stock
-            product = item_data["product"]
-            product.current_stock += item_data["quantity"]
+            received[item_data["product"].id] = received.get(item_data["product"].id, 0) + item_data["quantity"]
         
-        db.commit()
-        db.refresh(purchase)
+        # Update product (and receiving store) stock in one set-based statement each
+        await db.run_sync(increment_stock, received, purchase_data.store_id)
+        await db.run_sync(record_movements, movements_for(
+            received, PURCHASE, reference_type="PURCHASE", reference_id=purchase.id, user_id=current_user.id,
+            store_id=purchase_data.store_id
+        ))
+        await db.flush()
+        mark_data_changed(db.sync_session, [purchase.purchase_date])
         
         # Reload with relationships
-        purchase = db.query(Purchase).options(
-            joinedload(Purchase.supplier),
-            joinedload(Purchase.items)
-        ).filter(Purchase.id == purchase.id).first()
+        purchase = await db.scalar(purchase_details_query().where(Purchase.id == purchase.id))
+        
+        if idempotency_record:
+            complete_key(idempotency_record, status.HTTP_201_CREATED, PurchaseSchema.model_validate(purchase))
+        
+        await db.commit()
         
         return purchase
     
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create purchase: {str(e)}"
@@ -162,14 +210,11 @@ async def create_purchase(
 @router.get("/{purchase_id}", response_model=PurchaseSchema)
 async def get_purchase(
     purchase_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get purchase by ID"""
-    purchase = db.query(Purchase).options(
-        joinedload(Purchase.supplier),
-        joinedload(Purchase.items)
-    ).filter(Purchase.id == purchase_id).first()
+    purchase = await db.scalar(purchase_details_query().where(Purchase.id == purchase_id))
     
     if not purchase:
         raise HTTPException(
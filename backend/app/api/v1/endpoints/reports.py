@@ -1,29 +1,42 @@
+import inspect
 from fastapi import APIRouter, Depends, HTTPException, Response
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, and_
-from typing import Optional
+from sqlalchemy import select, func, desc, and_
+from typing import Any, Dict, Optional
 from datetime import datetime, timedelta
-from io import BytesIO, StringIO
-import csv
+from io import BytesIO
+from pathlib import Path
 
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.sale import Sale, SaleItem
 from app.models.product import Product
 from app.models.customer import Customer
-from app.models.user import User
+from app.models.user import User, UserRole
 from app.models.purchase import Purchase, PurchaseItem
+from app.models.supplier import Supplier
+from app.models.report_job import ReportJob
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.sales_rollup import summarize_sales
+from app.core.config import settings
+from app.core.result_cache import cached_result, result_cache
+from app.core.report_jobs import ACTIVE_STATUSES, start_report_job, purge_expired_jobs
+from app.core.exports import (
+    iter_row_chunks, iter_csv, csv_response,
+    iter_columnar, columnar_response, require_pyarrow, ColumnarExportUnavailable, COLUMNAR_FORMATS,
+)
 
 router = APIRouter()
 
 
 @router.get("/sales-report")
+@cached_result("reports.sales_report")
 def get_sales_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     group_by: str = "day",  # day, week, month
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Generate sales report with grouping options"""
@@ -45,25 +58,20 @@ def get_sales_report(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid end_date format")
     
-    # Get sales within date range
-    sales = (
-        db.query(Sale)
-        .filter(Sale.sale_date >= start, Sale.sale_date <= end)
-        .order_by(Sale.sale_date)
-        .all()
-    )
+    # Totals per cashier and payment method (whole days come from daily_sales_rollup)
+    groups = summarize_sales(db, start, end, group_by=("user_id", "payment_method"))
     
     # Calculate statistics
-    total_sales = len(sales)
-    total_revenue = sum(sale.total_amount for sale in sales)
-    total_tax = sum(sale.tax_amount for sale in sales)
-    total_discount = sum(sale.discount_amount or 0 for sale in sales)
+    total_sales = sum(group["sale_count"] for group in groups)
+    total_revenue = sum(group["total_amount"] for group in groups)
+    total_tax = sum(group["tax_amount"] for group in groups)
+    total_discount = sum(group["discount_amount"] for group in groups)
     
     # Get payment method breakdown
     payment_methods = {}
-    for sale in sales:
-        method = getattr(sale, 'payment_method', 'Cash')  # Default to Cash if not set
-        payment_methods[method] = payment_methods.get(method, 0) + sale.total_amount
+    for group in groups:
+        method = group["payment_method"]
+        payment_methods[method] = payment_methods.get(method, 0) + group["total_amount"]
     
     # Get top selling products
     top_products = (
@@ -82,17 +90,14 @@ def get_sales_report(
     )
     
     # Get sales by user
-    sales_by_user = (
-        db.query(
-            User.username,
-            func.count(Sale.id).label("sales_count"),
-            func.sum(Sale.total_amount).label("total_revenue"),
-        )
-        .join(User, Sale.user_id == User.id)
-        .filter(Sale.sale_date >= start, Sale.sale_date <= end)
-        .group_by(User.username)
-        .all()
-    )
+    sales_by_user = {}
+    for group in groups:
+        stats = sales_by_user.setdefault(group["user_id"], {"sales_count": 0, "total_revenue": 0})
+        stats["sales_count"] += group["sale_count"]
+        stats["total_revenue"] += group["total_amount"]
+    usernames = dict(
+        db.query(User.id, User.username).filter(User.id.in_(sales_by_user)).all()
+    ) if sales_by_user else {}
     
     return {
         "period": {
@@ -120,20 +125,21 @@ def get_sales_report(
         ],
         "sales_by_user": [
             {
-                "username": u.username,
-                "sales_count": u.sales_count,
-                "revenue": round(u.total_revenue, 2),
+                "username": usernames.get(user_id),
+                "sales_count": stats["sales_count"],
+                "revenue": round(stats["total_revenue"], 2),
             }
-            for u in sales_by_user
+            for user_id, stats in sales_by_user.items()
         ],
     }
 
 
 @router.get("/inventory-report")
+@cached_result("reports.inventory_report", end_param=None)
 def get_inventory_report(
     category: Optional[str] = None,
     low_stock_only: bool = False,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Generate inventory stock report"""
@@ -198,11 +204,12 @@ def get_inventory_report(
 
 
 @router.get("/purchase-report")
+@cached_result("reports.purchase_report")
 def get_purchase_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     supplier_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Generate purchase report"""
@@ -305,10 +312,11 @@ def get_purchase_report(
 
 
 @router.get("/tax-report")
+@cached_result("reports.tax_report")
 def get_tax_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Generate tax report"""
@@ -330,68 +338,188 @@ def get_tax_report(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid end_date format")
     
-    # Get sales tax data
-    sales = (
-        db.query(Sale)
-        .filter(Sale.sale_date >= start, Sale.sale_date <= end)
-        .all()
-    )
-    
-    total_sales_amount = sum(s.total_amount for s in sales)
-    total_tax_collected = sum(s.tax_amount for s in sales)
-    taxable_amount = sum(s.subtotal for s in sales)
+    # Sales totals (whole days come from daily_sales_rollup)
+    totals = summarize_sales(db, start, end)
+    total_sales = sum(group["sale_count"] for group in totals)
+    total_sales_amount = sum(group["total_amount"] for group in totals)
+    total_tax_collected = sum(group["tax_amount"] for group in totals)
+    taxable_amount = sum(group["subtotal"] for group in totals)
     
     # Group by tax rate
-    tax_by_rate = {}
-    sale_items = (
-        db.query(SaleItem)
-        .join(Sale)
+    tax_rate = func.coalesce(SaleItem.tax_rate, 0)
+    tax_by_rate = (
+        db.query(
+            tax_rate.label("tax_rate"),
+            func.sum(SaleItem.quantity * SaleItem.unit_price - func.coalesce(SaleItem.discount, 0)).label("taxable_amount"),
+            func.sum(func.coalesce(SaleItem.tax_amount, 0)).label("tax_amount"),
+        )
+        .join(Sale, SaleItem.sale_id == Sale.id)
         .filter(Sale.sale_date >= start, Sale.sale_date <= end)
+        .group_by(tax_rate)
+        .order_by(tax_rate)
         .all()
     )
     
-    for item in sale_items:
-        rate = item.tax_rate or 0
-        if rate not in tax_by_rate:
-            tax_by_rate[rate] = {
-                "tax_rate": rate,
-                "taxable_amount": 0,
-                "tax_amount": 0,
-            }
-        tax_by_rate[rate]["taxable_amount"] += (item.quantity * item.unit_price - item.discount)
-        tax_by_rate[rate]["tax_amount"] += item.tax_amount
-    
     return {
         "period": {
             "start_date": start.isoformat(),
             "end_date": end.isoformat(),
         },
         "summary": {
-            "total_sales": len(sales),
+            "total_sales": total_sales,
             "total_sales_amount": round(total_sales_amount, 2),
             "taxable_amount": round(taxable_amount, 2),
             "total_tax_collected": round(total_tax_collected, 2),
-            "average_tax_per_sale": round(total_tax_collected / len(sales) if sales else 0, 2),
+            "average_tax_per_sale": round(total_tax_collected / total_sales if total_sales else 0, 2),
         },
         "by_tax_rate": [
             {
-                "tax_rate": rate,
-                "taxable_amount": round(data["taxable_amount"], 2),
-                "tax_amount": round(data["tax_amount"], 2),
+                "tax_rate": rate.tax_rate,
+                "taxable_amount": round(rate.taxable_amount or 0, 2),
+                "tax_amount": round(rate.tax_amount or 0, 2),
             }
-            for rate, data in sorted(tax_by_rate.items())
+            for rate in tax_by_rate
         ],
     }
 
 
+@router.get("/result-cache/stats")
+def get_result_cache_stats(
+    current_user: User = Depends(get_current_user),
+):
+    """Hit/miss statistics for the analytics and report result cache"""
+    return result_cache.stats()
+
+
+# Reports that can run as background jobs (POST /reports/jobs)
+JOB_REPORTS = {
+    "sales-report": get_sales_report,
+    "inventory-report": get_inventory_report,
+    "purchase-report": get_purchase_report,
+    "tax-report": get_tax_report,
+}
+
+
+class ReportJobCreate(BaseModel):
+    report: str
+    params: Dict[str, Any] = {}
+
+
+def report_job_dict(job: ReportJob) -> dict:
+    return {
+        "id": job.id,
+        "report": job.report,
+        "params": job.params,
+        "status": job.status,
+        "result_size": job.result_size,
+        "error": job.error_message,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at,
+    }
+
+
+def get_own_report_job(job_id: int, db: Session, current_user: User) -> ReportJob:
+    job = db.get(ReportJob, job_id)
+    if not job or (job.created_by != current_user.id and current_user.role != UserRole.ADMIN):
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+
+@router.post("/jobs", status_code=202)
+def create_report_job(
+    job_in: ReportJobCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Run a report in the background; poll GET /reports/jobs/{id} and download the result when completed"""
+    report = JOB_REPORTS.get(job_in.report)
+    if report is None:
+        raise HTTPException(status_code=400, detail=f"Unknown report. Use one of: {', '.join(JOB_REPORTS)}")
+    
+    accepted = set(inspect.signature(report).parameters) - {"db", "current_user", "response"}
+    unknown = sorted(set(job_in.params) - accepted)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown parameter(s) for {job_in.report}: {', '.join(unknown)}")
+    
+    purge_expired_jobs(db)
+    active = (
+        db.query(func.count(ReportJob.id))
+        .filter(ReportJob.created_by == current_user.id, ReportJob.status.in_(ACTIVE_STATUSES))
+        .scalar()
+    )
+    if active >= settings.REPORT_JOB_MAX_ACTIVE_PER_USER:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many report jobs in progress (limit {settings.REPORT_JOB_MAX_ACTIVE_PER_USER})",
+        )
+    
+    job = ReportJob(report=job_in.report, params=job_in.params, created_by=current_user.id)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    
+    start_report_job(job, report)
+    return report_job_dict(job)
+
+
+@router.get("/jobs")
+def get_report_jobs(
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """List the current user's report jobs, newest first"""
+    jobs = (
+        db.query(ReportJob)
+        .filter(ReportJob.created_by == current_user.id)
+        .order_by(desc(ReportJob.id))
+        .limit(limit)
+        .all()
+    )
+    return [report_job_dict(job) for job in jobs]
+
+
+@router.get("/jobs/{job_id}")
+def get_report_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Get a report job's status"""
+    return report_job_dict(get_own_report_job(job_id, db, current_user))
+
+
+@router.get("/jobs/{job_id}/download")
+def download_report_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Download a completed report job's result (JSON, same shape as the report endpoint)"""
+    job = get_own_report_job(job_id, db, current_user)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Report job is {job.status}")
+    
+    if job.expires_at < datetime.utcnow() or not Path(job.result_path).exists():
+        raise HTTPException(status_code=410, detail="Report result has expired")
+    
+    return FileResponse(
+        path=job.result_path,
+        filename=f"{job.report}_{job.id}.json",
+        media_type="application/json",
+    )
+
+
 @router.get("/export/sales-csv")
 def export_sales_csv(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    compress: bool = False,
     current_user: User = Depends(get_current_user),
 ):
-    """Export sales data as CSV"""
+    """Export sales data as CSV (streamed; gzipped when compress=true)"""
     
     if not start_date:
         start = datetime.now() - timedelta(days=30)
@@ -403,19 +531,26 @@ def export_sales_csv(
     else:
         end = datetime.fromisoformat(end_date)
     
-    sales = (
-        db.query(Sale)
-        .filter(Sale.sale_date >= start, Sale.sale_date <= end)
+    # Customer and cashier names come from the same query, not per-row lazy loads
+    stmt = (
+        select(
+            Sale.invoice_number,
+            Sale.sale_date,
+            Customer.name.label("customer_name"),
+            User.username,
+            Sale.subtotal,
+            Sale.discount_amount,
+            Sale.tax_amount,
+            Sale.total_amount,
+            Sale.payment_method,
+        )
+        .outerjoin(Customer, Sale.customer_id == Customer.id)
+        .outerjoin(User, Sale.user_id == User.id)
+        .where(Sale.sale_date >= start, Sale.sale_date <= end)
         .order_by(Sale.sale_date)
-        .all()
     )
     
-    # Create CSV
-    output = StringIO()
-    writer = csv.writer(output)
-    
-    # Headers
-    writer.writerow([
+    header = [
         "Invoice Number",
         "Date",
         "Customer",
@@ -425,56 +560,50 @@ def export_sales_csv(
         "Tax",
         "Total",
         "Payment Method",
-    ])
+    ]
     
-    # Data rows
-    for sale in sales:
-        customer_name = sale.customer.name if sale.customer else "Walk-in"
-        user_name = sale.user.username if sale.user else "N/A"
-        
-        writer.writerow([
+    def format_row(sale):
+        return [
             sale.invoice_number,
             sale.sale_date.strftime("%Y-%m-%d %H:%M"),
-            customer_name,
-            user_name,
+            sale.customer_name or "Walk-in",
+            sale.username or "N/A",
             f"{sale.subtotal:.2f}",
             f"{sale.discount_amount or 0:.2f}",
             f"{sale.tax_amount:.2f}",
             f"{sale.total_amount:.2f}",
-            getattr(sale, 'payment_method', 'Cash'),
-        ])
-    
-    output.seek(0)
+            sale.payment_method or "Cash",
+        ]
     
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": f"attachment; filename=sales_report_{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}.csv"
-        },
+    return csv_response(
+        iter_csv(header, iter_row_chunks(stmt), format_row, compress),
+        f"sales_report_{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}.csv",
+        compress,
     )
 
 
 @router.get("/export/inventory-csv")
 def export_inventory_csv(
-    db: Session = Depends(get_db),
+    compress: bool = False,
     current_user: User = Depends(get_current_user),
 ):
-    """Export inventory data as CSV"""
+    """Export inventory data as CSV (streamed; gzipped when compress=true)"""
     
-    products = (
-        db.query(Product)
-        .filter(Product.is_active == 1)
+    stmt = (
+        select(
+            Product.barcode,
+            Product.name,
+            Product.category,
+            Product.current_stock,
+            Product.minimum_stock,
+            Product.cost_price,
+            Product.selling_price,
+        )
+        .where(Product.is_active == 1)
         .order_by(Product.category, Product.name)
-        .all()
     )
     
-    # Create CSV
-    output = StringIO()
-    writer = csv.writer(output)
-    
-    # Headers
-    writer.writerow([
+    header = [
         "Barcode",
         "Name",
         "Category",
@@ -484,15 +613,14 @@ def export_inventory_csv(
         "Selling Price",
         "Stock Value",
         "Status",
-    ])
+    ]
     
-    # Data rows
-    for product in products:
+    def format_row(product):
         status = "Out of Stock" if product.current_stock == 0 \
                  else "Low Stock" if product.current_stock <= product.minimum_stock \
                  else "In Stock"
         
-        writer.writerow([
+        return [
             product.barcode,
             product.name,
             product.category,
@@ -502,14 +630,109 @@ def export_inventory_csv(
             f"{product.selling_price:.2f}",
             f"{product.current_stock * product.cost_price:.2f}",
             status,
-        ])
+        ]
+    
+    return csv_response(
+        iter_csv(header, iter_row_chunks(stmt), format_row, compress),
+        "inventory_report.csv",
+        compress,
+    )
+
+
+def columnar_dataset(dataset: str):
+    """Return (from clause, exportable columns by name, date column, filters) for a columnar export"""
+    if dataset == "sales":
+        columns = [
+            Sale.id, Sale.invoice_number, Sale.sale_date, Sale.user_id,
+            User.username.label("cashier"), Sale.customer_id, Customer.name.label("customer_name"),
+            Sale.subtotal, Sale.discount_amount, Sale.tax_amount, Sale.total_amount,
+            Sale.payment_method, Sale.payment_status,
+        ]
+        source = Sale.__table__.outerjoin(Customer, Sale.customer_id == Customer.id).outerjoin(User, Sale.user_id == User.id)
+        return source, columns, Sale.sale_date, []
+    if dataset == "sale_items":
+        columns = [
+            SaleItem.id, SaleItem.sale_id, Sale.invoice_number, Sale.sale_date,
+            SaleItem.product_id, SaleItem.product_name, SaleItem.barcode, SaleItem.quantity,
+            SaleItem.unit_price, SaleItem.discount, SaleItem.tax_rate, SaleItem.tax_amount, SaleItem.line_total,
+        ]
+        source = SaleItem.__table__.join(Sale, SaleItem.sale_id == Sale.id)
+        return source, columns, Sale.sale_date, []
+    if dataset == "purchases":
+        columns = [
+            Purchase.id, Purchase.purchase_order_number, Purchase.purchase_date, Purchase.supplier_id,
+            Supplier.name.label("supplier_name"), Purchase.total_amount, Purchase.payment_status,
+            Purchase.expected_delivery,
+        ]
+        source = Purchase.__table__.outerjoin(Supplier, Purchase.supplier_id == Supplier.id)
+        return source, columns, Purchase.purchase_date, []
+    if dataset == "inventory":
+        columns = [
+            Product.id, Product.barcode, Product.name, Product.category,
+            Product.current_stock, Product.minimum_stock, Product.cost_price, Product.selling_price,
+            (Product.current_stock * Product.cost_price).label("stock_value"),
+        ]
+        return Product.__table__, columns, None, [Product.is_active == 1]
+    return None
+
+
+@router.get("/export/columnar/{dataset}")
+def export_columnar(
+    dataset: str,
+    format: str = "parquet",  # parquet, arrow
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    columns: Optional[str] = None,  # Comma separated column names, default all
+    compression: str = "zstd",
+    current_user: User = Depends(get_current_user),
+):
+    """Export sales, sale_items, purchases or the inventory snapshot as Parquet or Arrow IPC"""
+    
+    definition = columnar_dataset(dataset)
+    if definition is None:
+        raise HTTPException(status_code=404, detail="Unknown dataset. Use sales, sale_items, purchases or inventory")
+    source, available, date_column, filters = definition
+    
+    if format not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Use parquet or arrow")
+    if compression not in COLUMNAR_FORMATS[format][2]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid compression for {format}. Use one of: {', '.join(COLUMNAR_FORMATS[format][2])}"
+        )
     
-    output.seek(0)
+    try:
+        require_pyarrow()
+    except ColumnarExportUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    by_name = {column.key: column for column in available}
+    if columns:
+        names = [name.strip() for name in columns.split(",") if name.strip()]
+        unknown = [name for name in names if name not in by_name]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(by_name)}"
+            )
+        selected = [by_name[name] for name in names]
+    else:
+        selected = available
     
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": "attachment; filename=inventory_report.csv"
-        },
+    stmt = select(*selected).select_from(source).where(*filters)
+    
+    if date_column is not None:
+        try:
+            if start_date:
+                stmt = stmt.where(date_column >= datetime.fromisoformat(start_date))
+            if end_date:
+                stmt = stmt.where(date_column <= datetime.fromisoformat(end_date))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format")
+        stmt = stmt.order_by(date_column)
+    
+    return columnar_response(
+        iter_columnar(stmt, format, compression),
+        f"{dataset}_{datetime.now().strftime('%Y%m%d')}",
+        format,
     )
@@ -1,37 +1,110 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from typing import List, Optional
-from datetime import datetime
-from app.database.session import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from app.database.session import get_async_db, get_async_read_db
 from app.models.sale import Sale, SaleItem
 from app.models.product import Product
 from app.models.customer import Customer
 from app.models.user import User
-from app.schemas.sale import Sale as SaleSchema, SaleCreate, SaleItemCreate
+from app.schemas.sale import (
+    Sale as SaleSchema, SaleCreate, SaleItemCreate,
+    SaleBatchCreate, SaleBatchResult, SaleBatchResponse
+)
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.idempotency import (
+    claim_key, complete_key, request_fingerprint, IdempotencyKeyReusedError, IdempotencyKeyInProgressError
+)
+from app.core.numbering import next_number, reserve_block, INVOICE_PREFIX
+from app.core.stock import (
+    get_products_for_update, decrement_stock, store_stock_levels, allocated_stock, InsufficientStockError
+)
+from app.core.stock_ledger import record_movements, movements_for, SALE
+from app.core.sales_rollup import record_sales, record_sale_items
+from app.core.result_cache import mark_data_changed
+from app.core.pagination import paginate, keyset_page
 
 router = APIRouter()
 
+MAX_SALES_PER_BATCH = 1000
+MAX_SALE_CLOCK_SKEW = timedelta(minutes=5)  # Terminal clocks may run slightly ahead
+
 def generate_invoice_number(db: Session) -> str:
     """
     Generate a unique invoice number
     Format: INV-YYYYMMDD-XXXX
     """
-    today = datetime.now().strftime("%Y%m%d")
+    return next_number(db, INVOICE_PREFIX)
+
+
+def sale_details_query():
+    """Select sales with everything the Sale schema serializes eagerly loaded"""
+    return select(Sale).options(joinedload(Sale.customer), selectinload(Sale.items))
+
+
+def count_quantities(items: List[SaleItemCreate]) -> Dict[int, int]:
+    """Sum the requested quantity per product across the lines of a sale"""
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+def calculate_sale_totals(sale_data: SaleCreate, products: Dict[int, Product]) -> dict:
+    """
+    Price every line of a sale against the loaded products
+    Returns the sale totals and the SaleItem column values for each line
+    """
+    subtotal = 0.0
+    tax_amount = 0.0
+    items = []
+    
+    for item_data in sale_data.items:
+        product = products[item_data.product_id]
+        
+        # Calculate line item totals
+        line_subtotal = item_data.unit_price * item_data.quantity
+        line_discount = item_data.discount
+        line_after_discount = line_subtotal - line_discount
+        line_tax = (line_after_discount * product.gst_rate) / 100
+        line_total = line_after_discount + line_tax
+        
+        subtotal += line_subtotal
+        tax_amount += line_tax
+        
+        items.append({
+            "product_id": product.id,
+            "product_name": product.name,
+            "barcode": product.barcode,
+            "quantity": item_data.quantity,
+            "unit_price": item_data.unit_price,
+            "discount": line_discount,
+            "tax_rate": product.gst_rate,
+            "tax_amount": line_tax,
+            "line_total": line_total,
+            "unit_cost": product.cost_price
+        })
     
-    # Get the count of sales today
-    count = db.query(func.count(Sale.id)).filter(
-        func.date(Sale.sale_date) == datetime.now().date()
-    ).scalar()
+    # Calculate final total
+    discount_amount = float(sale_data.discount_amount or 0.0)
     
-    return f"INV-{today}-{str(count + 1).zfill(4)}"
+    return {
+        "subtotal": subtotal,
+        "discount_amount": discount_amount,
+        "tax_amount": tax_amount,
+        "total_amount": subtotal - discount_amount + tax_amount,
+        "items": items
+    }
 
 
 @router.post("/", response_model=SaleSchema, status_code=status.HTTP_201_CREATED)
 async def create_sale(
     sale_data: SaleCreate,
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -41,63 +114,74 @@ async def create_sale(
     - Creating sale items
     - Updating product stock
     - Updating customer stats
+    Send an Idempotency-Key header to make client retries safe.
     """
+    # Replay the stored response if this request was already processed
+    idempotency_record = None
+    if idempotency_key:
+        try:
+            idempotency_record = await db.run_sync(
+                claim_key, idempotency_key, "create_sale", current_user.id, request_fingerprint(sale_data)
+            )
+        except IdempotencyKeyReusedError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except IdempotencyKeyInProgressError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        if idempotency_record.response_status is not None:
+            return JSONResponse(
+                status_code=idempotency_record.response_status,
+                content=idempotency_record.response_body
+            )
+    
     try:
-        # Generate invoice number
-        invoice_number = generate_invoice_number(db)
+        # Load every product in the basket with one locked query
+        products = await db.run_sync(get_products_for_update, [item.product_id for item in sale_data.items])
         
-        # Calculate totals
-        subtotal = 0.0
-        tax_amount = 0.0
-        sale_items_data = []
+        # Verify stock against the total quantity requested per product
+        requested = count_quantities(sale_data.items)
         
-        for item_data in sale_data.items:
-            # Get product and verify stock
-            product = db.query(Product).filter(Product.id == item_data.product_id).first()
+        for product_id, quantity in requested.items():
+            product = products.get(product_id)
             if not product:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Product ID {item_data.product_id} not found"
+                    detail=f"Product ID {product_id} not found"
                 )
             
-            if product.current_stock < item_data.quantity:
+            if product.current_stock < quantity:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail=f"Insufficient stock for {product.name}. Available: {product.current_stock}"
                 )
-            
-            # Calculate line item totals
-            line_subtotal = item_data.unit_price * item_data.quantity
-            line_discount = item_data.discount
-            line_after_discount = line_subtotal - line_discount
-            line_tax = (line_after_discount * product.gst_rate) / 100
-            line_total = line_after_discount + line_tax
-            
-            subtotal += line_subtotal
-            tax_amount += line_tax
-            
-            sale_items_data.append({
-                "product": product,
-                "quantity": item_data.quantity,
-                "unit_price": item_data.unit_price,
-                "discount": line_discount,
-                "tax_rate": product.gst_rate,
-                "tax_amount": line_tax,
-                "line_total": line_total
-            })
-        
-        # Calculate final total
-        discount_amount = float(sale_data.discount_amount or 0.0)
-        total_amount = subtotal - discount_amount + tax_amount
+        
+        # Calculate totals
+        totals = calculate_sale_totals(sale_data, products)
+        total_amount = totals["total_amount"]
+        
+        # Decrement stock for the whole basket in one conditional UPDATE
+        # (plus one for the store's inventory when the till names its store)
+        try:
+            await db.run_sync(decrement_stock, requested, sale_data.store_id)
+        except InsufficientStockError as e:
+            names = ", ".join(products[product_id].name for product_id in e.product_ids)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Insufficient stock for {names}" + (" at this store" if sale_data.store_id else "")
+            )
+        
+        # Generate invoice number. Taken after the stock locks, in the same
+        # order as the batch upload, and so the counter row is held briefly
+        invoice_number = await db.run_sync(generate_invoice_number)
         
         # Create sale record
         sale = Sale(
             invoice_number=invoice_number,
             user_id=current_user.id,
             customer_id=sale_data.customer_id,
-            subtotal=subtotal,
-            discount_amount=discount_amount,
-            tax_amount=tax_amount,
+            store_id=sale_data.store_id,
+            subtotal=totals["subtotal"],
+            discount_amount=totals["discount_amount"],
+            tax_amount=totals["tax_amount"],
             total_amount=total_amount,
             payment_method=sale_data.payment_method,
             payment_status="completed",
@@ -105,69 +189,302 @@ async def create_sale(
         )
         
         db.add(sale)
-        db.flush()  # Get the sale.id without committing
-        
-        # Create sale items and update stock
-        for item_data in sale_items_data:
-            sale_item = SaleItem(
-                sale_id=sale.id,
-                product_id=item_data["product"].id,
-                product_name=item_data["product"].name,
-                barcode=item_data["product"].barcode,
-                quantity=item_data["quantity"],
-                unit_price=item_data["unit_price"],
-                discount=item_data["discount"],
-                tax_rate=item_data["tax_rate"],
-                tax_amount=item_data["tax_amount"],
-                line_total=item_data["line_total"]
-            )
-            db.add(sale_item)
-            
-            # Update product stock (with row-level locking to prevent race conditions)
-            product = item_data["product"]
-            product.current_stock -= item_data["quantity"]
+        await db.flush()  # Get the sale.id without committing
+        
+        # Create sale items
+        for item in totals["items"]:
+            db.add(SaleItem(sale_id=sale.id, **item))
+        
+        await db.run_sync(record_movements, movements_for(
+            {product_id: -quantity for product_id, quantity in requested.items()},
+            SALE, reference_type="SALE", reference_id=sale.id, user_id=current_user.id, store_id=sale_data.store_id
+        ))
+        
+        await db.run_sync(record_sales, [sale])
+        await db.run_sync(record_sale_items, [dict(item, sale_date=sale.sale_date) for item in totals["items"]])
+        mark_data_changed(db.sync_session)
         
         # Update customer stats if customer provided
         if sale_data.customer_id:
-            customer = db.query(Customer).filter(Customer.id == sale_data.customer_id).first()
+            customer = await db.get(Customer, sale_data.customer_id)
             if customer:
                 customer.last_purchase_date = datetime.utcnow()
                 customer.total_purchases += 1
                 customer.total_spent += int(total_amount)
         
-        db.commit()
-        db.refresh(sale)
+        await db.flush()
+        sale = await db.scalar(sale_details_query().where(Sale.id == sale.id))
+        
+        if idempotency_record:
+            complete_key(idempotency_record, status.HTTP_201_CREATED, SaleSchema.model_validate(sale))
+        
+        await db.commit()
         
         return sale
     
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create sale: {str(e)}"
         )
 
 
+@router.post("/batch", response_model=SaleBatchResponse)
+async def create_sales_batch(
+    batch: SaleBatchCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload sales queued by a terminal while it was offline
+    This handles:
+    - Validating every sale against one locked load of all products
+    - Skipping sales whose invoice number is already recorded (replays)
+    - Bulk inserting sale and sale item rows
+    - One stock update per product for the whole batch
+    - Updating customer stats
+    Each sale gets its own result; invalid sales are reported and skipped.
+    """
+    if len(batch.sales) > MAX_SALES_PER_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch can contain at most {MAX_SALES_PER_BATCH} sales"
+        )
+    
+    try:
+        results: List[Optional[SaleBatchResult]] = [None] * len(batch.sales)
+        
+        # Sales already uploaded by an earlier (interrupted) attempt
+        supplied_numbers = [s.invoice_number for s in batch.sales if s.invoice_number]
+        existing = {}
+        if supplied_numbers:
+            existing = dict((await db.execute(
+                select(Sale.invoice_number, Sale.id)
+                .where(Sale.invoice_number.in_(supplied_numbers))
+            )).all())
+        
+        # Load every product referenced by the batch with one locked query
+        products = await db.run_sync(
+            get_products_for_update, [item.product_id for sale_data in batch.sales for item in sale_data.items]
+        )
+        available = {product_id: product.current_stock for product_id, product in products.items()}
+        # Units held at stores; sales without a store may only use the rest
+        held = await db.run_sync(allocated_stock, products)
+        
+        # Customers referenced by the batch that still exist, in one query
+        customer_ids = {s.customer_id for s in batch.sales if s.customer_id}
+        known_customers = set()
+        if customer_ids:
+            known_customers = set((await db.scalars(
+                select(Customer.id).where(Customer.id.in_(customer_ids))
+            )).all())
+        latest_sale_date = datetime.utcnow() + MAX_SALE_CLOCK_SKEW
+        
+        # Per-store stock for the stores named in the batch, in one query
+        store_available = await db.run_sync(store_stock_levels, {
+            (sale_data.store_id, item.product_id)
+            for sale_data in batch.sales if sale_data.store_id is not None
+            for item in sale_data.items
+        })
+        
+        accepted = []
+        seen_numbers = set()
+        for index, sale_data in enumerate(batch.sales):
+            if sale_data.invoice_number in existing:
+                results[index] = SaleBatchResult(
+                    index=index,
+                    status="duplicate",
+                    invoice_number=sale_data.invoice_number,
+                    sale_id=existing[sale_data.invoice_number]
+                )
+                continue
+            
+            requested = count_quantities(sale_data.items)
+            missing = [product_id for product_id in requested if product_id not in products]
+            error = None
+            if not sale_data.items:
+                error = "Sale has no items"
+            elif sale_data.invoice_number and sale_data.invoice_number in seen_numbers:
+                error = f"Invoice number {sale_data.invoice_number} appears more than once in the batch"
+            elif missing:
+                error = f"Product ID {missing[0]} not found"
+            elif sale_data.customer_id and sale_data.customer_id not in known_customers:
+                error = f"Customer ID {sale_data.customer_id} not found"
+            elif sale_data.sale_date and sale_data.sale_date > latest_sale_date:
+                error = "Sale date is in the future"
+            else:
+                short = [products[product_id].name for product_id, quantity in requested.items()
+                         if available[product_id] - (0 if sale_data.store_id else held.get(product_id, 0)) < quantity]
+                if short:
+                    error = f"Insufficient stock for {', '.join(short)}"
+                elif sale_data.store_id is not None:
+                    short = [products[product_id].name for product_id, quantity in requested.items()
+                             if store_available.get((sale_data.store_id, product_id), 0) < quantity]
+                    if short:
+                        error = f"Insufficient stock for {', '.join(short)} at this store"
+            
+            if error:
+                results[index] = SaleBatchResult(
+                    index=index, status="failed", invoice_number=sale_data.invoice_number, error=error
+                )
+                continue
+            
+            for product_id, quantity in requested.items():
+                available[product_id] -= quantity
+                if sale_data.store_id is not None:
+                    store_available[(sale_data.store_id, product_id)] -= quantity
+                    if product_id in held:
+                        held[product_id] -= quantity
+            if sale_data.invoice_number:
+                seen_numbers.add(sale_data.invoice_number)
+            accepted.append((index, sale_data, requested, calculate_sale_totals(sale_data, products)))
+        
+        if accepted:
+            # Number the sales that were rung up without a reserved invoice number
+            unnumbered = sum(1 for _, sale_data, _, _ in accepted if not sale_data.invoice_number)
+            new_numbers = iter(await db.run_sync(reserve_block, INVOICE_PREFIX, unnumbered) if unnumbered else [])
+            
+            now = datetime.utcnow()
+            sale_rows = [
+                {
+                    "invoice_number": sale_data.invoice_number or next(new_numbers),
+                    "user_id": current_user.id,
+                    "customer_id": sale_data.customer_id,
+                    "store_id": sale_data.store_id,
+                    "subtotal": totals["subtotal"],
+                    "discount_amount": totals["discount_amount"],
+                    "tax_amount": totals["tax_amount"],
+                    "total_amount": totals["total_amount"],
+                    "payment_method": sale_data.payment_method,
+                    "payment_status": "completed",
+                    "notes": sale_data.notes,
+                    "sale_date": sale_data.sale_date or now,
+                    "created_at": now,
+                }
+                for _, sale_data, _, totals in accepted
+            ]
+            sale_ids = (await db.scalars(
+                insert(Sale).returning(Sale.id, sort_by_parameter_order=True),
+                sale_rows
+            )).all()
+            
+            await db.execute(
+                insert(SaleItem),
+                [
+                    dict(item, sale_id=sale_id)
+                    for sale_id, (_, _, _, totals) in zip(sale_ids, accepted)
+                    for item in totals["items"]
+                ]
+            )
+            
+            # One conditional stock decrement for the sales without a store,
+            # and one per store for the store-scoped sales
+            sold_by_store: Dict[Optional[int], Dict[int, int]] = {}
+            for _, sale_data, requested, _ in accepted:
+                store_sold = sold_by_store.setdefault(sale_data.store_id, {})
+                for product_id, quantity in requested.items():
+                    store_sold[product_id] = store_sold.get(product_id, 0) + quantity
+            for store_id, store_sold in sorted(sold_by_store.items(), key=lambda entry: entry[0] or 0):
+                await db.run_sync(decrement_stock, store_sold, store_id)
+            await db.run_sync(record_movements, [
+                movement
+                for sale_id, (_, sale_data, requested, _) in zip(sale_ids, accepted)
+                for movement in movements_for(
+                    {product_id: -quantity for product_id, quantity in requested.items()},
+                    SALE, reference_type="SALE", reference_id=sale_id, user_id=current_user.id,
+                    store_id=sale_data.store_id
+                )
+            ])
+            await db.run_sync(record_sales, sale_rows)
+            await db.run_sync(record_sale_items, [
+                dict(item, sale_date=row["sale_date"])
+                for row, (_, _, _, totals) in zip(sale_rows, accepted)
+                for item in totals["items"]
+            ])
+            mark_data_changed(db.sync_session, [row["sale_date"] for row in sale_rows])
+            
+            # Update customer stats
+            customer_totals = {}
+            for row in sale_rows:
+                if row["customer_id"]:
+                    stats = customer_totals.setdefault(row["customer_id"], {"count": 0, "spent": 0, "last": row["sale_date"]})
+                    stats["count"] += 1
+                    stats["spent"] += int(row["total_amount"])
+                    stats["last"] = max(stats["last"], row["sale_date"])
+            if customer_totals:
+                customers = (await db.scalars(select(Customer).where(Customer.id.in_(customer_totals)))).all()
+                for customer in customers:
+                    stats = customer_totals[customer.id]
+                    customer.last_purchase_date = max(customer.last_purchase_date or stats["last"], stats["last"])
+                    customer.total_purchases += stats["count"]
+                    customer.total_spent += stats["spent"]
+            
+            await db.commit()
+            
+            for sale_id, row, (index, _, _, _) in zip(sale_ids, sale_rows, accepted):
+                results[index] = SaleBatchResult(
+                    index=index, status="created", invoice_number=row["invoice_number"], sale_id=sale_id
+                )
+        
+        return SaleBatchResponse(
+            created=sum(1 for r in results if r.status == "created"),
+            duplicates=sum(1 for r in results if r.status == "duplicate"),
+            failed=sum(1 for r in results if r.status == "failed"),
+            results=results
+        )
+    
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload sales batch: {str(e)}"
+        )
+
+
+@router.post("/invoice-numbers/reserve")
+async def reserve_invoice_numbers(
+    size: int = Query(50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Reserve a block of invoice numbers for a terminal to use while offline
+    """
+    invoice_numbers = await db.run_sync(reserve_block, INVOICE_PREFIX, size)
+    await db.commit()
+    return {"invoice_numbers": invoice_numbers}
+
+
 @router.get("/", response_model=List[SaleSchema])
 async def get_sales(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     payment_method: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get all sales with optional filters
+    Get all sales with optional filters, newest first
+    Pass the X-Next-Cursor response header back as `cursor` for the next page.
     """
-    query = db.query(Sale).options(joinedload(Sale.customer), joinedload(Sale.items))
+    query = sale_details_query()
     
     # Apply date filters
     if start_date:
         try:
             start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
-            query = query.filter(Sale.sale_date >= start_datetime)
+            query = query.where(Sale.sale_date >= start_datetime)
         except ValueError:
             pass
     
@@ -176,28 +493,32 @@ async def get_sales(
             end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
             # Add one day to include the end date
             end_datetime = end_datetime.replace(hour=23, minute=59, second=59)
-            query = query.filter(Sale.sale_date <= end_datetime)
+            query = query.where(Sale.sale_date <= end_datetime)
         except ValueError:
             pass
     
     # Apply payment method filter
     if payment_method:
-        query = query.filter(Sale.payment_method == payment_method.lower())
+        query = query.where(Sale.payment_method == payment_method.lower())
     
-    sales = query.order_by(Sale.sale_date.desc()).offset(skip).limit(limit).all()
+    columns = (Sale.sale_date, Sale.id)
+    rows = (await db.scalars(paginate(query, columns, cursor, skip, limit, descending=True))).all()
+    sales, next_cursor = keyset_page(rows, columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return sales
 
 
 @router.get("/{sale_id}", response_model=SaleSchema)
 async def get_sale(
     sale_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get sale by ID
     """
-    sale = db.query(Sale).filter(Sale.id == sale_id).first()
+    sale = await db.scalar(sale_details_query().where(Sale.id == sale_id))
     if not sale:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -209,13 +530,13 @@ async def get_sale(
 @router.get("/invoice/{invoice_number}", response_model=SaleSchema)
 async def get_sale_by_invoice(
     invoice_number: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get sale by invoice number
     """
-    sale = db.query(Sale).filter(Sale.invoice_number == invoice_number).first()
+    sale = await db.scalar(sale_details_query().where(Sale.invoice_number == invoice_number))
     if not sale:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.store import Store
+from app.models.store_inventory import StoreInventory
+from app.models.product import Product
 from app.models.user import User
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.pagination import paginate, keyset_page
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -32,6 +35,16 @@ class StoreUpdate(BaseModel):
     manager_id: Optional[int] = None
     is_active: Optional[bool] = None
 
+class StoreInventoryResponse(BaseModel):
+    store_id: int
+    product_id: int
+    product_name: str
+    barcode: str
+    on_hand: int
+    minimum: int
+    is_low_stock: bool
+    updated_at: Optional[datetime]
+
 class StoreResponse(BaseModel):
     id: int
     name: str
@@ -52,17 +65,22 @@ class StoreResponse(BaseModel):
 # Endpoints
 @router.get("/", response_model=List[StoreResponse])
 def get_stores(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     is_active: Optional[bool] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get all stores"""
     query = db.query(Store)
     if is_active is not None:
         query = query.filter(Store.is_active == is_active)
-    stores = query.offset(skip).limit(limit).all()
+    columns = (Store.id,)
+    stores, next_cursor = keyset_page(paginate(query, columns, cursor, skip, limit).all(), columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return stores
 
 @router.get("/{store_id}", response_model=StoreResponse)
@@ -141,9 +159,90 @@ def delete_store(
     db.commit()
     return {"message": "Store deactivated successfully"}
 
+def store_inventory_query(db: Session):
+    return db.query(
+        StoreInventory.store_id,
+        StoreInventory.product_id,
+        Product.name.label("product_name"),
+        Product.barcode,
+        StoreInventory.on_hand,
+        StoreInventory.minimum,
+        (StoreInventory.on_hand <= StoreInventory.minimum).label("is_low_stock"),
+        StoreInventory.updated_at,
+    ).join(Product, Product.id == StoreInventory.product_id)
+
+@router.get("/{store_id}/inventory", response_model=List[StoreInventoryResponse])
+def get_store_inventory(
+    store_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    low_stock_only: bool = False,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get stock on hand at one store"""
+    if not db.query(Store.id).filter(Store.id == store_id).first():
+        raise HTTPException(status_code=404, detail="Store not found")
+    
+    query = store_inventory_query(db).filter(StoreInventory.store_id == store_id)
+    if low_stock_only:
+        # Served by the partial index on (store_id, on_hand) WHERE on_hand <= minimum
+        query = query.filter(StoreInventory.on_hand <= StoreInventory.minimum)
+        columns = (StoreInventory.on_hand, StoreInventory.product_id)
+    else:
+        columns = (StoreInventory.product_id,)
+    
+    rows, next_cursor = keyset_page(paginate(query, columns, cursor, skip, limit).all(), columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [row._asdict() for row in rows]
+
+@router.get("/{store_id}/inventory/{product_id}", response_model=StoreInventoryResponse)
+def get_store_product_stock(
+    store_id: int,
+    product_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get one product's stock at a store (a single primary key lookup)"""
+    row = store_inventory_query(db).filter(
+        StoreInventory.store_id == store_id,
+        StoreInventory.product_id == product_id
+    ).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Product is not stocked at this store")
+    return row._asdict()
+
+@router.put("/{store_id}/inventory/{product_id}/minimum", response_model=StoreInventoryResponse)
+def update_store_minimum(
+    store_id: int,
+    product_id: int,
+    minimum: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Update a product's reorder point at one store"""
+    if minimum < 0:
+        raise HTTPException(status_code=400, detail="Minimum stock cannot be negative")
+    if not db.get(Store, store_id):
+        raise HTTPException(status_code=404, detail="Store not found")
+    if not db.get(Product, product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    item = db.get(StoreInventory, (store_id, product_id), with_for_update=True)
+    if item is None:
+        item = StoreInventory(store_id=store_id, product_id=product_id, on_hand=0)
+        db.add(item)
+    item.minimum = minimum
+    db.commit()
+    
+    return get_store_product_stock(store_id, product_id, db=db, current_user=current_user)
+
 @router.get("/stats/summary")
 def get_store_stats(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get store statistics summary"""
@@ -1,13 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
 from sqlalchemy.orm import Session, joinedload
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.supplier import Supplier
 from app.models.purchase import Purchase
 from app.models.user import User
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.pagination import paginate, keyset_page
 
 router = APIRouter()
 
@@ -52,13 +53,19 @@ class SupplierDetailSchema(SupplierBase):
 
 @router.get("/", response_model=List[SupplierSchema])
 async def get_suppliers(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all suppliers"""
-    suppliers = db.query(Supplier).offset(skip).limit(limit).all()
+    """Get all suppliers (next page: X-Next-Cursor response header as `cursor`)"""
+    columns = (Supplier.id,)
+    rows = paginate(db.query(Supplier), columns, cursor, skip, limit).all()
+    suppliers, next_cursor = keyset_page(rows, columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return suppliers
 
 @router.post("/", response_model=SupplierSchema, status_code=status.HTTP_201_CREATED)
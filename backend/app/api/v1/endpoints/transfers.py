@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import func
 from typing import List, Optional
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.inventory_transfer import InventoryTransfer, TransferStatus
 from app.models.store import Store
+from app.models.store_inventory import StoreInventory
 from app.models.product import Product
 from app.models.user import User
 from app.api.v1.endpoints.auth import get_current_user
+from app.core.numbering import next_number, TRANSFER_PREFIX
+from app.core.pagination import paginate, keyset_page
+from app.core.counters import get_counters, mark_counters_changed, TRANSFER_STATS
+from app.core.stock import (
+    get_products_for_update, store_stock_levels, allocated_stock, apply_store_stock_changes, InsufficientStockError
+)
+from app.core.stock_ledger import record_movements, TRANSFER_OUT, TRANSFER_IN
 from pydantic import BaseModel
 from datetime import datetime
-import random
-import string
 
 router = APIRouter()
 
@@ -45,25 +51,28 @@ class TransferResponse(BaseModel):
     class Config:
         from_attributes = True
 
-def generate_transfer_number():
+def generate_transfer_number(db: Session) -> str:
     """Generate unique transfer number"""
-    prefix = "TRF"
-    timestamp = datetime.now().strftime("%Y%m%d")
-    random_str = ''.join(random.choices(string.digits, k=4))
-    return f"{prefix}-{timestamp}-{random_str}"
+    return next_number(db, TRANSFER_PREFIX)
+
+def unallocated_stock(db: Session, product: Product) -> int:
+    """Units of the product not held at any store"""
+    return product.current_stock - allocated_stock(db, [product.id]).get(product.id, 0)
 
 # Endpoints
 @router.get("/", response_model=List[TransferResponse])
 def get_transfers(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     status: Optional[TransferStatus] = None,
     from_store_id: Optional[int] = None,
     to_store_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all inventory transfers with filters"""
+    """Get all inventory transfers with filters, newest first (next page: X-Next-Cursor header as `cursor`)"""
     query = db.query(InventoryTransfer)
     
     if status:
@@ -73,7 +82,11 @@ def get_transfers(
     if to_store_id:
         query = query.filter(InventoryTransfer.to_store_id == to_store_id)
     
-    transfers = query.order_by(desc(InventoryTransfer.created_at)).offset(skip).limit(limit).all()
+    columns = (InventoryTransfer.created_at, InventoryTransfer.id)
+    rows = paginate(query, columns, cursor, skip, limit, descending=True).all()
+    transfers, next_cursor = keyset_page(rows, columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return transfers
 
 @router.get("/{transfer_id}", response_model=TransferResponse)
@@ -110,17 +123,22 @@ def create_transfer(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Check if sufficient quantity available (assuming current_stock is total across all stores for now)
-    # In a real implementation, you'd have store-specific inventory
-    if product.current_stock < transfer.quantity:
+    # Check the sending store holds enough; stock is moved on completion.
+    # A store holding none of the product sends from the unallocated stock.
+    on_hand = db.query(StoreInventory.on_hand).filter(
+        StoreInventory.store_id == transfer.from_store_id,
+        StoreInventory.product_id == transfer.product_id
+    ).scalar() or 0
+    available = on_hand or unallocated_stock(db, product)
+    if available < transfer.quantity:
         raise HTTPException(
             status_code=400,
-            detail=f"Insufficient stock. Available: {product.current_stock}"
+            detail=f"Insufficient stock at {from_store.name}. Available: {available}"
         )
     
     # Create transfer
     db_transfer = InventoryTransfer(
-        transfer_number=generate_transfer_number(),
+        transfer_number=generate_transfer_number(db),
         from_store_id=transfer.from_store_id,
         to_store_id=transfer.to_store_id,
         product_id=transfer.product_id,
@@ -131,6 +149,7 @@ def create_transfer(
     )
     
     db.add(db_transfer)
+    mark_counters_changed(db, TRANSFER_STATS)
     db.commit()
     db.refresh(db_transfer)
     return db_transfer
@@ -154,6 +173,7 @@ def approve_transfer(
     
     transfer.status = TransferStatus.APPROVED
     transfer.approved_by = current_user.id
+    mark_counters_changed(db, TRANSFER_STATS)
     
     db.commit()
     db.refresh(transfer)
@@ -169,7 +189,7 @@ def complete_transfer(
     if current_user.role not in ["ADMIN", "MANAGER"]:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
-    transfer = db.query(InventoryTransfer).filter(InventoryTransfer.id == transfer_id).first()
+    transfer = db.query(InventoryTransfer).filter(InventoryTransfer.id == transfer_id).with_for_update().first()
     if not transfer:
         raise HTTPException(status_code=404, detail="Transfer not found")
     
@@ -179,6 +199,29 @@ def complete_transfer(
     transfer.status = TransferStatus.COMPLETED
     transfer.completed_at = datetime.utcnow()
     
+    # Stock moves between stores, or from the unallocated stock if the
+    # sending store holds none; the total on hand is unchanged. The product
+    # row is locked first, as at checkout.
+    product = get_products_for_update(db, [transfer.product_id])[transfer.product_id]
+    from_key = (transfer.from_store_id, transfer.product_id)
+    from_store_id = transfer.from_store_id if store_stock_levels(db, [from_key]).get(from_key) else None
+    try:
+        if from_store_id is not None:
+            apply_store_stock_changes(db, from_store_id, {transfer.product_id: -transfer.quantity})
+        elif unallocated_stock(db, product) < transfer.quantity:
+            raise InsufficientStockError([transfer.product_id])
+    except InsufficientStockError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Insufficient stock at the sending store")
+    apply_store_stock_changes(db, transfer.to_store_id, {transfer.product_id: transfer.quantity})
+    reference = {"product_id": transfer.product_id, "reference_type": "INVENTORY_TRANSFER",
+                 "reference_id": transfer.id, "user_id": current_user.id}
+    record_movements(db, [
+        {**reference, "store_id": from_store_id, "quantity_change": -transfer.quantity, "movement_type": TRANSFER_OUT},
+        {**reference, "store_id": transfer.to_store_id, "quantity_change": transfer.quantity, "movement_type": TRANSFER_IN},
+    ])
+    mark_counters_changed(db, TRANSFER_STATS)
+    
     db.commit()
     db.refresh(transfer)
     return transfer
@@ -204,6 +247,7 @@ def reject_transfer(
     transfer.status = TransferStatus.REJECTED
     if notes:
         transfer.notes = f"{transfer.notes}\nRejection reason: {notes}" if transfer.notes else f"Rejection reason: {notes}"
+    mark_counters_changed(db, TRANSFER_STATS)
     
     db.commit()
     db.refresh(transfer)
@@ -215,16 +259,23 @@ def get_transfer_stats(
     current_user: User = Depends(get_current_user)
 ):
     """Get transfer statistics"""
-    total = db.query(InventoryTransfer).count()
-    pending = db.query(InventoryTransfer).filter(InventoryTransfer.status == TransferStatus.PENDING).count()
-    approved = db.query(InventoryTransfer).filter(InventoryTransfer.status == TransferStatus.APPROVED).count()
-    completed = db.query(InventoryTransfer).filter(InventoryTransfer.status == TransferStatus.COMPLETED).count()
-    rejected = db.query(InventoryTransfer).filter(InventoryTransfer.status == TransferStatus.REJECTED).count()
+    return get_counters(TRANSFER_STATS, lambda: transfer_stats(db))
+
+def transfer_stats(db: Session) -> dict:
+    """Transfer counts by status in one pass over inventory_transfers"""
+    status = InventoryTransfer.status
+    stats = db.query(
+        func.count().label("total"),
+        func.count().filter(status == TransferStatus.PENDING).label("pending"),
+        func.count().filter(status == TransferStatus.APPROVED).label("approved"),
+        func.count().filter(status == TransferStatus.COMPLETED).label("completed"),
+        func.count().filter(status == TransferStatus.REJECTED).label("rejected"),
+    ).one()
     
     return {
-        "total_transfers": total,
-        "pending": pending,
-        "approved": approved,
-        "completed": completed,
-        "rejected": rejected
+        "total_transfers": stats.total,
+        "pending": stats.pending,
+        "approved": stats.approved,
+        "completed": stats.completed,
+        "rejected": stats.rejected
     }
@@ -1,44 +1,65 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy import select, update
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime, timedelta
-from app.database.session import get_db
+from app.database.session import get_async_db, get_async_read_db
 from app.models.user import User, UserRole
 from app.models.activity_log import ActivityLog
+from app.models.user_session import UserSession
 from app.schemas.user import User as UserSchema, UserCreate, UserUpdate
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash_async
+from app.core.principal_cache import invalidate_principals
+from app.core.sales_rollup import summarize_sales
+from app.core.pagination import paginate, keyset_page, count_rows, TotalCount
 from app.api.v1.endpoints.auth import get_current_user
 
 router = APIRouter()
 
+
+async def revoke_sessions(db: AsyncSession, user_id: int):
+    """Revoke all refresh tokens of a user (password change or deactivation)."""
+    await db.execute(
+        update(UserSession)
+        .where(UserSession.user_id == user_id, UserSession.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+
+
 @router.get("/", response_model=List[UserSchema])
 async def get_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get all users (Admin only)
     """
-    users = db.query(User).offset(skip).limit(limit).all()
+    columns = (User.id,)
+    rows = (await db.scalars(paginate(select(User), columns, cursor, skip, limit))).all()
+    users, next_cursor = keyset_page(rows, columns, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return users
 
 
 @router.post("/", response_model=UserSchema, status_code=status.HTTP_201_CREATED)
 async def create_user(
     user_data: UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Create a new user (Admin only)
     """
     # Check if username or email already exists
-    existing = db.query(User).filter(
+    existing = await db.scalar(select(User).where(
         (User.username == user_data.username) | (User.email == user_data.email)
-    ).first()
+    ))
     
     if existing:
         raise HTTPException(
@@ -52,25 +73,95 @@ async def create_user(
         full_name=user_data.full_name,
         role=user_data.role,
         is_active=user_data.is_active,
-        hashed_password=get_password_hash(user_data.password)
+        hashed_password=await get_password_hash_async(user_data.password)
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
+@router.get("/activity-logs")
+async def get_activity_logs(
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    count: TotalCount = TotalCount.EXACT,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get activity logs, newest first (Admin/Manager only)
+    Pass next_cursor back as `cursor` for the next page; count=estimated
+    reports the planner's row estimate instead of counting every match.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        raise HTTPException(status_code=403, detail="Manager or Admin access required")
+    
+    query = select(ActivityLog).join(User).options(contains_eager(ActivityLog.user))
+    
+    # Filters
+    if user_id:
+        query = query.where(ActivityLog.user_id == user_id)
+    
+    if action:
+        query = query.where(ActivityLog.action == action)
+    
+    if start_date:
+        try:
+            start = datetime.fromisoformat(start_date)
+            query = query.where(ActivityLog.created_at >= start)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid start_date format")
+    
+    if end_date:
+        try:
+            end = datetime.fromisoformat(end_date)
+            query = query.where(ActivityLog.created_at <= end)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid end_date format")
+    
+    total = await db.run_sync(count_rows, query, count)
+    columns = (ActivityLog.created_at, ActivityLog.id)
+    rows = (await db.scalars(paginate(query, columns, cursor, skip, limit, descending=True))).all()
+    logs, next_cursor = keyset_page(rows, columns, limit)
+    
+    return {
+        "total": total,
+        "next_cursor": next_cursor,
+        "logs": [
+            {
+                "id": log.id,
+                "user_id": log.user_id,
+                "username": log.user.username,
+                "full_name": log.user.full_name,
+                "action": log.action,
+                "entity_type": log.entity_type,
+                "entity_id": log.entity_id,
+                "description": log.description,
+                "ip_address": log.ip_address,
+                "created_at": log.created_at.isoformat(),
+            }
+            for log in logs
+        ],
+    }
+
+
 @router.get("/{user_id}", response_model=UserSchema)
 async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get user by ID
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -83,13 +174,13 @@ async def get_user(
 async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Update user (Admin only)
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -98,21 +189,26 @@ async def update_user(
     
     update_data = user_data.dict(exclude_unset=True)
     
+    # A new password or deactivation ends existing refresh sessions
+    if "password" in update_data or update_data.get("is_active") is False:
+        await revoke_sessions(db, user.id)
+    
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await get_password_hash_async(update_data.pop("password"))
     
+    invalidate_principals(db.sync_session, [user.username])
     for field, value in update_data.items():
         setattr(user, field, value)
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -121,7 +217,7 @@ async def delete_user(
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -130,7 +226,9 @@ async def delete_user(
     
     # Soft delete by deactivating
     user.is_active = False
-    db.commit()
+    await revoke_sessions(db, user.id)
+    invalidate_principals(db.sync_session, [user.username])
+    await db.commit()
     
     # Log activity
     log = ActivityLog(
@@ -141,7 +239,7 @@ async def delete_user(
         description=f"Deactivated user {user.username}",
     )
     db.add(log)
-    db.commit()
+    await db.commit()
     
     return None
 
@@ -150,7 +248,7 @@ async def delete_user(
 async def get_user_performance(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -170,106 +268,35 @@ async def get_user_performance(
     else:
         end = datetime.fromisoformat(end_date)
     
-    from app.models.sale import Sale
+    # Get sales stats by user (whole days come from daily_sales_rollup)
+    sales_by_user = {
+        group["user_id"]: group
+        for group in await db.run_sync(summarize_sales, start, end, ("user_id",))
+    }
+    
+    users = (await db.execute(
+        select(User.id, User.username, User.full_name, User.role).where(User.is_active == True)
+    )).all()
     
-    # Get sales stats by user
-    user_stats = (
-        db.query(
-            User.id,
-            User.username,
-            User.full_name,
-            User.role,
-            func.count(Sale.id).label("total_sales"),
-            func.sum(Sale.total_amount).label("total_revenue"),
-            func.avg(Sale.total_amount).label("average_sale"),
-        )
-        .outerjoin(Sale, User.id == Sale.user_id)
-        .filter(User.is_active == True)
-        .filter((Sale.sale_date >= start) & (Sale.sale_date <= end) | (Sale.id == None))
-        .group_by(User.id, User.username, User.full_name, User.role)
-        .all()
-    )
+    performance = []
+    for stat in users:
+        stats = sales_by_user.get(stat.id, {"sale_count": 0, "total_amount": 0.0})
+        performance.append({
+            "id": stat.id,
+            "username": stat.username,
+            "full_name": stat.full_name,
+            "role": stat.role,
+            "total_sales": stats["sale_count"],
+            "total_revenue": round(stats["total_amount"], 2),
+            "average_sale": round(stats["total_amount"] / stats["sale_count"] if stats["sale_count"] else 0, 2),
+        })
     
     return {
         "period": {
             "start_date": start.isoformat(),
             "end_date": end.isoformat(),
         },
-        "users": [
-            {
-                "id": stat.id,
-                "username": stat.username,
-                "full_name": stat.full_name,
-                "role": stat.role,
-                "total_sales": stat.total_sales or 0,
-                "total_revenue": round(stat.total_revenue or 0, 2),
-                "average_sale": round(stat.average_sale or 0, 2),
-            }
-            for stat in user_stats
-        ],
-    }
-
-
-@router.get("/activity-logs")
-async def get_activity_logs(
-    skip: int = 0,
-    limit: int = 50,
-    user_id: Optional[int] = None,
-    action: Optional[str] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Get activity logs (Admin/Manager only)
-    """
-    if current_user.role not in [UserRole.ADMIN, UserRole.MANAGER]:
-        raise HTTPException(status_code=403, detail="Manager or Admin access required")
-    
-    query = db.query(ActivityLog).join(User)
-    
-    # Filters
-    if user_id:
-        query = query.filter(ActivityLog.user_id == user_id)
-    
-    if action:
-        query = query.filter(ActivityLog.action == action)
-    
-    if start_date:
-        try:
-            start = datetime.fromisoformat(start_date)
-            query = query.filter(ActivityLog.created_at >= start)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid start_date format")
-    
-    if end_date:
-        try:
-            end = datetime.fromisoformat(end_date)
-            query = query.filter(ActivityLog.created_at <= end)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid end_date format")
-    
-    total = query.count()
-    logs = query.order_by(desc(ActivityLog.created_at)).offset(skip).limit(limit).all()
-    
-    return {
-        "total": total,
-        "logs": [
-            {
-                "id": log.id,
-                "user_id": log.user_id,
-                "username": log.user.username,
-                "full_name": log.user.full_name,
-                "action": log.action,
-                "entity_type": log.entity_type,
-                "entity_id": log.entity_id,
-                "description": log.description,
-                "ip_address": log.ip_address,
-                "created_at": log.created_at.isoformat(),
-            }
-            for log in logs
-        ],
+        "users": performance,
     }
 
 
@@ -277,7 +304,7 @@ async def get_activity_logs(
 async def reset_user_password(
     user_id: int,
     new_password: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -286,12 +313,14 @@ async def reset_user_password(
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user.hashed_password = get_password_hash(new_password)
-    db.commit()
+    user.hashed_password = await get_password_hash_async(new_password)
+    await revoke_sessions(db, user.id)
+    invalidate_principals(db.sync_session, [user.username])
+    await db.commit()
     
     # Log activity
     log = ActivityLog(
@@ -302,7 +331,7 @@ async def reset_user_password(
         description=f"Reset password for user {user.username}",
     )
     db.add(log)
-    db.commit()
+    await db.commit()
     
     return {"message": "Password reset successfully"}
 
@@ -9,11 +9,57 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: Optional[str] = None  # Derived from DATABASE_URL when not set
+    
+    # Optional read replica for reports, analytics and list endpoints
+    DATABASE_REPLICA_URL: Optional[str] = None
+    ASYNC_DATABASE_REPLICA_URL: Optional[str] = None  # Derived from DATABASE_REPLICA_URL when not set
+    REPLICA_MAX_LAG_SECONDS: float = 30.0  # Fall back to the primary beyond this
+    REPLICA_CHECK_INTERVAL_SECONDS: float = 5.0
     
     # Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_HOURS: int = 16  # Long enough to cover a double shift
+    PASSWORD_HASH_WORKERS: int = 4
+    
+    # Failed-login throttling
+    LOGIN_THROTTLE_WINDOW_SECONDS: int = 300
+    LOGIN_MAX_FAILURES_PER_USER: int = 5
+    LOGIN_MAX_FAILURES_PER_IP: int = 20
+    
+    # Authenticated-user cache for get_current_user
+    PRINCIPAL_CACHE_SIZE: int = 1000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 30
+    # Build the current user from the token's uid/role claims without a users lookup
+    # (role changes and deactivation then only apply once the token expires)
+    AUTH_TRUST_TOKEN_CLAIMS: bool = False
+    
+    # Idempotency-Key support on create endpoints
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+    
+    # In-process barcode lookup cache
+    BARCODE_CACHE_SIZE: int = 10000
+    BARCODE_CACHE_TTL_SECONDS: int = 60
+    
+    # Analytics dashboard: sections run concurrently, each on its own connection
+    DASHBOARD_WORKERS: int = 5
+    DASHBOARD_SECTION_TIMEOUT_SECONDS: float = 10.0
+    
+    # Analytics / report result cache
+    RESULT_CACHE_SIZE: int = 500
+    RESULT_CACHE_OPEN_TTL_SECONDS: int = 300  # Ranges that include today
+    RESULT_CACHE_CLOSED_TTL_SECONDS: int = 3600  # Past ranges; bounds staleness across worker processes
+    
+    # Dashboard counters (inventory summary, transfer stats); 0 disables the cache
+    COUNTER_CACHE_TTL_SECONDS: int = 5
+    
+    # Background report jobs (run in a separate process pool)
+    REPORT_JOB_WORKERS: int = 2
+    REPORT_JOB_MAX_ACTIVE_PER_USER: int = 3
+    REPORT_JOB_RESULT_TTL_HOURS: int = 24
+    REPORT_JOB_DIR: Optional[str] = None  # Defaults to backend/report_results
     
     # CORS
     BACKEND_CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:8000"]
@@ -0,0 +1,70 @@
+import threading
+from typing import Callable, Dict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+# Counter set name -> last computed result, for dashboard tiles that poll
+counter_cache = TTLCache(max_size=32, ttl=settings.COUNTER_CACHE_TTL_SECONDS)
+
+INVENTORY_SUMMARY = "inventory_summary"
+TRANSFER_STATS = "transfer_stats"
+
+# Bumped on every invalidation, so a result computed from data read before
+# a commit is not cached after that commit's invalidation
+_generations: Dict[str, int] = {}
+_generations_lock = threading.Lock()
+
+_PENDING_KEY = "changed_counters"
+_MISSING = object()
+
+
+def get_counters(name: str, compute: Callable[[], dict]) -> dict:
+    """
+    Return the cached counter set, computing and caching it on a miss.
+    `compute` must read the primary: a replica that has not replayed a
+    write yet would cache pre-write counts past its invalidation.
+    """
+    if settings.COUNTER_CACHE_TTL_SECONDS <= 0:
+        return compute()
+
+    value = counter_cache.get(name, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    with _generations_lock:
+        generation = _generations.get(name, 0)
+    value = compute()
+    with _generations_lock:
+        if _generations.get(name, 0) == generation:
+            counter_cache.set(name, value)
+    return value
+
+
+def invalidate_counters(*names: str) -> None:
+    """Drop the given counter sets immediately."""
+    with _generations_lock:
+        for name in names:
+            _generations[name] = _generations.get(name, 0) + 1
+            counter_cache.invalidate(name)
+
+
+def mark_counters_changed(db: Session, *names: str) -> None:
+    """
+    Invalidate the given counter sets once the session's transaction
+    commits, so the next poll recomputes them; a rollback discards it.
+    """
+    db.info.setdefault(_PENDING_KEY, set()).update(names)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    names = session.info.pop(_PENDING_KEY, None)
+    if names:
+        invalidate_counters(*names)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
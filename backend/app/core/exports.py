@@ -0,0 +1,192 @@
+import csv
+import zlib
+from datetime import date, datetime
+from enum import Enum
+from io import StringIO
+from typing import Callable, Iterable, Iterator, List, Sequence
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from app.database.session import get_read_session
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def iter_row_chunks(stmt: Select, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List]:
+    """
+    Yield the rows of `stmt` in chunks of `chunk_size`.
+
+    Uses yield_per, which on PostgreSQL opens a server-side cursor, so only
+    one chunk is held in memory at a time. The generator owns its session
+    because it keeps running after the endpoint has returned the response.
+    Reads from the replica when one is configured and usable.
+    """
+    db = get_read_session()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=chunk_size))
+        for rows in result.partitions():
+            yield rows
+    finally:
+        db.close()
+
+
+def iter_csv(
+    header: Sequence[str],
+    chunks: Iterable[Iterable],
+    format_row: Callable[..., Sequence],
+    compress: bool = False,
+) -> Iterator[bytes]:
+    """Encode row chunks as CSV, one output chunk per input chunk, optionally gzipped."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+
+    def drain() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(header)
+    yield drain()
+    for rows in chunks:
+        writer.writerows(format_row(row) for row in rows)
+        data = drain()
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+
+def csv_response(body: Iterator[bytes], filename: str, compress: bool = False) -> StreamingResponse:
+    if compress:
+        return StreamingResponse(
+            body,
+            media_type="application/gzip",
+            headers={"Content-Disposition": f"attachment; filename={filename}.gz"},
+        )
+    return StreamingResponse(
+        body,
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+# Columnar (Arrow IPC / Parquet) exports. pyarrow is an optional dependency.
+COLUMNAR_CHUNK_SIZE = 50000
+
+COLUMNAR_FORMATS = {
+    # format: (media type, file extension, supported compression codecs)
+    "parquet": ("application/vnd.apache.parquet", "parquet", ("zstd", "snappy", "gzip", "none")),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows", ("zstd", "lz4", "none")),
+}
+
+
+class ColumnarExportUnavailable(Exception):
+    """Raised when pyarrow is not installed."""
+
+
+def require_pyarrow():
+    """Import pyarrow, raising ColumnarExportUnavailable when it is not installed."""
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401 - registers pyarrow.parquet
+    except ImportError as e:
+        raise ColumnarExportUnavailable("Columnar exports require the optional pyarrow package") from e
+    return pyarrow
+
+
+def _arrow_type(pa, column_type):
+    if hasattr(column_type, "enums"):
+        return pa.dictionary(pa.int32(), pa.string())
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        python_type = str
+    return {
+        int: pa.int64(),
+        float: pa.float64(),
+        bool: pa.bool_(),
+        datetime: pa.timestamp("us"),
+        date: pa.date32(),
+    }.get(python_type, pa.string())
+
+
+class _ChunkSink:
+    """Write-only file object that buffers whatever the writer produced since the last drain."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_columnar(
+    stmt: Select,
+    file_format: str,
+    compression: str = "zstd",
+    chunk_size: int = COLUMNAR_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Encode the rows of `stmt` as Parquet or an Arrow IPC stream, one
+    record batch (Parquet row group) per chunk of rows read from the
+    database. The schema is derived from the selected column types.
+    """
+    pa = require_pyarrow()
+    import pyarrow.parquet as pq
+
+    columns = list(stmt.selected_columns)
+    schema = pa.schema([(column.key, _arrow_type(pa, column.type)) for column in columns])
+    codec = None if compression == "none" else compression
+
+    sink = _ChunkSink()
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression=codec or "none")
+    else:
+        writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression=codec))
+
+    try:
+        for rows in iter_row_chunks(stmt, chunk_size):
+            arrays = []
+            for index, field in enumerate(schema):
+                values = [row[index] for row in rows]
+                if pa.types.is_dictionary(field.type):
+                    values = [value.value if isinstance(value, Enum) else value for value in values]
+                    arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+                else:
+                    arrays.append(pa.array(values, type=field.type))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def columnar_response(body: Iterator[bytes], filename: str, file_format: str) -> StreamingResponse:
+    media_type, extension, _ = COLUMNAR_FORMATS[file_format]
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}.{extension}"},
+    )
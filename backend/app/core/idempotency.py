@@ -0,0 +1,117 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.idempotency_key import IdempotencyKey
+
+# Expired keys are purged at most this often per process
+PURGE_INTERVAL = timedelta(minutes=10)
+_last_purge = datetime.min
+
+
+class IdempotencyKeyReusedError(Exception):
+    """Raised when an Idempotency-Key is reused with a different request payload."""
+
+
+class IdempotencyKeyInProgressError(Exception):
+    """Raised when another request keeps claiming and releasing the same Idempotency-Key."""
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Stable SHA-256 of a request payload (pydantic model, dict, ...)."""
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _lookup(db: Session, key: str, scope: str, user_id: int):
+    return (
+        db.query(IdempotencyKey)
+        .filter(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key,
+        )
+        .first()
+    )
+
+
+def purge_expired_keys(db: Session) -> int:
+    """Delete expired keys using the expires_at index. Returns the number removed."""
+    result = db.execute(
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.expires_at < datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def claim_key(db: Session, key: str, scope: str, user_id: int, request_hash: str) -> IdempotencyKey:
+    """
+    Claim an idempotency key at the start of a write.
+
+    If the key was already used successfully, the stored record is
+    returned and its response_status is set; the caller should replay
+    response_status/response_body without doing any work.
+
+    Otherwise a placeholder row is inserted and flushed in the caller's
+    transaction and returned with response_status unset. A concurrent
+    request with the same key blocks on the unique index until this
+    transaction ends. The caller must call complete_key() before
+    committing so the key and the write it protects commit together; if
+    the caller rolls back, the claim disappears and a retry runs again.
+
+    Must be called before any other work in the transaction, since a
+    lost race rolls the session back. If the winner of the race rolled
+    back in the meantime the claim is retried once; should that race be
+    lost the same way again, IdempotencyKeyInProgressError is raised.
+    """
+    global _last_purge
+    now = datetime.utcnow()
+    if now - _last_purge > PURGE_INTERVAL:
+        _last_purge = now
+        purge_expired_keys(db)
+
+    record = _lookup(db, key, scope, user_id)
+    if record is not None and record.expires_at < now:
+        db.delete(record)
+        db.flush()
+        record = None
+
+    attempts = 2
+    while record is None:
+        record = IdempotencyKey(
+            key=key,
+            scope=scope,
+            user_id=user_id,
+            request_hash=request_hash,
+            expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+        )
+        db.add(record)
+        try:
+            db.flush()
+            return record
+        except IntegrityError:
+            # Another request with the same key committed first, or held
+            # the key and has since rolled back (then there is no row)
+            db.rollback()
+            record = _lookup(db, key, scope, user_id)
+            attempts -= 1
+            if record is None and not attempts:
+                raise IdempotencyKeyInProgressError("A request with this Idempotency-Key is in progress")
+
+    if record.request_hash != request_hash:
+        raise IdempotencyKeyReusedError(
+            "Idempotency-Key has already been used with a different request"
+        )
+    return record
+
+
+def complete_key(record: IdempotencyKey, status_code: int, body: Any) -> None:
+    """Store the response for a claimed key; it is committed with the caller's transaction."""
+    record.response_status = status_code
+    record.response_body = jsonable_encoder(body)
@@ -0,0 +1,136 @@
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app.models.document_counter import DocumentCounter
+from app.models.inventory_transfer import InventoryTransfer
+from app.models.purchase import Purchase
+from app.models.sale import Sale
+
+INVOICE_PREFIX = "INV"
+PURCHASE_ORDER_PREFIX = "PO"
+TRANSFER_PREFIX = "TRF"
+
+# Column holding the issued numbers for each prefix, used to seed a new counter
+NUMBER_COLUMNS = {
+    INVOICE_PREFIX: Sale.invoice_number,
+    PURCHASE_ORDER_PREFIX: Purchase.purchase_order_number,
+    TRANSFER_PREFIX: InventoryTransfer.transfer_number,
+}
+
+
+def _current_period() -> str:
+    return datetime.now().strftime("%Y%m%d")
+
+
+def upsert_insert(db: Session):
+    """Return the dialect's INSERT construct if it supports ON CONFLICT DO UPDATE."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def issued_max(db: Session, prefix: str, period: str) -> int:
+    """
+    Highest number already issued for (prefix, period), e.g. by the old
+    max + 1 numbering before the period had a counter row; 0 if none.
+    """
+    column = NUMBER_COLUMNS.get(prefix)
+    if column is None:
+        return 0
+    # Longest first: "...-10000" sorts below "...-9999" as a string
+    last = db.scalar(
+        select(column)
+        .where(column.like(f"{prefix}-{period}-%"))
+        .order_by(func.length(column).desc(), column.desc())
+        .limit(1)
+    )
+    suffix = last.rsplit("-", 1)[-1] if last else ""
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def allocate(db: Session, prefix: str, count: int = 1, period: Optional[str] = None) -> int:
+    """
+    Reserve `count` consecutive numbers for (prefix, period) and return
+    the last one. Once the period has a counter row this is one UPDATE:
+
+        UPDATE document_counters SET last_value = last_value + :count
+        WHERE prefix = :prefix AND period = :period
+        RETURNING last_value
+
+    so it is O(1) regardless of how many documents exist. The first
+    allocation of a period creates the row, starting after any number
+    already issued for it (see issued_max), with an upsert in case a
+    concurrent allocator created it first. The counter row stays locked
+    until the caller's transaction ends, which means concurrent
+    allocators are serialized and never see the same value.
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1")
+    period = period or _current_period()
+
+    last_value = db.execute(
+        update(DocumentCounter)
+        .where(DocumentCounter.prefix == prefix, DocumentCounter.period == period)
+        .values(last_value=DocumentCounter.last_value + count, updated_at=datetime.utcnow())
+        .returning(DocumentCounter.last_value)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if last_value is not None:
+        return last_value
+
+    seed = issued_max(db, prefix, period)
+    insert = upsert_insert(db)
+    if insert is not None:
+        stmt = insert(DocumentCounter).values(
+            prefix=prefix, period=period, last_value=seed + count, updated_at=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DocumentCounter.prefix, DocumentCounter.period],
+            set_={
+                "last_value": DocumentCounter.last_value + count,
+                "updated_at": datetime.utcnow(),
+            },
+        ).returning(DocumentCounter.last_value)
+        return db.execute(stmt).scalar_one()
+
+    # Fallback for databases without ON CONFLICT support
+    counter = (
+        db.query(DocumentCounter)
+        .filter(DocumentCounter.prefix == prefix, DocumentCounter.period == period)
+        .with_for_update()
+        .first()
+    )
+    if counter is None:
+        counter = DocumentCounter(prefix=prefix, period=period, last_value=seed)
+        db.add(counter)
+    counter.last_value += count
+    db.flush()
+    return counter.last_value
+
+
+def format_number(prefix: str, period: str, value: int) -> str:
+    """Format a document number as PREFIX-YYYYMMDD-XXXX."""
+    return f"{prefix}-{period}-{str(value).zfill(4)}"
+
+
+def next_number(db: Session, prefix: str) -> str:
+    """Allocate and format the next document number for today."""
+    period = _current_period()
+    return format_number(prefix, period, allocate(db, prefix, period=period))
+
+
+def reserve_block(db: Session, prefix: str, size: int) -> List[str]:
+    """
+    Reserve a block of `size` numbers for today in one allocation, e.g.
+    so a terminal can keep issuing invoice numbers while offline. The
+    caller should commit straight away so the counter row is released.
+    """
+    period = _current_period()
+    last = allocate(db, prefix, count=size, period=period)
+    return [format_number(prefix, period, value) for value in range(last - size + 1, last + 1)]
@@ -0,0 +1,138 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, List, Optional, Sequence, Tuple
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.exc import CompileError
+from sqlalchemy.orm import Session
+
+
+class InvalidCursorError(ValueError):
+    """Raised for a cursor token that was not produced by encode_cursor for this list."""
+
+
+class TotalCount(str, Enum):
+    EXACT = "exact"
+    ESTIMATED = "estimated"  # Planner row estimate on PostgreSQL, exact elsewhere
+    NONE = "none"
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _decode_value(value: Any):
+    if isinstance(value, dict) and value.keys() == {"dt"} and isinstance(value["dt"], str):
+        return datetime.fromisoformat(value["dt"])
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    # Anything else (lists, other objects) cannot be bound as a sort key value
+    raise InvalidCursorError("Invalid cursor")
+
+
+def _check_type(column, value: Any) -> None:
+    """Reject a decoded value the column cannot be compared with (a forged cursor)"""
+    if value is None:
+        return
+    try:
+        expected = column.type.python_type
+    except NotImplementedError:
+        return
+    if isinstance(value, bool):
+        valid = expected is bool
+    elif issubclass(expected, Enum):
+        valid = value in {member.value for member in expected}
+    elif expected in (float, Decimal):
+        valid = isinstance(value, (int, float))
+    else:
+        valid = isinstance(value, expected)
+    if not valid:
+        raise InvalidCursorError("Invalid cursor")
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Opaque token for the sort key values of the last row on a page"""
+    payload = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> Tuple:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError("Invalid cursor")
+    try:
+        return tuple(_decode_value(value) for value in values)
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+
+
+def paginate(query, columns: Sequence, cursor: Optional[str], skip: int, limit: int, descending: bool = False):
+    """
+    Order a Select or Query by `columns` (a sort key ending in the primary
+    key) and fetch one page plus one row, so keyset_page can tell whether
+    another page follows.
+
+    With a cursor the page starts after the row it encodes:
+
+        WHERE (sort_key, id) < (:sort_key, :id) ORDER BY sort_key DESC, id DESC
+
+    which an index on the sort key serves at any depth. Without one, `skip`
+    is applied as an OFFSET for existing clients.
+    """
+    order = [column.desc() if descending else column.asc() for column in columns]
+    query = query.order_by(None).order_by(*order)
+
+    if cursor:
+        values = decode_cursor(cursor, len(columns))
+        for column, value in zip(columns, values):
+            _check_type(column, value)
+        key = tuple_(*columns)
+        query = query.where(key < tuple_(*values) if descending else key > tuple_(*values))
+    elif skip:
+        query = query.offset(skip)
+
+    return query.limit(limit + 1)
+
+
+def keyset_page(rows: Sequence, columns: Sequence, limit: int) -> Tuple[List, Optional[str]]:
+    """Split the rows fetched by paginate into the page and the cursor for the next page (None on the last)"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, column.key) for column in columns])
+
+
+def count_rows(db: Session, query, mode: TotalCount = TotalCount.EXACT) -> Optional[int]:
+    """
+    Total rows matching a Select or Query (ignoring order and paging).
+    ESTIMATED asks the PostgreSQL planner (EXPLAIN, from table statistics)
+    instead of counting, which stays cheap on large tables; other databases
+    count exactly.
+    """
+    if mode == TotalCount.NONE:
+        return None
+
+    stmt = getattr(query, "statement", query).order_by(None)
+    if mode == TotalCount.ESTIMATED and db.get_bind().dialect.name == "postgresql":
+        try:
+            sql = stmt.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+        except (CompileError, NotImplementedError):
+            pass  # A parameter that cannot be inlined; count exactly
+        else:
+            plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+
+    return db.execute(select(func.count()).select_from(stmt.subquery())).scalar()
@@ -0,0 +1,51 @@
+from typing import Iterable, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.user import User
+
+# Token subject (username) -> column values of the authenticated user
+principal_cache = TTLCache(max_size=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS)
+
+_PENDING_KEY = "invalidate_principals"
+
+
+def _columns(user: User) -> dict:
+    # The password hash is never needed downstream of authentication
+    return {
+        attr.key: getattr(user, attr.key)
+        for attr in inspect(User).column_attrs
+        if attr.key != "hashed_password"
+    }
+
+
+def get_cached_principal(username: str) -> Optional[User]:
+    """
+    Return a fresh transient User built from the cached row, so requests
+    never share an instance (or drag it into their own session).
+    """
+    columns = principal_cache.get(username)
+    if columns is None:
+        return None
+    return User(**columns)
+
+
+def cache_principal(user: User) -> None:
+    principal_cache.set(user.username, _columns(user))
+
+
+def invalidate_principals(db: Session, usernames: Iterable[str]) -> None:
+    """Evict the given users once the session's transaction commits."""
+    db.info.setdefault(_PENDING_KEY, set()).update(usernames)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_after_commit(session: Session) -> None:
+    for username in session.info.pop(_PENDING_KEY, ()):
+        principal_cache.invalidate(username)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
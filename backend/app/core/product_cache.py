@@ -0,0 +1,74 @@
+import threading
+from typing import Dict, Iterable, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.counters import mark_counters_changed, INVENTORY_SUMMARY
+from app.schemas.product import Product as ProductSchema
+
+# Barcode -> serialized product, used by GET /products/barcode/{barcode}
+barcode_cache = TTLCache(max_size=settings.BARCODE_CACHE_SIZE, ttl=settings.BARCODE_CACHE_TTL_SECONDS)
+
+# Product id -> barcode it is cached under, so writes that only know the id can invalidate
+_barcodes_by_product: Dict[int, str] = {}
+_index_lock = threading.Lock()
+
+# Bumped on every eviction, so a row read before a write commits is not
+# cached after that write's eviction has run
+_generation = 0
+
+_PENDING_KEY = "invalidate_product_ids"
+
+
+def get_cached_product(barcode: str) -> Optional[ProductSchema]:
+    return barcode_cache.get(barcode)
+
+
+def cache_generation() -> int:
+    """Snapshot to take before loading a product for cache_product."""
+    with _index_lock:
+        return _generation
+
+
+def cache_product(product: ProductSchema, generation: int) -> None:
+    """Cache a product loaded after cache_generation() returned `generation`, unless a product was evicted since."""
+    with _index_lock:
+        if generation != _generation:
+            return
+        _barcodes_by_product[product.id] = product.barcode
+        barcode_cache.set(product.barcode, product)
+
+
+def evict_products(product_ids: Iterable[int]) -> None:
+    """Drop cached entries for the given products immediately."""
+    global _generation
+    with _index_lock:
+        _generation += 1
+        for product_id in product_ids:
+            barcode = _barcodes_by_product.pop(product_id, None)
+            if barcode is not None:
+                barcode_cache.invalidate(barcode)
+
+
+def invalidate_products(db: Session, product_ids: Iterable[int]) -> None:
+    """
+    Evict the given products once the session's transaction commits.
+    Evicting before commit would let a concurrent lookup re-cache the
+    old committed row; a rollback discards the pending invalidation.
+    Every product write also changes the inventory summary counters.
+    """
+    db.info.setdefault(_PENDING_KEY, set()).update(product_ids)
+    mark_counters_changed(db, INVENTORY_SUMMARY)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_after_commit(session: Session) -> None:
+    product_ids = session.info.pop(_PENDING_KEY, None)
+    if product_ids:
+        evict_products(product_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
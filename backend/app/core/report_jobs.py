@@ -0,0 +1,150 @@
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.database.session import SessionLocal, get_read_session
+from app.models.report_job import ReportJob
+
+RESULT_DIR = Path(settings.REPORT_JOB_DIR) if settings.REPORT_JOB_DIR else Path(__file__).parent.parent.parent / "report_results"
+
+ACTIVE_STATUSES = ("pending", "running")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # "spawn" so workers start from a clean interpreter rather than a
+            # fork of a threaded server process with open connections
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.REPORT_JOB_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def run_report_job(job_id: int, report: Callable, params: dict) -> None:
+    """
+    Worker process entry point: run a report function on its own read
+    session and store the JSON result under RESULT_DIR. Report functions
+    are called like the endpoints, with current_user=None.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(ReportJob, job_id)
+        if job is None:
+            return  # Purged before it started
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        db.commit()
+
+        read_db = get_read_session()
+        try:
+            # Bypass any @cached_result wrapper: this process never sees
+            # the version bumps from writes, so its cache would go stale
+            report = getattr(report, "__wrapped__", report)
+            result = report(**params, db=read_db, current_user=None)
+        except Exception as e:
+            job.status = "failed"
+            job.error_message = str(getattr(e, "detail", None) or e)
+        else:
+            RESULT_DIR.mkdir(exist_ok=True, parents=True)
+            path = RESULT_DIR / f"report_job_{job_id}.json"
+            partial = path.with_suffix(".part")
+            partial.write_text(json.dumps(jsonable_encoder(result)))
+            os.replace(partial, path)
+            job.status = "completed"
+            job.result_path = str(path)
+            job.result_size = path.stat().st_size
+        finally:
+            read_db.close()
+
+        job.finished_at = datetime.utcnow()
+        job.expires_at = job.finished_at + timedelta(hours=settings.REPORT_JOB_RESULT_TTL_HOURS)
+        db.commit()
+    finally:
+        db.close()
+
+
+def start_report_job(job: ReportJob, report: Callable) -> None:
+    """
+    Queue a committed ReportJob on the process pool. At most
+    REPORT_JOB_WORKERS jobs run at once; the rest wait in the pool's queue.
+    """
+    global _executor
+    try:
+        _get_executor().submit(run_report_job, job.id, report, dict(job.params or {}))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool
+        with _executor_lock:
+            _executor = None
+        _get_executor().submit(run_report_job, job.id, report, dict(job.params or {}))
+
+
+def purge_expired_jobs(db: Session) -> int:
+    """
+    Delete expired jobs and their result files, along with jobs that never
+    finished within the result TTL (lost to a restart). The caller commits.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(hours=settings.REPORT_JOB_RESULT_TTL_HOURS)
+    jobs = (
+        db.query(ReportJob)
+        .filter(or_(
+            ReportJob.expires_at < now,
+            and_(ReportJob.status.in_(ACTIVE_STATUSES), ReportJob.created_at < stale),
+        ))
+        .all()
+    )
+    for job in jobs:
+        if job.result_path:
+            Path(job.result_path).unlink(missing_ok=True)
+        db.delete(job)
+    return len(jobs)
+
+
+def fail_interrupted_jobs() -> int:
+    """
+    On startup, mark jobs left pending or running by the previous server
+    process as failed; their worker processes went away with it. Assumes
+    one server process runs the job pool (as the Dockerfile does).
+    Returns the number of jobs marked.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        marked = db.execute(
+            update(ReportJob)
+            .where(ReportJob.status.in_(ACTIVE_STATUSES))
+            .values(
+                status="failed",
+                error_message="Interrupted by a server restart",
+                finished_at=now,
+                expires_at=now + timedelta(hours=settings.REPORT_JOB_RESULT_TTL_HOURS),
+            )
+        ).rowcount
+        db.commit()
+        return marked
+    finally:
+        db.close()
+
+
+def shutdown_report_jobs() -> None:
+    """Stop the worker processes; queued jobs that have not started are dropped."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,155 @@
+import functools
+import inspect
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+from fastapi import Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.database.session import replica_engine
+
+# (endpoint, normalized params, data version) -> endpoint result
+# (closed periods are kept for RESULT_CACHE_CLOSED_TTL_SECONDS)
+result_cache = TTLCache(max_size=settings.RESULT_CACHE_SIZE, ttl=settings.RESULT_CACHE_OPEN_TTL_SECONDS)
+
+# Bumped after any committed write that can change report results. Results
+# for ranges that include today are keyed by `data_version`; closed ranges
+# only by `history_version`, which moves when a write lands in a past day
+# (e.g. backdated offline sales). The versions are per process: a write
+# handled by one worker does not invalidate another worker's entries,
+# which therefore only go away when their TTL runs out.
+_versions = {"data": 0, "history": 0}
+_bumped_at = {"data": float("-inf"), "history": float("-inf")}  # time.monotonic() of the last bump
+_versions_lock = threading.Lock()
+
+_PENDING_KEY = "result_cache_changes"
+_MISSING = object()
+_EXCLUDED_PARAMS = ("db", "current_user", "response")
+
+
+def _today():
+    # Sales are stamped in UTC, report ranges in local time; take the earlier day
+    return min(datetime.now().date(), datetime.utcnow().date())
+
+
+def mark_data_changed(db: Session, dates: Iterable[datetime] = (), closed: bool = False) -> None:
+    """
+    Invalidate cached report results once the session's transaction
+    commits. Pass the business dates the write touched, if any may lie
+    in a closed period, or closed=True for writes that change how past
+    periods report (e.g. renaming or recategorizing a product).
+    """
+    today = _today()
+    changes = db.info.setdefault(_PENDING_KEY, set())
+    changes.add("data")
+    if closed or any(value is not None and value.date() < today for value in dates):
+        changes.add("history")
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session: Session) -> None:
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        with _versions_lock:
+            for name in changes:
+                _versions[name] += 1
+                _bumped_at[name] = time.monotonic()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _normalize(name: str, value):
+    # "2025-01-31" and "2025-01-31T00:00:00" are the same range
+    if name.endswith("_date") and isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).isoformat()
+        except ValueError:
+            return value
+    return value
+
+
+def _is_closed(end_date: Optional[str]) -> bool:
+    if not end_date:
+        return False  # Defaults to now
+    try:
+        return datetime.fromisoformat(end_date).date() < _today()
+    except ValueError:
+        return False
+
+
+def _may_lag(db, version: str, bumped_at: float) -> bool:
+    """
+    Whether a result read on `db` may predate the last bump of `version`:
+    the session is on the replica and that bump is recent enough for the
+    replica not to have replayed it (its lag is at most
+    REPLICA_MAX_LAG_SECONDS as of the last check).
+    """
+    if replica_engine is None or not isinstance(db, Session) or db.get_bind() is not replica_engine:
+        return False
+    window = settings.REPLICA_MAX_LAG_SECONDS + settings.REPLICA_CHECK_INTERVAL_SECONDS
+    return time.monotonic() - bumped_at < window
+
+
+def cached_result(endpoint: str, end_param: Optional[str] = "end_date"):
+    """
+    Cache a report endpoint's result by endpoint name and its normalized
+    query parameters. Results for closed periods (end_param before today)
+    are keyed by the history version and expire after
+    RESULT_CACHE_CLOSED_TTL_SECONDS; open periods and endpoints without a
+    period are keyed by the data version and expire after
+    RESULT_CACHE_OPEN_TTL_SECONDS. Versions only move in the process that
+    handled the write, so the TTLs bound how long other worker processes
+    can serve a stale result. Sets an X-Cache: HIT/MISS response header.
+
+    A result read on the replica shortly after its version moved is
+    returned but not stored: the replica may not have replayed that write
+    yet, and the stale result would be cached under the new version.
+
+    Endpoints must not do per-user authorization inside the function body;
+    a cache hit skips it.
+    """
+    def decorator(func: Callable):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, response: Optional[Response] = None, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = tuple(sorted(
+                (name, _normalize(name, value))
+                for name, value in bound.arguments.items()
+                if name not in _EXCLUDED_PARAMS
+            ))
+
+            closed = end_param is not None and _is_closed(bound.arguments.get(end_param))
+            name = "history" if closed else "data"
+            with _versions_lock:
+                version = (name, _versions[name])
+                bumped_at = _bumped_at[name]
+            key = (endpoint, params, version)
+
+            value = result_cache.get(key, _MISSING)
+            if response is not None:
+                response.headers["X-Cache"] = "MISS" if value is _MISSING else "HIT"
+            if value is not _MISSING:
+                return value
+
+            value = func(*bound.args, **bound.kwargs)
+            if _may_lag(bound.arguments.get("db"), name, bumped_at):
+                return value
+            result_cache.set(key, value, ttl=settings.RESULT_CACHE_CLOSED_TTL_SECONDS if closed else None)
+            return value
+
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter("response", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=Response),
+        ])
+        return wrapper
+
+    return decorator
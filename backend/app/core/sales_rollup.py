@@ -0,0 +1,281 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+from sqlalchemy import delete, func, insert, select, and_, or_
+from sqlalchemy.orm import Session
+from app.core.numbering import upsert_insert
+from app.models.daily_sales_rollup import DailySalesRollup, DailyProductSales
+from app.models.sale import Sale, SaleItem, PaymentMethod
+
+TOTAL_FIELDS = ("subtotal", "discount_amount", "tax_amount", "total_amount")
+GROUP_FIELDS = ("day", "user_id", "payment_method")
+PRODUCT_FIELDS = ("quantity", "revenue", "cost")
+
+
+def _get(row: Union[object, Mapping], key: str):
+    return row[key] if isinstance(row, Mapping) else getattr(row, key)
+
+
+def _as_date(value) -> date:
+    # func.date() comes back as a string on SQLite
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _upsert_totals(db: Session, model, key_fields: Sequence[str], sum_fields: Sequence[str], rows: List[dict]) -> None:
+    """
+    Add pre-aggregated rows to a rollup table, one upsert per key:
+
+        INSERT ... ON CONFLICT (<keys>) DO UPDATE SET <field> = <field> + excluded.<field>, ...
+    """
+    upsert = upsert_insert(db)
+    if upsert is not None:
+        stmt = upsert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[getattr(model, field) for field in key_fields],
+            set_={
+                **{field: getattr(model, field) + getattr(stmt.excluded, field) for field in sum_fields},
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        db.execute(stmt, rows)
+        return
+
+    # Fallback for databases without ON CONFLICT support
+    for row in rows:
+        rollup = (
+            db.query(model)
+            .filter_by(**{field: row[field] for field in key_fields})
+            .with_for_update()
+            .first()
+        )
+        if rollup is None:
+            db.add(model(**row))
+        else:
+            for field in sum_fields:
+                setattr(rollup, field, getattr(rollup, field) + row[field])
+    db.flush()
+
+
+def record_sales(db: Session, sales: Iterable[Union[Sale, Mapping]]) -> None:
+    """
+    Add sales (Sale instances or sale row dicts) to daily_sales_rollup in
+    the caller's transaction, pre-aggregated per (day, cashier, payment
+    method). Each cashier normally rings up on one terminal, so
+    concurrent sales rarely contend for the same rollup row.
+    """
+    buckets: Dict[Tuple, dict] = {}
+    for sale in sales:
+        key = (
+            (_get(sale, "sale_date") or datetime.utcnow()).date(),
+            _get(sale, "user_id"),
+            _get(sale, "payment_method") or PaymentMethod.CASH,
+        )
+        bucket = buckets.setdefault(key, dict(zip(GROUP_FIELDS, key), sale_count=0, **{f: 0.0 for f in TOTAL_FIELDS}))
+        bucket["sale_count"] += 1
+        for field in TOTAL_FIELDS:
+            bucket[field] += _get(sale, field) or 0.0
+
+    if buckets:
+        now = datetime.utcnow()
+        rows = [dict(bucket, updated_at=now) for _, bucket in sorted(buckets.items(), key=lambda item: item[0][:2])]
+        _upsert_totals(db, DailySalesRollup, GROUP_FIELDS, ("sale_count", *TOTAL_FIELDS), rows)
+
+
+def record_sale_items(db: Session, items: Iterable[Mapping]) -> None:
+    """
+    Add sale item rows (as produced by calculate_sale_totals, plus the
+    sale's sale_date) to daily_product_sales in the caller's transaction.
+    """
+    buckets: Dict[Tuple, dict] = {}
+    for item in items:
+        key = ((item["sale_date"] or datetime.utcnow()).date(), item["product_id"])
+        bucket = buckets.setdefault(key, {"quantity": 0, "revenue": 0.0, "cost": 0.0})
+        bucket["quantity"] += item["quantity"]
+        bucket["revenue"] += item["line_total"]
+        bucket["cost"] += item["quantity"] * (item.get("unit_cost") or 0.0)
+
+    if buckets:
+        now = datetime.utcnow()
+        rows = [
+            dict(bucket, day=day, product_id=product_id, updated_at=now)
+            for (day, product_id), bucket in sorted(buckets.items())
+        ]
+        _upsert_totals(db, DailyProductSales, ("day", "product_id"), PRODUCT_FIELDS, rows)
+
+
+def rebuild_rollup(db: Session, start_day: Optional[date] = None, end_day: Optional[date] = None) -> int:
+    """
+    Recompute daily_sales_rollup and daily_product_sales from the sales
+    tables for the given days (inclusive; all days when omitted). Returns
+    the number of rollup rows written. The caller commits.
+    """
+    sale_day = func.date(Sale.sale_date)
+    payment_method = func.coalesce(Sale.payment_method, PaymentMethod.CASH)
+    sales = (
+        select(
+            sale_day,
+            Sale.user_id,
+            payment_method,
+            func.count(Sale.id),
+            *(func.coalesce(func.sum(getattr(Sale, field)), 0.0) for field in TOTAL_FIELDS),
+            func.current_timestamp(),
+        )
+        .group_by(sale_day, Sale.user_id, payment_method)
+    )
+    products = (
+        select(
+            sale_day,
+            SaleItem.product_id,
+            func.sum(SaleItem.quantity),
+            func.coalesce(func.sum(SaleItem.line_total), 0.0),
+            func.coalesce(func.sum(SaleItem.quantity * SaleItem.unit_cost), 0.0),
+            func.current_timestamp(),
+        )
+        .join(Sale, SaleItem.sale_id == Sale.id)
+        .group_by(sale_day, SaleItem.product_id)
+    )
+    clear_sales = delete(DailySalesRollup)
+    clear_products = delete(DailyProductSales)
+    if start_day:
+        sales = sales.where(Sale.sale_date >= datetime.combine(start_day, time.min))
+        products = products.where(Sale.sale_date >= datetime.combine(start_day, time.min))
+        clear_sales = clear_sales.where(DailySalesRollup.day >= start_day)
+        clear_products = clear_products.where(DailyProductSales.day >= start_day)
+    if end_day:
+        next_day = datetime.combine(end_day + timedelta(days=1), time.min)
+        sales = sales.where(Sale.sale_date < next_day)
+        products = products.where(Sale.sale_date < next_day)
+        clear_sales = clear_sales.where(DailySalesRollup.day <= end_day)
+        clear_products = clear_products.where(DailyProductSales.day <= end_day)
+
+    db.execute(clear_sales)
+    db.execute(clear_products)
+    written = db.execute(
+        insert(DailySalesRollup).from_select([*GROUP_FIELDS, "sale_count", *TOTAL_FIELDS, "updated_at"], sales)
+    ).rowcount
+    written += db.execute(
+        insert(DailyProductSales).from_select(["day", "product_id", *PRODUCT_FIELDS, "updated_at"], products)
+    ).rowcount
+    return written
+
+
+def _split_range(start: datetime, end: datetime, include_end: bool):
+    """
+    Split [start, end] into the whole days inside it, as (first_day,
+    end_day_exclusive) or None, and the condition selecting the raw sales
+    of the partial days at either edge.
+    """
+    first_full = datetime.combine(start.date(), time.min)
+    if first_full < start:
+        first_full += timedelta(days=1)
+    last_day_start = datetime.combine(end.date(), time.min)
+    end_condition = Sale.sale_date <= end if include_end else Sale.sale_date < end
+
+    if first_full < last_day_start:
+        raw_range = or_(
+            and_(Sale.sale_date >= start, Sale.sale_date < first_full),
+            and_(Sale.sale_date >= last_day_start, end_condition),
+        )
+        return (first_full.date(), last_day_start.date()), raw_range
+    return None, and_(Sale.sale_date >= start, end_condition)
+
+
+def _merge(results, group_by: Sequence[str], sum_fields: Sequence[str]) -> List[dict]:
+    merged: Dict[Tuple, dict] = {}
+    for rows in results:
+        for row in rows:
+            key = tuple(_as_date(row.day) if field == "day" else getattr(row, field) for field in group_by)
+            bucket = merged.setdefault(key, dict(zip(group_by, key), **{f: 0 for f in sum_fields}))
+            for field in sum_fields:
+                bucket[field] += getattr(row, field) or 0
+    return [
+        bucket for _, bucket in sorted(merged.items(), key=lambda item: tuple(str(value) for value in item[0]))
+        if bucket[sum_fields[0]]
+    ]
+
+
+def summarize_sales(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    group_by: Sequence[str] = (),
+    include_end: bool = True,
+) -> List[dict]:
+    """
+    Sales count and totals between start and end, grouped by any of
+    "day", "user_id" and "payment_method".
+
+    Whole days inside the range are read from daily_sales_rollup, so the
+    cost grows with the number of days rather than the number of sales;
+    only the partial first and last day are aggregated from raw sales.
+    Returns one dict per group with the group keys, sale_count and the
+    summed totals.
+    """
+    for field in group_by:
+        if field not in GROUP_FIELDS:
+            raise ValueError(f"Cannot group sales summary by {field!r}")
+
+    full_days, raw_range = _split_range(start, end, include_end)
+    results = []
+
+    if full_days:
+        rollup_keys = [getattr(DailySalesRollup, field).label(field) for field in group_by]
+        results.append(db.execute(
+            select(
+                *rollup_keys,
+                func.sum(DailySalesRollup.sale_count).label("sale_count"),
+                *(func.sum(getattr(DailySalesRollup, field)).label(field) for field in TOTAL_FIELDS),
+            )
+            .where(DailySalesRollup.day >= full_days[0], DailySalesRollup.day < full_days[1])
+            .group_by(*rollup_keys)
+        ))
+
+    raw_columns = {
+        "day": func.date(Sale.sale_date),
+        "user_id": Sale.user_id,
+        "payment_method": func.coalesce(Sale.payment_method, PaymentMethod.CASH),
+    }
+    results.append(db.execute(
+        select(
+            *(raw_columns[field].label(field) for field in group_by),
+            func.count(Sale.id).label("sale_count"),
+            *(func.sum(getattr(Sale, field)).label(field) for field in TOTAL_FIELDS),
+        )
+        .where(raw_range)
+        .group_by(*(raw_columns[field] for field in group_by))
+    ))
+
+    return _merge(results, group_by, ("sale_count", *TOTAL_FIELDS))
+
+
+def summarize_product_sales(db: Session, start: datetime, end: datetime) -> List[dict]:
+    """
+    Quantity, revenue and cost per product between start and end, with
+    cost taken from the unit_cost snapshot on each sale item. Whole days
+    come from daily_product_sales; partial edge days from sale_items.
+    """
+    full_days, raw_range = _split_range(start, end, include_end=True)
+    results = []
+
+    if full_days:
+        results.append(db.execute(
+            select(
+                DailyProductSales.product_id,
+                *(func.sum(getattr(DailyProductSales, field)).label(field) for field in PRODUCT_FIELDS),
+            )
+            .where(DailyProductSales.day >= full_days[0], DailyProductSales.day < full_days[1])
+            .group_by(DailyProductSales.product_id)
+        ))
+
+    results.append(db.execute(
+        select(
+            SaleItem.product_id,
+            func.sum(SaleItem.quantity).label("quantity"),
+            func.sum(SaleItem.line_total).label("revenue"),
+            func.sum(SaleItem.quantity * func.coalesce(SaleItem.unit_cost, 0)).label("cost"),
+        )
+        .join(Sale, SaleItem.sale_id == Sale.id)
+        .where(raw_range)
+        .group_by(SaleItem.product_id)
+    ))
+
+    return _merge(results, ("product_id",), PRODUCT_FIELDS)
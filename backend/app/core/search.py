@@ -0,0 +1,62 @@
+import enum
+from typing import Sequence
+from sqlalchemy import or_, func
+from app.models.product import Product
+
+
+class SearchMode(str, enum.Enum):
+    CONTAINS = "contains"  # Substring match anywhere (ILIKE '%term%'), trigram-indexed on PostgreSQL
+    PREFIX = "prefix"  # Barcode/name starts with the term, for scanners and type-ahead
+    FUZZY = "fuzzy"  # Typo-tolerant name match ranked by trigram similarity (PostgreSQL)
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_sort_key(search: str, mode: SearchMode, dialect: str):
+    """
+    Columns to page product results by (see core.pagination), matching the
+    order apply_product_search gives them; None when results are ranked by
+    similarity and can only be paged with an offset.
+    """
+    if not search:
+        return (Product.id,)
+    if mode == SearchMode.PREFIX:
+        return (Product.name, Product.id)
+    if mode == SearchMode.FUZZY and dialect == "postgresql":
+        return None
+    return (Product.id,)
+
+
+def apply_product_search(query, search: str, mode: SearchMode, dialect: str, fields: Sequence = None):
+    """
+    Filter (and for fuzzy mode, rank) a Product query or select() by a search term.
+
+    On PostgreSQL every mode is served by the indexes declared on
+    Product: pg_trgm GIN indexes for substring/fuzzy matching and a
+    varchar_pattern_ops index for barcode prefixes. Other databases
+    fall back to LIKE, and fuzzy mode degrades to a substring match.
+    """
+    fields = fields or (Product.name, Product.barcode)
+
+    if mode == SearchMode.PREFIX:
+        term = f"{_escape_like(search)}%"
+        return query.filter(
+            or_(
+                Product.barcode.like(term, escape="\\"),
+                Product.name.ilike(term, escape="\\"),
+            )
+        ).order_by(Product.name)
+
+    if mode == SearchMode.FUZZY and dialect == "postgresql":
+        # `%` is pg_trgm's similarity operator (threshold pg_trgm.similarity_threshold)
+        return query.filter(
+            or_(
+                Product.name.op("%")(search),
+                Product.barcode.like(f"{_escape_like(search)}%", escape="\\"),
+            )
+        ).order_by(func.similarity(Product.name, search).desc(), Product.name)
+
+    term = f"%{search}%"
+    return query.filter(or_(*(field.ilike(term) for field in fields)))
@@ -0,0 +1,219 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, update, case, func, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from app.core.numbering import upsert_insert
+from app.core.product_cache import invalidate_products
+from app.models.product import Product
+from app.models.store_inventory import StoreInventory
+
+
+class InsufficientStockError(Exception):
+    """Raised when a stock change would take one or more products below zero."""
+
+    def __init__(self, product_ids: List[int]):
+        self.product_ids = product_ids
+        super().__init__(f"Insufficient stock for product(s): {', '.join(map(str, product_ids))}")
+
+
+class StoreStockError(Exception):
+    """Raised when a change to total stock would leave less than the stores hold."""
+
+    def __init__(self, product_ids: List[int]):
+        self.product_ids = product_ids
+        super().__init__(f"Stock below the quantity held at stores for product(s): {', '.join(map(str, product_ids))}")
+
+
+def get_products_for_update(db: Session, product_ids: List[int]) -> Dict[int, Product]:
+    """
+    Load the given products in a single IN (...) query and lock them
+    with SELECT ... FOR UPDATE. Rows are locked in ascending id order so
+    concurrent checkouts always acquire locks in the same sequence and
+    cannot deadlock against each other.
+    """
+    unique_ids = sorted(set(product_ids))
+    if not unique_ids:
+        return {}
+
+    products = (
+        db.query(Product)
+        .filter(Product.id.in_(unique_ids))
+        .order_by(Product.id)
+        .with_for_update()
+        .all()
+    )
+    return {product.id: product for product in products}
+
+
+def store_stock_levels(db: Session, keys: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], int]:
+    """
+    Lock and return on_hand for the given (store_id, product_id) pairs in
+    one query, in primary key order. Pairs without a store_inventory row
+    are left out (the store holds none).
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return {}
+
+    rows = (
+        db.query(StoreInventory.store_id, StoreInventory.product_id, StoreInventory.on_hand)
+        .filter(tuple_(StoreInventory.store_id, StoreInventory.product_id).in_(keys))
+        .order_by(StoreInventory.store_id, StoreInventory.product_id)
+        .with_for_update()
+        .all()
+    )
+    return {(row.store_id, row.product_id): row.on_hand for row in rows}
+
+
+def allocated_stock(db: Session, product_ids: Iterable[int]) -> Dict[int, int]:
+    """
+    Units held at stores (sum of on_hand) per product, for the given
+    products that any store holds stock of. The rest of current_stock is
+    unallocated.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+
+    rows = (
+        db.query(StoreInventory.product_id, func.sum(StoreInventory.on_hand).label("on_hand"))
+        .filter(StoreInventory.product_id.in_(product_ids))
+        .group_by(StoreInventory.product_id)
+        .having(func.sum(StoreInventory.on_hand) > 0)
+        .all()
+    )
+    return {row.product_id: row.on_hand for row in rows}
+
+
+def apply_stock_changes(db: Session, changes: Dict[int, int], store_id: Optional[int] = None) -> Dict[int, int]:
+    """
+    Apply signed stock changes ({product_id: delta}) in one statement:
+
+        UPDATE products SET current_stock = current_stock + <delta>
+        WHERE id IN (...) AND current_stock + <delta> >= 0
+        RETURNING id, current_stock
+
+    The stock check and the write happen atomically in the database, so
+    two terminals selling the last unit cannot both succeed. If any row
+    is not updated the whole change set is rejected with
+    InsufficientStockError and the caller must roll back.
+
+    With a store_id the same changes are applied to that store's
+    store_inventory rows (see apply_store_stock_changes). Without one,
+    decreases may only use unallocated stock: the check becomes
+    current_stock + <delta> >= (the sum of the stores' on_hand).
+
+    Returns the new stock level per product.
+    """
+    if not changes:
+        return {}
+
+    delta = case(changes, value=Product.id, else_=0)
+    floor = 0
+    if store_id is None:
+        held = (
+            select(func.coalesce(func.sum(StoreInventory.on_hand), 0))
+            .where(StoreInventory.product_id == Product.id)
+            .scalar_subquery()
+        )
+        floor = case((delta < 0, held), else_=0)
+    stmt = (
+        update(Product)
+        .where(Product.id.in_(sorted(changes)))
+        .where(Product.current_stock + delta >= floor)
+        .values(current_stock=Product.current_stock + delta)
+        .returning(Product.id, Product.current_stock)
+        .execution_options(synchronize_session=False)
+    )
+    new_stock = {row.id: row.current_stock for row in db.execute(stmt)}
+
+    failed = sorted(set(changes) - set(new_stock))
+    if failed:
+        raise InsufficientStockError(failed)
+
+    invalidate_products(db, new_stock)
+
+    # Keep already-loaded Product instances in step with the database
+    for product_id, stock in new_stock.items():
+        product = db.identity_map.get(db.identity_key(Product, product_id))
+        if product is not None:
+            set_committed_value(product, "current_stock", stock)
+
+    if store_id is not None:
+        apply_store_stock_changes(db, store_id, changes)
+
+    return new_stock
+
+
+def apply_store_stock_changes(db: Session, store_id: int, changes: Dict[int, int]) -> Dict[int, int]:
+    """
+    Apply signed stock changes ({product_id: delta}) to one store's on_hand,
+    one statement each for decreases and increases:
+
+        UPDATE store_inventory SET on_hand = on_hand + <delta>
+        WHERE store_id = :store_id AND product_id IN (...) AND on_hand + <delta> >= 0
+
+        INSERT INTO store_inventory ... ON CONFLICT (store_id, product_id)
+        DO UPDATE SET on_hand = store_inventory.on_hand + excluded.on_hand
+
+    A decrease for a product the store has no row for, or not enough of,
+    raises InsufficientStockError. Returns the new on_hand per product.
+    """
+    decreases = {product_id: delta for product_id, delta in changes.items() if delta < 0}
+    increases = {product_id: delta for product_id, delta in changes.items() if delta > 0}
+    new_on_hand = {}
+
+    if decreases:
+        delta = case(decreases, value=StoreInventory.product_id, else_=0)
+        stmt = (
+            update(StoreInventory)
+            .where(StoreInventory.store_id == store_id)
+            .where(StoreInventory.product_id.in_(sorted(decreases)))
+            .where(StoreInventory.on_hand + delta >= 0)
+            .values(on_hand=StoreInventory.on_hand + delta)
+            .returning(StoreInventory.product_id, StoreInventory.on_hand)
+            .execution_options(synchronize_session=False)
+        )
+        new_on_hand.update({row.product_id: row.on_hand for row in db.execute(stmt)})
+        failed = sorted(set(decreases) - set(new_on_hand))
+        if failed:
+            raise InsufficientStockError(failed)
+
+    if increases:
+        now = datetime.utcnow()
+        rows = [
+            {"store_id": store_id, "product_id": product_id, "on_hand": delta, "updated_at": now}
+            for product_id, delta in sorted(increases.items())
+        ]
+        upsert = upsert_insert(db)
+        if upsert is not None:
+            stmt = upsert(StoreInventory).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[StoreInventory.store_id, StoreInventory.product_id],
+                set_={"on_hand": StoreInventory.on_hand + stmt.excluded.on_hand, "updated_at": now},
+            ).returning(StoreInventory.product_id, StoreInventory.on_hand)
+            new_on_hand.update({row.product_id: row.on_hand for row in db.execute(stmt)})
+        else:
+            # Fallback for databases without ON CONFLICT support
+            for row in rows:
+                item = db.get(StoreInventory, (store_id, row["product_id"]), with_for_update=True)
+                if item is None:
+                    item = StoreInventory(**row)
+                    db.add(item)
+                else:
+                    item.on_hand += row["on_hand"]
+                new_on_hand[row["product_id"]] = item.on_hand
+            db.flush()
+
+    return new_on_hand
+
+
+def decrement_stock(db: Session, quantities: Dict[int, int], store_id: Optional[int] = None) -> Dict[int, int]:
+    """Remove {product_id: quantity} from stock, rejecting the whole set if any product would go negative."""
+    return apply_stock_changes(db, {product_id: -quantity for product_id, quantity in quantities.items()}, store_id)
+
+
+def increment_stock(db: Session, quantities: Dict[int, int], store_id: Optional[int] = None) -> Dict[int, int]:
+    """Add {product_id: quantity} to stock."""
+    return apply_stock_changes(db, quantities, store_id)
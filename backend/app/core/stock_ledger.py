@@ -0,0 +1,116 @@
+from datetime import datetime, time
+from typing import Iterable, List, Mapping, Optional
+from sqlalchemy import select, insert, delete, func, literal
+from sqlalchemy.orm import Session
+from app.models.product import Product
+from app.models.stock_ledger import StockMovement, StockSnapshot
+
+# Movement types
+OPENING = "OPENING"  # Stock a product was created with
+SALE = "SALE"
+PURCHASE = "PURCHASE"
+TRANSFER_OUT = "TRANSFER_OUT"
+TRANSFER_IN = "TRANSFER_IN"
+ADJUSTMENT = "ADJUSTMENT"
+RETURN = "RETURN"
+STOCK_TAKE = "STOCK_TAKE"
+
+
+class NoStockHistoryError(Exception):
+    """Raised for a point in time before the first stock snapshot."""
+
+    def __init__(self, earliest: Optional[datetime]):
+        self.earliest = earliest
+        super().__init__(
+            f"Stock history starts at {earliest.isoformat()}" if earliest
+            else "No stock snapshots yet; run snapshot_stock.py"
+        )
+
+
+def movements_for(changes: Mapping[int, int], movement_type: str, **fields) -> List[dict]:
+    """Ledger rows for {product_id: signed change}; fields (reference_type, reference_id, user_id, store_id) apply to all"""
+    return [
+        {"product_id": product_id, "quantity_change": change, "movement_type": movement_type, **fields}
+        for product_id, change in sorted(changes.items())
+        if change
+    ]
+
+
+def record_movements(db: Session, movements: Iterable[dict]) -> None:
+    """Append rows to the stock ledger in one bulk INSERT, in the caller's transaction"""
+    now = datetime.utcnow()
+    rows = [{"created_at": now, **movement} for movement in movements]
+    if rows:
+        db.execute(insert(StockMovement), rows)
+
+
+def take_snapshot(db: Session, at: Optional[datetime] = None) -> int:
+    """
+    Record every product's stock as of `at` (default: the last midnight
+    UTC) as current_stock minus the ledger movements since then, in one
+    INSERT ... SELECT. Replaces an existing snapshot for the same time.
+    Returns the number of rows written. The caller commits.
+    """
+    if at is None:
+        at = datetime.combine(datetime.utcnow().date(), time.min)
+
+    since = (
+        select(StockMovement.product_id, func.sum(StockMovement.quantity_change).label("change"))
+        .where(StockMovement.created_at >= at)
+        .group_by(StockMovement.product_id)
+        .subquery()
+    )
+    db.execute(delete(StockSnapshot).where(StockSnapshot.snapshot_at == at))
+    return db.execute(insert(StockSnapshot).from_select(
+        ["snapshot_at", "product_id", "quantity"],
+        select(literal(at), Product.id, Product.current_stock - func.coalesce(since.c.change, 0))
+        .outerjoin(since, since.c.product_id == Product.id),
+    )).rowcount
+
+
+def stock_as_of(db: Session, at: datetime, product_id: Optional[int] = None, category: Optional[str] = None) -> dict:
+    """
+    Stock on hand per product at `at`: the latest snapshot at or before it
+    plus the ledger movements between the snapshot and `at`. Reads one
+    snapshot and a range of the ledger, never the whole history.
+    """
+    snapshot_at = db.scalar(select(func.max(StockSnapshot.snapshot_at)).where(StockSnapshot.snapshot_at <= at))
+    if snapshot_at is None:
+        raise NoStockHistoryError(db.scalar(select(func.min(StockSnapshot.snapshot_at))))
+
+    snapshot = (
+        select(StockSnapshot.product_id, StockSnapshot.quantity)
+        .where(StockSnapshot.snapshot_at == snapshot_at)
+        .subquery()
+    )
+    moved = (
+        select(StockMovement.product_id, func.sum(StockMovement.quantity_change).label("change"))
+        .where(StockMovement.created_at >= snapshot_at, StockMovement.created_at < at)
+        .group_by(StockMovement.product_id)
+        .subquery()
+    )
+    query = (
+        select(
+            Product.id.label("product_id"),
+            Product.barcode,
+            Product.name,
+            (func.coalesce(snapshot.c.quantity, 0) + func.coalesce(moved.c.change, 0)).label("quantity"),
+        )
+        .outerjoin(snapshot, snapshot.c.product_id == Product.id)
+        .outerjoin(moved, moved.c.product_id == Product.id)
+        # Skip products that did not exist yet
+        .where((snapshot.c.product_id.is_not(None)) | (moved.c.product_id.is_not(None)))
+        .order_by(Product.id)
+    )
+    if product_id is not None:
+        query = query.where(Product.id == product_id)
+    if category:
+        query = query.where(Product.category == category)
+
+    products = [row._asdict() for row in db.execute(query)]
+    return {
+        "as_of": at,
+        "snapshot_at": snapshot_at,
+        "total_units": sum(row["quantity"] for row in products),
+        "products": products,
+    }
@@ -0,0 +1,206 @@
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import select, insert, update, func, case, literal, desc
+from sqlalchemy.orm import Session
+from app.core.numbering import upsert_insert
+from app.core.product_cache import invalidate_products
+from app.core.stock import StoreStockError
+from app.models.product import Product
+from app.models.stock_adjustment import StockAdjustment
+from app.models.stock_take import StockTake, StockTakeCount
+from app.models.stock_ledger import StockMovement
+from app.models.store_inventory import StoreInventory
+
+STOCK_TAKE_REFERENCE = "STOCK_TAKE"
+
+
+def record_counts(db: Session, stock_take_id: int, quantities: Dict[int, int], mode: str, user_id: int) -> None:
+    """
+    Add ({product_id: quantity}, mode "add") or replace (mode "set")
+    counted quantities in one upsert:
+
+        INSERT INTO stock_take_counts ... ON CONFLICT (stock_take_id, product_id)
+        DO UPDATE SET counted_quantity = counted_quantity + excluded.counted_quantity
+    """
+    if not quantities:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {"stock_take_id": stock_take_id, "product_id": product_id, "counted_quantity": quantity,
+         "counted_by": user_id, "updated_at": now}
+        for product_id, quantity in sorted(quantities.items())
+    ]
+
+    upsert = upsert_insert(db)
+    if upsert is not None:
+        stmt = upsert(StockTakeCount)
+        counted = stmt.excluded.counted_quantity
+        if mode == "add":
+            counted = StockTakeCount.counted_quantity + counted
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[StockTakeCount.stock_take_id, StockTakeCount.product_id],
+                set_={"counted_quantity": counted, "counted_by": stmt.excluded.counted_by,
+                      "updated_at": stmt.excluded.updated_at},
+            ),
+            rows,
+        )
+        return
+
+    # Fallback for databases without ON CONFLICT support
+    for row in rows:
+        count = db.get(StockTakeCount, (stock_take_id, row["product_id"]), with_for_update=True)
+        if count is None:
+            db.add(StockTakeCount(**row))
+        else:
+            count.counted_quantity = count.counted_quantity + row["counted_quantity"] if mode == "add" else row["counted_quantity"]
+            count.counted_by = user_id
+    db.flush()
+
+
+def variance_query(stock_take_id: int, applied: bool = False):
+    """
+    Per-product variances of a stock take: for an open one, counted
+    products whose count differs from current_stock; once applied, the
+    stock adjustments it wrote.
+    """
+    if applied:
+        return (
+            select(
+                StockAdjustment.product_id,
+                Product.barcode,
+                Product.name,
+                StockAdjustment.previous_stock,
+                StockAdjustment.new_stock.label("counted_quantity"),
+                StockAdjustment.quantity_change.label("variance"),
+                StockAdjustment.cost_impact.label("value_variance"),
+            )
+            .join(Product, Product.id == StockAdjustment.product_id)
+            .where(StockAdjustment.reference_type == STOCK_TAKE_REFERENCE, StockAdjustment.reference_id == stock_take_id)
+        )
+
+    variance = StockTakeCount.counted_quantity - Product.current_stock
+    return (
+        select(
+            Product.id.label("product_id"),
+            Product.barcode,
+            Product.name,
+            Product.current_stock.label("previous_stock"),
+            StockTakeCount.counted_quantity.label("counted_quantity"),
+            variance.label("variance"),
+            (variance * Product.cost_price).label("value_variance"),
+        )
+        .join(Product, Product.id == StockTakeCount.product_id)
+        .where(StockTakeCount.stock_take_id == stock_take_id, StockTakeCount.counted_quantity != Product.current_stock)
+    )
+
+
+def variance_summary(db: Session, stock_take_id: int, applied: bool = False, limit: int = 20) -> dict:
+    """Variance totals in one aggregate pass, plus the `limit` largest variances by units"""
+    variances = variance_query(stock_take_id, applied).subquery()
+    totals = db.execute(
+        select(
+            func.count(variances.c.product_id).label("adjusted_products"),
+            func.coalesce(func.sum(case((variances.c.variance > 0, variances.c.variance), else_=0)), 0).label("units_over"),
+            func.coalesce(func.sum(case((variances.c.variance < 0, -variances.c.variance), else_=0)), 0).label("units_short"),
+            func.coalesce(func.sum(variances.c.variance), 0).label("units_variance"),
+            func.coalesce(func.sum(variances.c.value_variance), 0.0).label("value_variance"),
+        )
+    ).one()
+    counted = db.scalar(
+        select(func.count()).select_from(StockTakeCount).where(StockTakeCount.stock_take_id == stock_take_id)
+    )
+    largest = db.execute(
+        select(variances)
+        .order_by(desc(func.abs(variances.c.variance)), variances.c.product_id)
+        .limit(limit)
+    )
+    return {
+        "counted_products": counted,
+        **totals._asdict(),
+        "largest_variances": [row._asdict() for row in largest],
+    }
+
+
+def close_stock_take(db: Session, stock_take: StockTake, user_id: int, zero_uncounted: bool = False) -> List[int]:
+    """
+    Apply an open stock take in the caller's transaction, set-based:
+
+    1. (zero_uncounted) count active, uncounted products with stock as 0,
+       except products held at stores
+    2. lock the counted products' rows (ascending id, like checkout)
+    3. INSERT INTO stock_adjustments ... SELECT the variances
+    4. copy those adjustments into the stock ledger
+    5. UPDATE products SET current_stock = <counted> for those products
+
+    Counts are of total stock, so a variance is taken up by the unallocated
+    stock; a count below what the stores hold raises StoreStockError (adjust
+    those stores' stock instead). Returns the ids of the products whose
+    stock changed. The caller commits.
+    """
+    take_id = stock_take.id
+    now = datetime.utcnow()
+    counted_ids = select(StockTakeCount.product_id).where(StockTakeCount.stock_take_id == take_id)
+
+    if zero_uncounted:
+        db.execute(insert(StockTakeCount).from_select(
+            ["stock_take_id", "product_id", "counted_quantity", "counted_by", "updated_at"],
+            select(literal(take_id), Product.id, literal(0), literal(user_id), literal(now))
+            .where(Product.is_active == 1, Product.current_stock != 0, Product.id.not_in(counted_ids),
+                   Product.id.not_in(select(StoreInventory.product_id).where(StoreInventory.on_hand > 0))),
+        ))
+
+    db.execute(select(Product.id).where(Product.id.in_(counted_ids)).order_by(Product.id).with_for_update())
+
+    variances = variance_query(take_id).subquery()
+    allocated = (
+        select(StoreInventory.product_id, func.sum(StoreInventory.on_hand).label("on_hand"))
+        .group_by(StoreInventory.product_id)
+        .subquery()
+    )
+    below_stores = db.scalars(
+        select(variances.c.product_id)
+        .join(allocated, allocated.c.product_id == variances.c.product_id)
+        .where(variances.c.counted_quantity < allocated.c.on_hand)
+        .order_by(variances.c.product_id)
+    ).all()
+    if below_stores:
+        raise StoreStockError(below_stores)
+    db.execute(insert(StockAdjustment).from_select(
+        ["product_id", "user_id", "adjustment_type", "quantity_change", "previous_stock", "new_stock",
+         "reference_type", "reference_id", "reason", "cost_impact", "created_at"],
+        select(
+            variances.c.product_id, literal(user_id), literal("CORRECTION"), variances.c.variance,
+            variances.c.previous_stock, variances.c.counted_quantity, literal(STOCK_TAKE_REFERENCE),
+            literal(take_id), literal(f"Stock take #{take_id}"), variances.c.value_variance, literal(now),
+        ),
+    ))
+
+    adjustments = (StockAdjustment.reference_type == STOCK_TAKE_REFERENCE, StockAdjustment.reference_id == take_id)
+    db.execute(insert(StockMovement).from_select(
+        ["product_id", "quantity_change", "movement_type", "reference_type", "reference_id", "user_id", "created_at"],
+        select(
+            StockAdjustment.product_id, StockAdjustment.quantity_change, literal(STOCK_TAKE_REFERENCE),
+            literal(STOCK_TAKE_REFERENCE), literal(take_id), literal(user_id), literal(now),
+        ).where(*adjustments),
+    ))
+
+    adjusted = select(StockAdjustment.product_id).where(*adjustments)
+    counted_quantity = (
+        select(StockTakeCount.counted_quantity)
+        .where(StockTakeCount.stock_take_id == take_id, StockTakeCount.product_id == Product.id)
+        .scalar_subquery()
+    )
+    changed = db.scalars(
+        update(Product)
+        .where(Product.id.in_(adjusted))
+        .values(current_stock=counted_quantity)
+        .returning(Product.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    invalidate_products(db, changed)
+
+    stock_take.status = "closed"
+    stock_take.closed_by = user_id
+    stock_take.closed_at = now
+    return changed
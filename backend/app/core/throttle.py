@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Hashable, Optional
+
+
+class FailureThrottle:
+    """
+    Thread-safe sliding-window failure counter.
+
+    Once `limit` failures are recorded for a key within `window` seconds,
+    retry_after() reports how long the key must wait. Keys with no recent
+    failures are dropped so memory stays bounded by recent offenders.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._failures: Dict[Hashable, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, key: Hashable, now: float) -> Optional[Deque[float]]:
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def retry_after(self, key: Hashable) -> Optional[float]:
+        """Seconds until `key` may try again, or None if it is not throttled."""
+        now = time.monotonic()
+        with self._lock:
+            failures = self._prune(key, now)
+            if failures is None or len(failures) < self.limit:
+                return None
+            return failures[-self.limit] + self.window - now
+
+    def record_failure(self, key: Hashable) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._failures) >= self.max_keys:
+                for stale_key in list(self._failures):
+                    self._prune(stale_key, now)
+            else:
+                self._prune(key, now)
+            failures = self._failures.setdefault(key, deque())
+            failures.append(now)
+            # Only the newest `limit` timestamps matter
+            if len(failures) > self.limit:
+                failures.popleft()
+
+    def reset(self, key: Hashable) -> None:
+        with self._lock:
+            self._failures.pop(key, None)
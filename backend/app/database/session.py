@@ -1,4 +1,11 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import AsyncGenerator, Optional
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -20,3 +27,128 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Async drivers used when ASYNC_DATABASE_URL is not set explicitly
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def get_async_database_url(url: str, async_url: Optional[str] = None) -> str:
+    """Derive the async driver URL from DATABASE_URL (e.g. postgresql:// -> postgresql+asyncpg://)"""
+    if async_url:
+        return async_url
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}', set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+# Create async database engine for endpoints that run on the event loop
+async_engine = create_async_engine(
+    get_async_database_url(settings.DATABASE_URL, settings.ASYNC_DATABASE_URL),
+    pool_pre_ping=True,
+    echo=False
+)
+
+# Objects stay usable after commit; lazy loads are not available on AsyncSession
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Dependency to get async DB session
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Read replica (optional). Sessions from get_read_db / get_async_read_db use
+# it while it answers and its replay lag is within REPLICA_MAX_LAG_SECONDS,
+# otherwise they fall back to the primary.
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+def replica_connect_args(url: str) -> dict:
+    """Keep replica connections read-only and fail fast when it is down"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "postgresql":
+        return {}
+    if parsed.get_driver_name() == "asyncpg":
+        return {"timeout": 3, "server_settings": {"default_transaction_read_only": "on"}}
+    return {"connect_timeout": 3, "options": "-c default_transaction_read_only=on"}
+
+replica_engine = None
+async_replica_engine = None
+ReadSessionLocal = SessionLocal
+AsyncReadSessionLocal = AsyncSessionLocal
+
+if settings.DATABASE_REPLICA_URL:
+    async_replica_url = get_async_database_url(settings.DATABASE_REPLICA_URL, settings.ASYNC_DATABASE_REPLICA_URL)
+    replica_engine = create_engine(
+        settings.DATABASE_REPLICA_URL,
+        pool_pre_ping=True,
+        connect_args=replica_connect_args(settings.DATABASE_REPLICA_URL),
+        echo=False
+    )
+    async_replica_engine = create_async_engine(
+        async_replica_url,
+        pool_pre_ping=True,
+        connect_args=replica_connect_args(async_replica_url),
+        echo=False
+    )
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    AsyncReadSessionLocal = async_sessionmaker(
+        async_replica_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+
+_replica_state = {"checked_at": float("-inf"), "usable": False}
+_replica_check_lock = threading.Lock()
+
+def _replica_check_due() -> bool:
+    return time.monotonic() - _replica_state["checked_at"] >= settings.REPLICA_CHECK_INTERVAL_SECONDS
+
+def replica_usable() -> bool:
+    """
+    Whether reads should go to the replica. The lag check runs at most once
+    per REPLICA_CHECK_INTERVAL_SECONDS; concurrent callers use the last result.
+    """
+    if replica_engine is None:
+        return False
+    if _replica_check_due() and _replica_check_lock.acquire(blocking=False):
+        try:
+            try:
+                with replica_engine.connect() as conn:
+                    lag = conn.execute(REPLICA_LAG_SQL).scalar() if replica_engine.dialect.name == "postgresql" else 0
+                _replica_state["usable"] = float(lag) <= settings.REPLICA_MAX_LAG_SECONDS
+            except SQLAlchemyError:
+                _replica_state["usable"] = False
+            _replica_state["checked_at"] = time.monotonic()
+        finally:
+            _replica_check_lock.release()
+    return _replica_state["usable"]
+
+def get_read_session():
+    """New session on the replica when usable, else on the primary. Only for reads."""
+    return ReadSessionLocal() if replica_usable() else SessionLocal()
+
+# Dependency to get a read-only DB session (replica with primary fallback)
+def get_read_db():
+    db = get_read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency to get a read-only async DB session (replica with primary fallback)
+async def get_async_read_db() -> AsyncGenerator[AsyncSession, None]:
+    if replica_engine is not None and _replica_check_due():
+        await run_in_threadpool(replica_usable)
+    factory = AsyncReadSessionLocal if replica_usable() else AsyncSessionLocal
+    async with factory() as db:
+        yield db
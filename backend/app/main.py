@@ -1,12 +1,15 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api.v1.api import api_router
-from app.database.session import engine
+from app.database.session import engine, async_engine, async_replica_engine
 from app.database.base import Base
+from app.core.report_jobs import fail_interrupted_jobs, shutdown_report_jobs
+from app.core.pagination import InvalidCursorError
 
 # Import all models to register them with Base
-from app.models import user, product, supplier, customer, sale, purchase, activity_log, store, inventory_transfer, backup
+from app.models import user, product, supplier, customer, sale, purchase, activity_log, store, inventory_transfer, backup, document_counter, idempotency_key, user_session, daily_sales_rollup, report_job, stock_adjustment, stock_take, stock_ledger, store_inventory
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -27,11 +30,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Keyset pagination token
 )
 
 # Include API routes
 app.include_router(api_router, prefix="/api/v1")
 
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursorError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+
+@app.on_event("startup")
+def recover_report_jobs():
+    fail_interrupted_jobs()
+
+@app.on_event("shutdown")
+def stop_report_jobs():
+    shutdown_report_jobs()
+
 @app.get("/")
 async def root():
     return {
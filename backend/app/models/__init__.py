@@ -9,6 +9,14 @@ from app.models.activity_log import ActivityLog
 from app.models.store import Store
 from app.models.inventory_transfer import InventoryTransfer
 from app.models.backup import Backup
+from app.models.document_counter import DocumentCounter
+from app.models.idempotency_key import IdempotencyKey
+from app.models.user_session import UserSession
+from app.models.daily_sales_rollup import DailySalesRollup, DailyProductSales
+from app.models.report_job import ReportJob
+from app.models.stock_take import StockTake, StockTakeCount
+from app.models.stock_ledger import StockMovement, StockSnapshot
+from app.models.store_inventory import StoreInventory
 
 __all__ = [
     "User",
@@ -20,5 +28,16 @@ __all__ = [
     "ActivityLog",
     "Store",
     "InventoryTransfer",
-    "Backup"
+    "Backup",
+    "DocumentCounter",
+    "IdempotencyKey",
+    "UserSession",
+    "DailySalesRollup",
+    "DailyProductSales",
+    "ReportJob",
+    "StockTake",
+    "StockTakeCount",
+    "StockMovement",
+    "StockSnapshot",
+    "StoreInventory"
 ]
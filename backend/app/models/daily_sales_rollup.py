@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, Float, Date, DateTime, ForeignKey, Enum
+from datetime import datetime
+from app.database.base import Base
+from app.models.sale import PaymentMethod
+
+class DailySalesRollup(Base):
+    """Per day, cashier and payment method sales totals, kept in step with the sales table"""
+    __tablename__ = "daily_sales_rollup"
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    payment_method = Column(Enum(PaymentMethod), primary_key=True)
+    
+    sale_count = Column(Integer, nullable=False, default=0)
+    subtotal = Column(Float, nullable=False, default=0.0)
+    discount_amount = Column(Float, nullable=False, default=0.0)
+    tax_amount = Column(Float, nullable=False, default=0.0)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DailyProductSales(Base):
+    """Per day and product quantity, revenue and cost (from the sale items' unit_cost snapshot)"""
+    __tablename__ = "daily_product_sales"
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True, index=True)
+    
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)  # Sum of line totals
+    cost = Column(Float, nullable=False, default=0.0)  # Sum of quantity * unit_cost
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime
+from app.database.base import Base
+
+class DocumentCounter(Base):
+    __tablename__ = "document_counters"
+
+    # One row per document prefix per day, e.g. ("INV", "20250131")
+    prefix = Column(String(20), primary_key=True)
+    period = Column(String(8), primary_key=True)
+    last_value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
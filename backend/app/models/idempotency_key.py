@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, UniqueConstraint
+from datetime import datetime
+from app.database.base import Base
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "scope", "key", name="uq_idempotency_keys_user_scope_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(255), nullable=False)  # Client supplied Idempotency-Key header
+    scope = Column(String(50), nullable=False)  # Endpoint the key was used on, e.g. "create_sale"
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # SHA-256 of the request payload
+    
+    # Stored response, replayed on retries
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(JSON, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
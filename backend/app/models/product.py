@@ -1,10 +1,27 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index, DDL, event, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database.base import Base
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Search indexes (PostgreSQL only): trigram GIN for ILIKE '%term%' and
+        # similarity matching, pattern ops for barcode prefix lookups
+        Index("ix_products_name_trgm", "name", postgresql_using="gin",
+              postgresql_ops={"name": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_products_barcode_trgm", "barcode", postgresql_using="gin",
+              postgresql_ops={"barcode": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_products_description_trgm", "description", postgresql_using="gin",
+              postgresql_ops={"description": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_products_barcode_pattern", "barcode",
+              postgresql_ops={"barcode": "varchar_pattern_ops"}).ddl_if(dialect="postgresql"),
+        # Low stock alerts: only the handful of active products at or below
+        # their minimum are indexed, so stock updates rarely touch it
+        Index("ix_products_low_stock", "current_stock",
+              postgresql_where=text("is_active = 1 AND current_stock <= minimum_stock"),
+              sqlite_where=text("is_active = 1 AND current_stock <= minimum_stock")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     barcode = Column(String(100), unique=True, nullable=False, index=True)
@@ -37,3 +54,11 @@ class Product(Base):
     supplier = relationship("Supplier", back_populates="products")
     sale_items = relationship("SaleItem", back_populates="product")
     purchase_items = relationship("PurchaseItem", back_populates="product")
+
+
+# The trigram indexes need the pg_trgm extension
+event.listen(
+    Product.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
@@ -9,6 +9,7 @@ class Purchase(Base):
     id = Column(Integer, primary_key=True, index=True)
     purchase_order_number = Column(String(50), unique=True, nullable=False, index=True)
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False)
+    store_id = Column(Integer, ForeignKey("stores.id"), nullable=True)  # Receiving store
     
     # Financial
     total_amount = Column(Float, nullable=False)
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, BigInteger, ForeignKey, JSON
+from datetime import datetime
+from app.database.base import Base
+
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    report = Column(String(50), nullable=False)  # e.g. "tax-report"
+    params = Column(JSON, nullable=False, default=dict)  # Report query parameters
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    
+    # Result file (JSON), removed with the row once expired
+    result_path = Column(String(500), nullable=True)
+    result_size = Column(BigInteger, nullable=True)  # Size in bytes
+    error_message = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True, index=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, String, Float, Numeric, DateTime, ForeignKey, Enum, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -12,6 +12,12 @@ class PaymentMethod(str, enum.Enum):
 
 class Sale(Base):
     __tablename__ = "sales"
+    __table_args__ = (
+        # Date range scans; on PostgreSQL the included columns let sales
+        # summaries (see core/sales_rollup.py) run as index-only scans
+        Index("ix_sales_sale_date", "sale_date",
+              postgresql_include=["user_id", "payment_method", "subtotal", "discount_amount", "tax_amount", "total_amount"]),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     invoice_number = Column(String(50), unique=True, nullable=False, index=True)
@@ -19,6 +25,7 @@ class Sale(Base):
     # References
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # Cashier
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=True)
+    store_id = Column(Integer, ForeignKey("stores.id"), nullable=True)  # Store the stock left from
     
     # Financial Details
     subtotal = Column(Float, nullable=False)  # Before tax and discount
@@ -34,7 +41,7 @@ class Sale(Base):
     notes = Column(Text, nullable=True)
     
     # Timestamps
-    sale_date = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    sale_date = Column(DateTime, default=datetime.utcnow, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -45,6 +52,10 @@ class Sale(Base):
 
 class SaleItem(Base):
     __tablename__ = "sale_items"
+    __table_args__ = (
+        Index("idx_sale_items_sale", "sale_id"),  # Loading a sale's items
+        Index("ix_sale_items_product_sale", "product_id", "sale_id"),  # Per-product sales joined to sales
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     sale_id = Column(Integer, ForeignKey("sales.id"), nullable=False)
@@ -61,6 +72,7 @@ class SaleItem(Base):
     tax_rate = Column(Float, default=0.0)  # GST rate for this item
     tax_amount = Column(Float, default=0.0)  # GST amount for this line
     line_total = Column(Float, nullable=False)  # Total for this line item
+    unit_cost = Column(Numeric(10, 2, asdecimal=False), nullable=True)  # Product cost price at time of sale (for margins)
     
     # Relationships
     sale = relationship("Sale", back_populates="items")
@@ -1,10 +1,13 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database.base import Base
 
 class StockAdjustment(Base):
     __tablename__ = "stock_adjustments"
+    __table_args__ = (
+        Index("ix_stock_adjustments_product_created", "product_id", "created_at"),  # A product's history, newest first
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
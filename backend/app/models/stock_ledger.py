@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from datetime import datetime
+from app.database.base import Base
+
+class StockMovement(Base):
+    """Append-only ledger of every stock change; rows are never updated or deleted"""
+    __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("ix_stock_movements_product_created", "product_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    store_id = Column(Integer, ForeignKey("stores.id"), nullable=True)  # Set for store transfers
+    quantity_change = Column(Integer, nullable=False)  # Positive for increase, negative for decrease
+    movement_type = Column(String(20), nullable=False)  # OPENING, SALE, PURCHASE, TRANSFER_OUT, TRANSFER_IN, ADJUSTMENT, RETURN, STOCK_TAKE
+    
+    # What caused it, e.g. ("SALE", sale.id) or ("STOCK_ADJUSTMENT", adjustment.id)
+    reference_type = Column(String(50), nullable=True)
+    reference_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class StockSnapshot(Base):
+    """Stock on hand per product at a point in time (normally midnight UTC), taken nightly"""
+    __tablename__ = "stock_snapshots"
+
+    snapshot_at = Column(DateTime, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
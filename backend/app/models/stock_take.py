@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, Index, text
+from datetime import datetime
+from app.database.base import Base
+
+class StockTake(Base):
+    """A stock count session; counts are applied to stock in one pass when it is closed"""
+    __tablename__ = "stock_takes"
+    __table_args__ = (
+        # At most one open stock take, even when two are opened at once
+        Index("ux_stock_takes_open", "status", unique=True,
+              postgresql_where=text("status = 'open'"),
+              sqlite_where=text("status = 'open'")),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), nullable=False, default="open", index=True)  # open, closed, cancelled
+    notes = Column(Text, nullable=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    closed_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    
+    # Variance summary, filled in on close
+    counted_products = Column(Integer, nullable=True)
+    adjusted_products = Column(Integer, nullable=True)
+    units_variance = Column(Integer, nullable=True)  # Net change in units
+    value_variance = Column(Float, nullable=True)  # Net change at cost price
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    closed_at = Column(DateTime, nullable=True)
+
+
+class StockTakeCount(Base):
+    """Counted quantity of one product in a stock take"""
+    __tablename__ = "stock_take_counts"
+
+    stock_take_id = Column(Integer, ForeignKey("stock_takes.id", ondelete="CASCADE"), primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    counted_quantity = Column(Integer, nullable=False, default=0)
+    counted_by = Column(Integer, ForeignKey("users.id"), nullable=True)  # Last scanner to report it
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
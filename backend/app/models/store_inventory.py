@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index, text
+from datetime import datetime
+from app.database.base import Base
+
+class StoreInventory(Base):
+    """
+    Stock on hand per store. Product.current_stock stays the total across
+    all locations: the stores' on_hand plus stock not held at any store
+    (unallocated), such as opening stock or goods received without a store.
+    Changes without a store_id only change the total, and decreases may
+    not take it below what the stores hold.
+    """
+    __tablename__ = "store_inventory"
+    __table_args__ = (
+        # Per-store low stock lists: only rows at or below their minimum are indexed
+        Index("ix_store_inventory_low_stock", "store_id", "on_hand",
+              postgresql_where=text("on_hand <= minimum"),
+              sqlite_where=text("on_hand <= minimum")),
+    )
+
+    store_id = Column(Integer, ForeignKey("stores.id"), primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True, index=True)
+    on_hand = Column(Integer, nullable=False, default=0)
+    minimum = Column(Integer, nullable=False, default=0)  # Store-level reorder point
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
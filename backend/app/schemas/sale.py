@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timezone
 from app.models.sale import PaymentMethod
 
 # Customer minimal info for sales
@@ -50,12 +50,14 @@ class SaleBase(BaseModel):
 class SaleCreate(SaleBase):
     items: List[SaleItemCreate]
     discount_amount: Optional[float] = 0.0
+    store_id: Optional[int] = None  # Also draw the stock from this store's inventory
 
 class SaleInDB(BaseModel):
     id: int
     invoice_number: str
     user_id: int
     customer_id: Optional[int]
+    store_id: Optional[int] = None
     subtotal: float
     discount_amount: float
     tax_amount: float
@@ -72,3 +74,32 @@ class SaleInDB(BaseModel):
 class Sale(SaleInDB):
     items: List[SaleItem] = []
     customer: Optional[CustomerInfo] = None
+
+# Offline batch upload Schemas
+class OfflineSaleCreate(SaleCreate):
+    invoice_number: Optional[str] = None  # Pre-reserved via /sales/invoice-numbers/reserve
+    sale_date: Optional[datetime] = None  # When the sale was rung up on the terminal
+
+    @field_validator("sale_date")
+    @classmethod
+    def naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Sales are stored in naive UTC
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+class SaleBatchCreate(BaseModel):
+    sales: List[OfflineSaleCreate]
+
+class SaleBatchResult(BaseModel):
+    index: int  # Position of the sale in the uploaded batch
+    status: str  # created, duplicate, failed
+    invoice_number: Optional[str] = None
+    sale_id: Optional[int] = None
+    error: Optional[str] = None
+
+class SaleBatchResponse(BaseModel):
+    created: int
+    duplicates: int
+    failed: int
+    results: List[SaleBatchResult]
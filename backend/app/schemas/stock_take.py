@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Literal
+
+class StockTakeCreate(BaseModel):
+    notes: Optional[str] = None
+
+class StockTakeCountItem(BaseModel):
+    product_id: Optional[int] = None  # Either product_id or barcode
+    barcode: Optional[str] = None
+    quantity: int = Field(ge=0)
+
+    @model_validator(mode="after")
+    def one_product_key(self) -> "StockTakeCountItem":
+        if (self.product_id is None) == (self.barcode is None):
+            raise ValueError("Give either product_id or barcode")
+        return self
+
+class StockTakeCounts(BaseModel):
+    counts: List[StockTakeCountItem]
+    mode: Literal["add", "set"] = "add"  # add: scans accumulate; set: recount replaces
+
+class StockTakeClose(BaseModel):
+    zero_uncounted: bool = False  # Full count: active products nobody counted go to zero
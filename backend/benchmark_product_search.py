@@ -0,0 +1,83 @@
+"""Benchmark product search modes against the plain ILIKE path
+
+Seeds synthetic products inside a transaction, times each search mode
+and rolls everything back, so it is safe to point at a real database:
+
+    python benchmark_product_search.py [product_count] [repeats]
+"""
+import random
+import statistics
+import string
+import sys
+import time
+from sqlalchemy import select, or_, text
+from app.database.session import SessionLocal
+from app.models.product import Product
+from app.core.search import SearchMode, apply_product_search
+
+WORDS = ["whisky", "vodka", "perfume", "chocolate", "cigar", "gin", "rum", "watch",
+         "sunglasses", "lipstick", "cognac", "wine", "truffle", "cologne", "tequila"]
+
+# (label, search term, mode)
+CASES = [
+    ("ilike baseline", "choco", None),
+    ("contains", "choco", SearchMode.CONTAINS),
+    ("prefix barcode", "BENCH-0001", SearchMode.PREFIX),
+    ("fuzzy typo", "chocolat trufle", SearchMode.FUZZY),
+]
+
+
+def seed(db, count):
+    rows = []
+    for i in range(count):
+        name = " ".join(random.sample(WORDS, 2)).title() + " " + "".join(random.choices(string.ascii_uppercase, k=4))
+        rows.append({
+            "barcode": f"BENCH-{i:07d}",
+            "name": name,
+            "description": f"{name} imported",
+            "category": random.choice(WORDS),
+            "cost_price": 10.0,
+            "selling_price": 15.0,
+            "current_stock": 10,
+            "minimum_stock": 1,
+            "is_active": 1,
+        })
+    db.execute(Product.__table__.insert(), rows)
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("ANALYZE products"))
+
+
+def build_query(term, mode, dialect):
+    query = select(Product.id).where(Product.is_active == 1)
+    if mode is None:
+        return query.where(or_(Product.name.ilike(f"%{term}%"), Product.barcode.ilike(f"%{term}%")))
+    return apply_product_search(query, term, mode, dialect)
+
+
+def run(count=50000, repeats=20):
+    db = SessionLocal()
+    dialect = db.bind.dialect.name
+    try:
+        print(f"Seeding {count} products ({dialect})...")
+        seed(db, count)
+        for label, term, mode in CASES:
+            query = build_query(term, mode, dialect).limit(100)
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                rows = db.execute(query).all()
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{label:16} {len(rows):4} rows  median {statistics.median(timings):8.2f} ms  "
+                  f"p95 {sorted(timings)[int(repeats * 0.95) - 1]:8.2f} ms")
+            if dialect == "postgresql":
+                plan = db.execute(text("EXPLAIN " + str(query.compile(
+                    dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})))).all()
+                print("                 plan: " + " | ".join(row[0].strip() for row in plan[:3]))
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(*args)
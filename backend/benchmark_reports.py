@@ -0,0 +1,143 @@
+"""Benchmark the sales and tax reports against the old load-everything path
+
+Seeds synthetic sales inside a transaction, runs the reports both ways,
+checks that the numbers match and prints latency and peak Python memory.
+Everything is rolled back, so it is safe to point at a real database:
+
+    python benchmark_reports.py [sale_count]
+"""
+import math
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from app.database.session import SessionLocal
+from app.models.product import Product
+from app.models.sale import Sale, SaleItem, PaymentMethod
+from app.models.user import User
+from app.core.sales_rollup import rebuild_rollup
+from app.api.v1.endpoints.reports import get_sales_report, get_tax_report
+
+TAX_RATES = [0.0, 5.0, 12.0, 18.0, 28.0]
+
+
+def seed(db, count, start):
+    user = db.query(User).first()
+    if user is None:
+        raise SystemExit("Create a user first (python create_admin.py)")
+    product = Product(barcode=f"BENCH-{time.time_ns()}", name="Benchmark product", category="Benchmark", cost_price=50.0, selling_price=100.0)
+    db.add(product)
+    db.flush()
+
+    seconds = 30 * 24 * 3600
+    for offset in range(0, count, 5000):
+        sales, items = [], []
+        for i in range(offset, min(offset + 5000, count)):
+            rate = random.choice(TAX_RATES)
+            quantity = random.randint(1, 5)
+            subtotal = quantity * 100.0
+            tax = round(subtotal * rate / 100, 2)
+            sales.append({
+                "invoice_number": f"BENCH-{i:08d}",
+                "user_id": user.id,
+                "subtotal": subtotal,
+                "discount_amount": 0.0,
+                "tax_amount": tax,
+                "total_amount": subtotal + tax,
+                "payment_method": random.choice(list(PaymentMethod)),
+                "sale_date": start + timedelta(seconds=random.randint(0, seconds)),
+            })
+            items.append({
+                "product_id": product.id, "product_name": product.name, "barcode": product.barcode,
+                "quantity": quantity, "unit_price": 100.0, "discount": 0.0,
+                "tax_rate": rate, "tax_amount": tax, "line_total": subtotal + tax,
+            })
+        ids = db.scalars(Sale.__table__.insert().returning(Sale.id, sort_by_parameter_order=True), sales).all()
+        db.execute(SaleItem.__table__.insert(), [dict(item, sale_id=sale_id) for sale_id, item in zip(ids, items)])
+    rebuild_rollup(db)
+
+
+def old_report(db, start, end):
+    """The previous implementation: load every Sale and SaleItem and sum in Python"""
+    sales = db.query(Sale).filter(Sale.sale_date >= start, Sale.sale_date <= end).all()
+    payment_methods = {}
+    for sale in sales:
+        payment_methods[sale.payment_method] = payment_methods.get(sale.payment_method, 0) + sale.total_amount
+    tax_by_rate = {}
+    items = db.query(SaleItem).join(Sale).filter(Sale.sale_date >= start, Sale.sale_date <= end).all()
+    for item in items:
+        rate = tax_by_rate.setdefault(item.tax_rate or 0, [0, 0])
+        rate[0] += item.quantity * item.unit_price - item.discount
+        rate[1] += item.tax_amount
+    return {
+        "total_sales": len(sales),
+        "total_revenue": sum(s.total_amount for s in sales),
+        "total_tax": sum(s.tax_amount for s in sales),
+        "payment_methods": payment_methods,
+        "tax_by_rate": tax_by_rate,
+    }
+
+
+def new_report(db, start, end):
+    sales = get_sales_report(start_date=start.isoformat(), end_date=end.isoformat(), db=db, current_user=None)
+    tax = get_tax_report(start_date=start.isoformat(), end_date=end.isoformat(), db=db, current_user=None)
+    return {
+        "total_sales": sales["summary"]["total_sales"],
+        "total_revenue": sales["summary"]["total_revenue"],
+        "total_tax": tax["summary"]["total_tax_collected"],
+        "payment_methods": {m["method"]: m["amount"] for m in sales["payment_methods"]},
+        "tax_by_rate": {r["tax_rate"]: [r["taxable_amount"], r["tax_amount"]] for r in tax["by_tax_rate"]},
+    }
+
+
+def measure(fn, db, start, end):
+    db.expunge_all()
+    tracemalloc.start()
+    began = time.perf_counter()
+    result = fn(db, start, end)
+    elapsed = (time.perf_counter() - began) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def close(a, b):
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=0.01)
+
+
+def run(count=100000):
+    db = SessionLocal()
+    try:
+        end = datetime.now().replace(microsecond=0)
+        start = end - timedelta(days=30)
+        print(f"Seeding {count} sales ({db.bind.dialect.name})...")
+        seed(db, count, start - timedelta(hours=12))
+        start += timedelta(hours=6)  # Partial first day, as in a real request
+
+        old, old_ms, old_mb = measure(old_report, db, start, end)
+        new, new_ms, new_mb = measure(new_report, db, start, end)
+        print(f"old: {old_ms:9.1f} ms  peak {old_mb:8.1f} MB")
+        print(f"new: {new_ms:9.1f} ms  peak {new_mb:8.1f} MB")
+
+        mismatches = [
+            key for key in ("total_sales", "total_revenue", "total_tax") if not close(old[key], new[key])
+        ]
+        if set(old["payment_methods"]) != set(new["payment_methods"]) or not all(
+            close(old["payment_methods"][m], new["payment_methods"][m]) for m in old["payment_methods"]
+        ):
+            mismatches.append("payment_methods")
+        if set(old["tax_by_rate"]) != set(new["tax_by_rate"]) or not all(
+            close(old["tax_by_rate"][r][i], new["tax_by_rate"][r][i]) for r in old["tax_by_rate"] for i in (0, 1)
+        ):
+            mismatches.append("tax_by_rate")
+        print("results match" if not mismatches else f"MISMATCH: {', '.join(mismatches)}")
+        return not mismatches
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    ok = run(*[int(arg) for arg in sys.argv[1:2]])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,138 @@
+"""Check that the planner uses the indexes designed for the hot queries
+
+Seeds synthetic products, sales and stock adjustments inside a
+transaction, runs EXPLAIN on each query and checks the plan uses its
+index. Everything is rolled back, so it is safe to point at a real
+database (after applying database/migrations/003_query_pattern_indexes.sql):
+
+    python check_query_plans.py [sale_count]
+
+Exits non-zero if an index is missing or not used.
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, desc, inspect, text
+from app.database.session import SessionLocal
+from app.models.product import Product
+from app.models.sale import Sale, SaleItem, PaymentMethod
+from app.models.stock_adjustment import StockAdjustment
+from app.models.user import User
+
+PRODUCT_COUNT = 2000
+
+
+def seed(db, count):
+    user = db.query(User).first()
+    if user is None:
+        raise SystemExit("Create a user first (python create_admin.py)")
+    tag = time.time_ns()
+
+    # Most products are well stocked; about 2% are at or below their minimum
+    product_ids = db.scalars(Product.__table__.insert().returning(Product.id, sort_by_parameter_order=True), [
+        {
+            "barcode": f"PLAN-{tag}-{i:05d}", "name": f"Plan product {i}", "category": f"Plan {i % 20}",
+            "cost_price": 5.0, "selling_price": 10.0, "is_active": 1, "minimum_stock": 5,
+            "current_stock": random.randint(0, 5) if i % 50 == 0 else random.randint(20, 500),
+        }
+        for i in range(PRODUCT_COUNT)
+    ]).all()
+
+    start = datetime.now() - timedelta(days=730)
+    seconds = 730 * 24 * 3600
+    for offset in range(0, count, 5000):
+        sales = [
+            {
+                "invoice_number": f"PLAN-{tag}-{i:08d}", "user_id": user.id,
+                "subtotal": 100.0, "discount_amount": 0.0, "tax_amount": 5.0, "total_amount": 105.0,
+                "payment_method": random.choice(list(PaymentMethod)),
+                "sale_date": start + timedelta(seconds=random.randint(0, seconds)),
+            }
+            for i in range(offset, min(offset + 5000, count))
+        ]
+        sale_ids = db.scalars(Sale.__table__.insert().returning(Sale.id, sort_by_parameter_order=True), sales).all()
+        db.execute(SaleItem.__table__.insert(), [
+            {
+                "sale_id": sale_id, "product_id": random.choice(product_ids), "product_name": "Plan product",
+                "barcode": "PLAN", "quantity": 1, "unit_price": 50.0, "line_total": 52.5, "unit_cost": 5.0,
+            }
+            for sale_id in sale_ids for _ in range(2)
+        ])
+        db.execute(StockAdjustment.__table__.insert(), [
+            {
+                "product_id": random.choice(product_ids), "user_id": user.id, "adjustment_type": "CORRECTION",
+                "quantity_change": 1, "previous_stock": 0, "new_stock": 1, "created_at": sale["sale_date"],
+            }
+            for sale in sales
+        ])
+
+    if db.bind.dialect.name == "postgresql":
+        for table in ("products", "sales", "sale_items", "stock_adjustments"):
+            db.execute(text(f"ANALYZE {table}"))
+    return product_ids, sale_ids[-1]
+
+
+def checks(product_ids, sale_id):
+    """(index, description, statement) for the queries each index was designed for"""
+    product_id = product_ids[len(product_ids) // 2]
+    day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    return [
+        ("ix_sales_sale_date", "sales summary for a partial day (sales_rollup.summarize_sales)",
+         select(Sale.user_id, Sale.payment_method, func.count(Sale.id), func.sum(Sale.total_amount), func.sum(Sale.tax_amount))
+         .where(Sale.sale_date >= day_start, Sale.sale_date < day_start + timedelta(hours=6))
+         .group_by(Sale.user_id, Sale.payment_method)),
+        ("idx_sale_items_sale", "a sale's items (sale detail, receipts)",
+         select(SaleItem).where(SaleItem.sale_id == sale_id)),
+        ("ix_sale_items_product_sale", "one product's sales in a period",
+         select(func.sum(SaleItem.quantity), func.sum(SaleItem.line_total))
+         .join(Sale, SaleItem.sale_id == Sale.id)
+         .where(SaleItem.product_id == product_id, Sale.sale_date >= day_start - timedelta(days=90))),
+        ("ix_products_low_stock", "low stock alerts (inventory/low-stock-alerts)",
+         select(Product).where(Product.is_active == 1, Product.current_stock <= Product.minimum_stock)
+         .order_by(Product.current_stock)),
+        ("ix_stock_adjustments_product_created", "a product's adjustment history (inventory/adjustments)",
+         select(StockAdjustment).where(StockAdjustment.product_id == product_id)
+         .order_by(desc(StockAdjustment.created_at)).limit(50)),
+    ]
+
+
+def explain(db, stmt):
+    sql = str(stmt.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}))
+    if db.bind.dialect.name == "postgresql":
+        return [row[0] for row in db.execute(text("EXPLAIN " + sql))]
+    return [row[3] for row in db.execute(text("EXPLAIN QUERY PLAN " + sql))]
+
+
+def run(count=50000):
+    db = SessionLocal()
+    try:
+        existing = set()
+        inspector = inspect(db.connection())
+        for table in ("sales", "sale_items", "products", "stock_adjustments"):
+            existing.update(index["name"] for index in inspector.get_indexes(table))
+
+        print(f"Seeding {count} sales ({db.bind.dialect.name})...")
+        product_ids, sale_id = seed(db, count)
+
+        failures = 0
+        for index, description, stmt in checks(product_ids, sale_id):
+            if index not in existing:
+                print(f"MISSING  {index}: apply database/migrations/003_query_pattern_indexes.sql")
+                failures += 1
+                continue
+            plan = explain(db, stmt)
+            used = any(index in line for line in plan)
+            if not used:
+                failures += 1
+            print(f"{'ok' if used else 'NOT USED':8} {index}: {description}")
+            print("         " + "\n         ".join(line.strip() for line in plan[:4]))
+        return failures == 0
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    ok = run(*[int(arg) for arg in sys.argv[1:2]])
+    sys.exit(0 if ok else 1)
@@ -60,6 +60,17 @@ CREATE INDEX idx_products_barcode ON products(barcode);
 CREATE INDEX idx_products_category ON products(category);
 CREATE INDEX idx_products_name ON products(name);
 
+-- Product search indexes (substring, fuzzy and barcode prefix matching)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX ix_products_name_trgm ON products USING gin (name gin_trgm_ops);
+CREATE INDEX ix_products_barcode_trgm ON products USING gin (barcode gin_trgm_ops);
+CREATE INDEX ix_products_description_trgm ON products USING gin (description gin_trgm_ops);
+CREATE INDEX ix_products_barcode_pattern ON products (barcode varchar_pattern_ops);
+
+-- Low stock alerts (partial: only active products at or below their minimum)
+CREATE INDEX ix_products_low_stock ON products(current_stock)
+    WHERE is_active = 1 AND current_stock <= minimum_stock;
+
 -- Create Customers table
 CREATE TABLE IF NOT EXISTS customers (
     id SERIAL PRIMARY KEY,
@@ -84,6 +95,7 @@ CREATE TABLE IF NOT EXISTS sales (
     invoice_number VARCHAR(50) UNIQUE NOT NULL,
     user_id INTEGER REFERENCES users(id) NOT NULL,
     customer_id INTEGER REFERENCES customers(id),
+    store_id INTEGER, -- stores(id); the stores table is created by the application
     subtotal DECIMAL(10, 2) NOT NULL,
     discount_amount DECIMAL(10, 2) DEFAULT 0.0,
     tax_amount DECIMAL(10, 2) DEFAULT 0.0,
@@ -96,7 +108,8 @@ CREATE TABLE IF NOT EXISTS sales (
 );
 
 CREATE INDEX idx_sales_invoice ON sales(invoice_number);
-CREATE INDEX idx_sales_date ON sales(sale_date);
+CREATE INDEX ix_sales_sale_date ON sales(sale_date)
+    INCLUDE (user_id, payment_method, subtotal, discount_amount, tax_amount, total_amount);
 CREATE INDEX idx_sales_user ON sales(user_id);
 
 -- Create Sale Items table
@@ -111,17 +124,19 @@ CREATE TABLE IF NOT EXISTS sale_items (
     discount DECIMAL(10, 2) DEFAULT 0.0,
     tax_rate DECIMAL(5, 2) DEFAULT 0.0,
     tax_amount DECIMAL(10, 2) DEFAULT 0.0,
-    line_total DECIMAL(10, 2) NOT NULL
+    line_total DECIMAL(10, 2) NOT NULL,
+    unit_cost DECIMAL(10, 2)
 );
 
 CREATE INDEX idx_sale_items_sale ON sale_items(sale_id);
-CREATE INDEX idx_sale_items_product ON sale_items(product_id);
+CREATE INDEX ix_sale_items_product_sale ON sale_items(product_id, sale_id);
 
 -- Create Purchases table
 CREATE TABLE IF NOT EXISTS purchases (
     id SERIAL PRIMARY KEY,
     purchase_order_number VARCHAR(50) UNIQUE NOT NULL,
     supplier_id INTEGER REFERENCES suppliers(id) NOT NULL,
+    store_id INTEGER, -- receiving store, stores(id)
     total_amount DECIMAL(10, 2) NOT NULL,
     payment_status VARCHAR(20) DEFAULT 'pending',
     purchase_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
@@ -0,0 +1,16 @@
+-- Product search indexes for existing PostgreSQL databases.
+-- Fresh databases get these from init.sql / the Product model.
+-- Run outside a transaction block (CONCURRENTLY):
+--   psql "$DATABASE_URL" -f database/migrations/001_product_search_indexes.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- ILIKE '%term%' and similarity (%) lookups
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_barcode_trgm ON products USING gin (barcode gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_description_trgm ON products USING gin (description gin_trgm_ops);
+
+-- barcode LIKE 'prefix%' (independent of the database collation)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_barcode_pattern ON products (barcode varchar_pattern_ops);
+
+ANALYZE products;
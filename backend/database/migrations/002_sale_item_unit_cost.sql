@@ -0,0 +1,13 @@
+-- Cost price snapshot on sale items, for existing PostgreSQL databases.
+-- Fresh databases get the column from init.sql / the SaleItem model.
+--   psql "$DATABASE_URL" -f database/migrations/002_sale_item_unit_cost.sql
+-- Then run `python rebuild_sales_rollup.py` to fill daily_product_sales.
+
+ALTER TABLE sale_items ADD COLUMN IF NOT EXISTS unit_cost DECIMAL(10, 2);
+
+-- Historical cost prices were never recorded; use the current ones
+UPDATE sale_items
+SET unit_cost = products.cost_price
+FROM products
+WHERE sale_items.product_id = products.id
+  AND sale_items.unit_cost IS NULL;
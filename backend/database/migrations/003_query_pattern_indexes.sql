@@ -0,0 +1,33 @@
+-- Composite, covering and partial indexes for the hot query paths, for
+-- existing PostgreSQL databases. Fresh databases get these from init.sql /
+-- the models. Run outside a transaction block (CONCURRENTLY):
+--   psql "$DATABASE_URL" -f database/migrations/003_query_pattern_indexes.sql
+-- Then check the planner picks them up: python check_query_plans.py
+
+-- Sales by date range; the included columns make sales summaries index-only.
+-- Replaces the plain sale_date index (idx_sales_date from init.sql or
+-- ix_sales_sale_date from the model).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_sale_date_covering ON sales (sale_date)
+    INCLUDE (user_id, payment_method, subtotal, discount_amount, tax_amount, total_amount);
+DROP INDEX CONCURRENTLY IF EXISTS idx_sales_date;
+DROP INDEX CONCURRENTLY IF EXISTS ix_sales_sale_date;
+ALTER INDEX ix_sales_sale_date_covering RENAME TO ix_sales_sale_date;
+
+-- A sale's items, and per-product sales joined to sales. The composite
+-- index also serves product_id lookups, so the single-column one goes.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sale_items_sale ON sale_items (sale_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sale_items_product_sale ON sale_items (product_id, sale_id);
+DROP INDEX CONCURRENTLY IF EXISTS idx_sale_items_product;
+
+-- Low stock alerts: only active products at or below their minimum
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_low_stock ON products (current_stock)
+    WHERE is_active = 1 AND current_stock <= minimum_stock;
+
+-- A product's stock adjustment history, newest first
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_stock_adjustments_product_created
+    ON stock_adjustments (product_id, created_at);
+
+ANALYZE sales;
+ANALYZE sale_items;
+ANALYZE products;
+ANALYZE stock_adjustments;
@@ -0,0 +1,9 @@
+-- Store-aware stock for existing PostgreSQL databases. The store_inventory
+-- table itself is created by the application on startup. Existing stock is
+-- not assigned to a store: it stays unallocated (current_stock minus the
+-- stores' on_hand), and a transfer out of a store that holds none of a
+-- product sends from it, so no backfill is needed.
+--   psql "$DATABASE_URL" -f database/migrations/004_store_inventory.sql
+
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS store_id INTEGER REFERENCES stores(id);
+ALTER TABLE purchases ADD COLUMN IF NOT EXISTS store_id INTEGER REFERENCES stores(id);
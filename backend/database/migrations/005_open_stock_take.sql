@@ -0,0 +1,8 @@
+-- At most one open stock take, for existing PostgreSQL databases. Fresh
+-- databases get this from the StockTake model. Close or cancel any extra
+-- open stock takes first, or the index cannot be built:
+--   SELECT id FROM stock_takes WHERE status = 'open';
+--   psql "$DATABASE_URL" -f database/migrations/005_open_stock_take.sql
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_stock_takes_open ON stock_takes (status)
+    WHERE status = 'open';
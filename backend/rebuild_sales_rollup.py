@@ -0,0 +1,47 @@
+"""Backfill or rebuild the daily_sales_rollup and daily_product_sales tables from the sales tables
+
+Sale items recorded before unit_cost existed get the product's current
+cost price first. Add the column with
+database/migrations/002_sale_item_unit_cost.sql before running this.
+
+    python rebuild_sales_rollup.py                          # all days
+    python rebuild_sales_rollup.py 2025-01-01 2025-01-31    # inclusive day range
+"""
+import sys
+from datetime import date
+from sqlalchemy import inspect, select, update
+from app.database.session import SessionLocal, engine
+from app.models.daily_sales_rollup import DailySalesRollup, DailyProductSales
+from app.models.product import Product
+from app.models.sale import SaleItem
+from app.core.sales_rollup import rebuild_rollup
+
+def backfill_unit_costs(db):
+    cost_price = select(Product.cost_price).where(Product.id == SaleItem.product_id).scalar_subquery()
+    return db.execute(
+        update(SaleItem).where(SaleItem.unit_cost.is_(None)).values(unit_cost=cost_price)
+    ).rowcount
+
+def rebuild(start_day=None, end_day=None):
+    if "unit_cost" not in {column["name"] for column in inspect(engine).get_columns("sale_items")}:
+        print("Error: sale_items.unit_cost is missing; run database/migrations/002_sale_item_unit_cost.sql first")
+        return
+    DailySalesRollup.__table__.create(bind=engine, checkfirst=True)
+    DailyProductSales.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        costs = backfill_unit_costs(db)
+        if costs:
+            print(f"✓ Backfilled unit_cost on {costs} sale items")
+        rows = rebuild_rollup(db, start_day, end_day)
+        db.commit()
+        print(f"✓ Rebuilt daily sales rollup ({rows} rows)")
+    except Exception as e:
+        print(f"Error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    days = [date.fromisoformat(arg) for arg in sys.argv[1:3]]
+    rebuild(*days)
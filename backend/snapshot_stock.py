@@ -0,0 +1,31 @@
+"""Take the nightly stock snapshot used by GET /inventory/stock-as-of
+
+Run shortly after midnight UTC (e.g. from cron). The first run also marks
+the start of the queryable stock history.
+
+    python snapshot_stock.py                        # as of the last midnight UTC
+    python snapshot_stock.py 2025-01-31T00:00:00    # a specific time
+"""
+import sys
+from datetime import datetime
+from app.database.session import SessionLocal, engine
+from app.models.stock_ledger import StockMovement, StockSnapshot
+from app.core.stock_ledger import take_snapshot
+
+def snapshot(at=None):
+    StockMovement.__table__.create(bind=engine, checkfirst=True)
+    StockSnapshot.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        rows = take_snapshot(db, at)
+        db.commit()
+        print(f"✓ Stock snapshot taken ({rows} products)")
+    except Exception as e:
+        print(f"Error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    times = [datetime.fromisoformat(arg) for arg in sys.argv[1:2]]
+    snapshot(*times)